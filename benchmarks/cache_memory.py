@@ -0,0 +1,107 @@
+"""Bytes per cached member and channel, full models vs cache records.
+
+Run with ``python benchmarks/cache_memory.py`` after ``pip install -e .``.
+Members have 0-5 roles and channels have 0-3 permission overwrites. For
+members, the records row includes the `User` the cache keeps next to each
+member, and the ``record only`` row is what every extra guild a user is in
+costs.
+"""
+import random
+import tracemalloc
+import typing
+
+from bloom.ll.cache.records import ChannelRecord, MemberRecord
+from bloom.ll.models.channel import Channel
+from bloom.ll.models.guild import GuildMember
+from bloom.ll.shard import gateway_converter
+
+COUNT = 50_000
+BASE_ID = 800_000_000_000_000_000
+
+converter = gateway_converter()
+rng = random.Random(0)
+
+
+def member_payload(i: int) -> typing.Dict[str, typing.Any]:
+    return {
+        'roles': [str(BASE_ID + rng.randrange(100)) for _ in range(rng.randrange(6))],
+        'joined_at': '2021-06-01T12:34:56.789000+00:00',
+        'deaf': False,
+        'mute': False,
+        'nick': f'nick {i}' if i % 4 == 0 else None,
+        'user': {
+            'id': str(BASE_ID + i),
+            'username': f'user {i}',
+            'discriminator': f'{i % 10000:04}',
+            'avatar': f'{i:032x}',
+        },
+    }
+
+
+def channel_payload(i: int) -> typing.Dict[str, typing.Any]:
+    return {
+        'id': str(BASE_ID + i),
+        'type': 0,
+        'guild_id': str(BASE_ID),
+        'position': i,
+        'name': f'channel-{i}',
+        'topic': None,
+        'nsfw': False,
+        'parent_id': str(BASE_ID + 1),
+        'permission_overwrites': [
+            {'id': str(BASE_ID + j), 'type': 0, 'allow': '1024', 'deny': '2048'}
+            for j in range(rng.randrange(4))
+        ],
+    }
+
+
+def measure(make: typing.Callable[[int], object]) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    kept = {BASE_ID + i: make(i) for i in range(COUNT)}
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+
+    return (after - before) / COUNT
+
+
+def full_member(i: int) -> object:
+    return converter.structure(member_payload(i), GuildMember)
+
+
+def member_record(i: int) -> object:
+    member = converter.structure(member_payload(i), GuildMember)
+    return MemberRecord.from_model(BASE_ID + i, member)
+
+
+def member_record_and_user(i: int) -> object:
+    member = converter.structure(member_payload(i), GuildMember)
+    return MemberRecord.from_model(BASE_ID + i, member), member.user
+
+
+def full_channel(i: int) -> object:
+    return converter.structure(channel_payload(i), Channel)
+
+
+def channel_record(i: int) -> object:
+    return ChannelRecord.from_model(converter.structure(channel_payload(i), Channel))
+
+
+def main() -> None:
+    rows = [
+        ('member (GuildMember)', full_member),
+        ('member (record + User)', member_record_and_user),
+        ('member (record only)', member_record),
+        ('channel (Channel)', full_channel),
+        ('channel (record)', channel_record),
+    ]
+
+    for name, make in rows:
+        print(f'{name:<24} {measure(make):>7.0f} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Snapshot size, write time and restore time for a million cached members.
+
+Run with ``python benchmarks/cache_snapshot.py`` after ``pip install -e .``.
+There are 100 guilds with 10k members each, and 600k distinct users. For
+comparison, the last row is structuring and caching the same number of
+members from gateway payloads, which is what refilling the cache from
+GUILD_CREATEs costs before any network time (extrapolated from 20k
+members).
+"""
+import datetime
+import os
+import random
+import tempfile
+import time
+import typing
+
+from bloom.ll.cache.snapshot import Snapshot, write
+from bloom.ll.cache.state import Cache
+from bloom.ll.models.base import Snowflake
+from bloom.ll.models.gateway import GuildMembersChunkEvent
+from bloom.ll.models.guild import GuildMember
+from bloom.ll.models.user import User
+from bloom.ll.shard import gateway_converter
+
+GUILDS = 100
+PER_GUILD = 10_000
+USERS = 600_000
+BASE_ID = 800_000_000_000_000_000
+
+rng = random.Random(0)
+joined_at = datetime.datetime(2021, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def user(i: int) -> User:
+    return User(
+        id=Snowflake(BASE_ID + i),
+        username=f'user {i}',
+        discriminator=f'{i % 10000:04}',
+        avatar=f'{i:032x}',
+    )
+
+
+def fill(cache: Cache) -> None:
+    users = [user(i) for i in range(USERS)]
+    for guild in range(GUILDS):
+        members = [
+            GuildMember(
+                roles=[Snowflake(BASE_ID + rng.randrange(100)) for _ in range(rng.randrange(6))],
+                joined_at=joined_at,
+                deaf=False,
+                mute=False,
+                user=user,
+                nick=f'nick {guild}' if rng.random() < 0.2 else None,
+            )
+            for user in rng.sample(users, PER_GUILD)
+        ]
+        cache.apply(
+            GuildMembersChunkEvent(
+                guild_id=Snowflake(guild), members=members, chunk_index=0, chunk_count=1
+            )
+        )
+
+
+def payload(i: int) -> typing.Dict[str, typing.Any]:
+    return {
+        'roles': [str(BASE_ID + rng.randrange(100)) for _ in range(rng.randrange(6))],
+        'joined_at': '2021-06-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'user': {
+            'id': str(BASE_ID + i),
+            'username': f'user {i}',
+            'discriminator': f'{i % 10000:04}',
+            'avatar': f'{i:032x}',
+        },
+    }
+
+
+def main() -> None:
+    cache = Cache()
+    fill(cache)
+    members = sum(len(cache.members(guild)) for guild in range(GUILDS))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache')
+
+        start = time.perf_counter()
+        write(cache, path)
+        print(f'write            {time.perf_counter() - start:>6.2f} s')
+        size = os.path.getsize(path)
+        print(f'size             {size / 2**20:>6.1f} MiB ({size / members:.0f} bytes/member)')
+
+        start = time.perf_counter()
+        with Snapshot.open(path) as snapshot:
+            opened = time.perf_counter() - start
+            lookups = [(rng.randrange(GUILDS), rng.randrange(USERS)) for _ in range(100_000)]
+            start = time.perf_counter()
+            for guild_id, user_id in lookups:
+                snapshot.member(guild_id, BASE_ID + user_id)
+            lookup = (time.perf_counter() - start) / len(lookups)
+
+            restored = Cache()
+            start = time.perf_counter()
+            snapshot.restore(restored)
+            restore = time.perf_counter() - start
+
+        print(f'open             {opened * 1e3:>6.2f} ms')
+        print(f'lazy lookup      {lookup * 1e6:>6.2f} us')
+        print(f'restore          {restore:>6.2f} s')
+
+    converter = gateway_converter()
+    payloads = [payload(i) for i in range(20_000)]
+    chunk = {
+        'guild_id': '1',
+        'members': payloads,
+        'chunk_index': 0,
+        'chunk_count': 1,
+    }
+    start = time.perf_counter()
+    Cache().apply(converter.structure(chunk, GuildMembersChunkEvent))
+    elapsed = (time.perf_counter() - start) / len(payloads) * members
+    print(f'from payloads    {elapsed:>6.2f} s')
+
+
+if __name__ == '__main__':
+    main()
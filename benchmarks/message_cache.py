@@ -0,0 +1,106 @@
+"""Steady-state memory and per-event cost of the message cache.
+
+Run with ``python benchmarks/message_cache.py`` after ``pip install -e .``.
+Messages go to 500 channels with a skewed distribution (a few busy channels,
+many quiet ones), 10% of events are edits and 3% are deletes of recent
+messages, like a moderately large bot sees. The cache is filled past its
+limits first, so the numbers are for a full cache that is evicting.
+"""
+import random
+import time
+import tracemalloc
+import typing
+
+from bloom.ll.cache.messages import MessageCache
+from bloom.ll.models.base import Snowflake
+from bloom.ll.models.gateway import MessageCreateEvent, MessageDeleteEvent, MessageUpdateEvent
+from bloom.ll.shard import gateway_converter
+
+EVENTS = 200_000
+CHANNELS = 500
+BASE_ID = 800_000_000_000_000_000
+
+converter = gateway_converter()
+rng = random.Random(0)
+
+
+def message_payload(id: int, channel_id: int) -> typing.Dict[str, typing.Any]:
+    author = rng.randrange(2000)
+    words = ' '.join(
+        rng.choice(['hello', 'bloom', 'trio', 'gateway', 'cache', 'ok'])
+        for _ in range(rng.randrange(1, 30))
+    )
+    return {
+        'id': str(id),
+        'channel_id': str(BASE_ID + channel_id),
+        'guild_id': str(BASE_ID),
+        'author': {
+            'id': str(BASE_ID + author),
+            'username': f'user {author}',
+            'discriminator': f'{author:04}',
+            'avatar': None,
+        },
+        'content': words,
+        'timestamp': '2021-06-01T12:34:56.789000+00:00',
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+    }
+
+
+def events() -> typing.List[object]:
+    made: typing.List[object] = []
+    recent: typing.List[typing.Tuple[Snowflake, Snowflake]] = []
+
+    for i in range(EVENTS):
+        roll = rng.random()
+        if recent and roll < 0.13:
+            id, channel_id = rng.choice(recent[-1000:])
+            if roll < 0.10:
+                made.append(MessageUpdateEvent(id=id, channel_id=channel_id, content='edited'))
+            else:
+                made.append(MessageDeleteEvent(id=id, channel_id=channel_id))
+        else:
+            channel = min(int(rng.paretovariate(1.2)) - 1, CHANNELS - 1)
+            payload = message_payload(BASE_ID + (i << 22), channel)
+            made.append(converter.structure(payload, MessageCreateEvent))
+            recent.append((Snowflake(payload['id']), Snowflake(payload['channel_id'])))
+
+    return made
+
+
+def main() -> None:
+    stream = events()
+
+    for max_messages in [10_000, 100_000]:
+        cache = MessageCache(per_channel=1000, max_messages=max_messages)
+        start = time.perf_counter()
+        for event in stream:
+            cache.apply(event)
+        elapsed = time.perf_counter() - start
+
+        traced = MessageCache(per_channel=1000, max_messages=max_messages)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for event in stream:
+            traced.apply(event)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(
+            f'max_messages={max_messages:<7} {len(cache):>7} kept'
+            f' {(after - before) / len(cache):>5.0f} bytes/message'
+            f' {elapsed / len(stream) * 1e6:>5.2f} us/event'
+            f' (hits {cache.stats.hits}, misses {cache.stats.misses},'
+            f' evictions {cache.stats.evictions})'
+        )
+
+
+if __name__ == '__main__':
+    main()
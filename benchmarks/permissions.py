@@ -0,0 +1,129 @@
+"""Permission checks per second, memoized and not.
+
+Run with ``python benchmarks/permissions.py`` after ``pip install -e .``.
+The guild has 100 roles, 200 channels with 0-10 overwrites each and 20k
+members with 0-5 roles each. "cold" forgets every result before each round
+of checks, "warm" is the memoized steady state.
+"""
+import random
+import time
+import typing
+
+from bloom.ll.cache.permissions import PermissionEngine
+from bloom.ll.cache.state import Cache
+from bloom.ll.models.gateway import GuildCreateEvent
+from bloom.ll.shard import gateway_converter
+
+GUILD_ID = 800_000_000_000_000_000
+ROLES = 100
+CHANNELS = 200
+MEMBERS = 20_000
+CHECKS = 200_000
+
+rng = random.Random(0)
+
+
+def role(id: int) -> typing.Dict[str, typing.Any]:
+    return {
+        'id': str(id),
+        'name': 'role',
+        'color': 0,
+        'hoist': False,
+        'position': id - GUILD_ID,
+        'permissions': str(rng.getrandbits(40) & ~(1 << 3)),
+        'managed': False,
+        'mentionable': False,
+    }
+
+
+def guild_create() -> GuildCreateEvent:
+    role_ids = [GUILD_ID + i for i in range(1, ROLES)]
+    data = {
+        'id': str(GUILD_ID),
+        'name': 'guild',
+        'icon': None,
+        'splash': None,
+        'discovery_splash': None,
+        'owner_id': '1',
+        'afk_channel_id': None,
+        'afk_timeout': 0,
+        'verification_level': 0,
+        'default_message_notifications': 0,
+        'explicit_content_filter': 0,
+        'roles': [role(GUILD_ID)] + [role(id) for id in role_ids],
+        'emojis': [],
+        'features': [],
+        'mfa_level': 0,
+        'application_id': None,
+        'system_channel_id': None,
+        'system_channel_flags': 0,
+        'rules_channel_id': None,
+        'vanity_url_code': None,
+        'description': None,
+        'banner': None,
+        'premium_tier': 0,
+        'preferred_locale': 'en-US',
+        'public_updates_channel_id': None,
+        'nsfw_level': 0,
+        'premium_progress_bar_enabled': False,
+        'channels': [
+            {
+                'id': str(GUILD_ID + 1000 + i),
+                'type': 0,
+                'permission_overwrites': [
+                    {
+                        'id': str(rng.choice([GUILD_ID] + role_ids)),
+                        'type': 0,
+                        'allow': str(rng.getrandbits(40)),
+                        'deny': str(rng.getrandbits(40)),
+                    }
+                    for _ in range(rng.randrange(11))
+                ],
+            }
+            for i in range(CHANNELS)
+        ],
+        'members': [
+            {
+                'roles': [str(id) for id in rng.sample(role_ids, rng.randrange(6))],
+                'joined_at': '2021-01-01T00:00:00+00:00',
+                'deaf': False,
+                'mute': False,
+                'user': {
+                    'id': str(GUILD_ID + 100_000 + i),
+                    'username': 'someone',
+                    'discriminator': '0001',
+                    'avatar': None,
+                },
+            }
+            for i in range(MEMBERS)
+        ],
+    }
+    return gateway_converter().structure(data, GuildCreateEvent)
+
+
+def main() -> None:
+    cache = Cache()
+    engine = PermissionEngine(cache)
+    cache.apply(guild_create())
+
+    # a few busy channels and active members, like commands in a real guild.
+    checks = [
+        (GUILD_ID + 1000 + rng.randrange(20), GUILD_ID + 100_000 + rng.randrange(2000))
+        for _ in range(CHECKS)
+    ]
+    unique = list(set(checks))
+
+    for name, batch, cold in [('cold', unique, True), ('warm', checks, False)]:
+        if cold:
+            engine._memo.clear()
+
+        start = time.perf_counter()
+        for channel_id, user_id in batch:
+            engine.permissions(channel_id, user_id)
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:<5} {len(batch) / elapsed:>10,.0f} checks/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Presence updates per second, counted raw and structured into models.
+
+Run with ``python benchmarks/presences.py`` after ``pip install -e .``.
+There are 50k users in one guild, each with 0-3 activities out of 200
+names. "models" is what the shard does for every PRESENCE_UPDATE when
+something listens for `PresenceUpdateEvent`; "counts" is `PresenceCounts`
+applying the same raw events instead.
+"""
+import json
+import random
+import time
+import tracemalloc
+import typing
+
+from bloom.ll.cache.presences import PresenceCounts
+from bloom.ll.models.gateway import PresenceUpdateEvent
+from bloom.ll.shard import RawEvent, gateway_converter
+
+USERS = 50_000
+UPDATES = 200_000
+BASE_ID = 800_000_000_000_000_000
+
+rng = random.Random(0)
+
+
+def presence(user_id: int) -> typing.Dict[str, typing.Any]:
+    return {
+        'user': {'id': str(user_id)},
+        'guild_id': '1',
+        'status': rng.choice(['online', 'online', 'idle', 'dnd', 'offline']),
+        'activities': [
+            {'name': f'game {rng.randrange(200)}', 'type': 0, 'created_at': 1_600_000_000_000}
+            for _ in range(rng.randrange(4))
+        ],
+        'client_status': {'desktop': 'online'},
+    }
+
+
+def raw(tag: str, data: typing.Dict[str, typing.Any]) -> RawEvent:
+    return RawEvent(tag, 1, 0, json.dumps({'op': 0, 't': tag, 's': 1, 'd': data}))
+
+
+def main() -> None:
+    counts = PresenceCounts()
+    guild = {'id': '1', 'presences': [presence(BASE_ID + i) for i in range(USERS)]}
+    tracemalloc.start()
+    counts.apply(raw('GUILD_CREATE', guild))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'memory  {memory / USERS:>10,.0f} bytes/user')
+
+    events = [
+        raw('PRESENCE_UPDATE', presence(BASE_ID + rng.randrange(USERS))) for _ in range(UPDATES)
+    ]
+    converter = gateway_converter()
+
+    start = time.perf_counter()
+    for event in events:
+        converter.structure(json.loads(event.payload)['d'], PresenceUpdateEvent)
+    elapsed = time.perf_counter() - start
+    print(f'models  {UPDATES / elapsed:>10,.0f} updates/s')
+
+    start = time.perf_counter()
+    for event in events:
+        counts.apply(event)
+    elapsed = time.perf_counter() - start
+    print(f'counts  {UPDATES / elapsed:>10,.0f} updates/s')
+
+
+if __name__ == '__main__':
+    main()
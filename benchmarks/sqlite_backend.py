@@ -0,0 +1,145 @@
+"""Write throughput of the SQLite cache backend under GUILD_CREATE bursts.
+
+Run with ``python benchmarks/sqlite_backend.py`` after ``pip install -e .``.
+A burst is 200 GUILD_CREATEs, each with 1000 members, 50 channels and 20
+roles, like a shard starting up. The rows are the same burst written with
+one transaction per guild and with `BackendWriter`'s batches of up to
+``max_pending`` guilds and entities, and the time a member lookup takes
+afterwards. Only writing to the backend is timed, not applying the events
+to the cache.
+"""
+import os
+import random
+import tempfile
+import time
+import typing
+
+from bloom.ll.cache.backend import BackendWriter
+from bloom.ll.cache.sqlite import SQLiteBackend
+from bloom.ll.cache.state import Cache
+from bloom.ll.models.gateway import GuildCreateEvent
+from bloom.ll.shard import gateway_converter
+
+GUILDS = 200
+MEMBERS = 1000
+CHANNELS = 50
+ROLES = 20
+BASE_ID = 800_000_000_000_000_000
+
+rng = random.Random(0)
+
+
+def guild_create(guild_id: int) -> typing.Dict[str, typing.Any]:
+    role_ids = [guild_id + i for i in range(1, ROLES)]
+    return {
+        'id': str(guild_id),
+        'name': 'guild',
+        'icon': None,
+        'splash': None,
+        'discovery_splash': None,
+        'owner_id': '1',
+        'afk_channel_id': None,
+        'afk_timeout': 0,
+        'verification_level': 0,
+        'default_message_notifications': 0,
+        'explicit_content_filter': 0,
+        'roles': [
+            {
+                'id': str(id),
+                'name': 'role',
+                'color': 0,
+                'hoist': False,
+                'position': id - guild_id,
+                'permissions': '0',
+                'managed': False,
+                'mentionable': False,
+            }
+            for id in [guild_id] + role_ids
+        ],
+        'emojis': [],
+        'features': [],
+        'mfa_level': 0,
+        'application_id': None,
+        'system_channel_id': None,
+        'system_channel_flags': 0,
+        'rules_channel_id': None,
+        'vanity_url_code': None,
+        'description': None,
+        'banner': None,
+        'premium_tier': 0,
+        'preferred_locale': 'en-US',
+        'public_updates_channel_id': None,
+        'nsfw_level': 0,
+        'premium_progress_bar_enabled': False,
+        'member_count': MEMBERS,
+        'channels': [
+            {'id': str(guild_id + 1000 + i), 'type': 0, 'position': i, 'name': 'channel'}
+            for i in range(CHANNELS)
+        ],
+        'members': [
+            {
+                'roles': [str(id) for id in rng.sample(role_ids, rng.randrange(4))],
+                'joined_at': '2021-01-01T00:00:00+00:00',
+                'deaf': False,
+                'mute': False,
+                'user': {
+                    'id': str(BASE_ID + rng.randrange(GUILDS * MEMBERS)),
+                    'username': 'someone',
+                    'discriminator': '0001',
+                    'avatar': None,
+                },
+            }
+            for _ in range(MEMBERS)
+        ],
+    }
+
+
+def burst(events: typing.List[GuildCreateEvent], path: str, *, per_guild: bool) -> float:
+    """Seconds spent writing to the backend."""
+    cache = Cache()
+    backend = SQLiteBackend(path)
+    writer = BackendWriter(cache, backend, max_pending=50)
+    elapsed = 0.0
+
+    for event in events:
+        cache.apply(event)
+        if per_guild or writer.pending >= writer.max_pending:
+            start = time.perf_counter()
+            writer.flush()
+            elapsed += time.perf_counter() - start
+
+    start = time.perf_counter()
+    writer.flush()
+    elapsed += time.perf_counter() - start
+
+    backend.close()
+    return elapsed
+
+
+def main() -> None:
+    converter = gateway_converter()
+    guild_ids = [BASE_ID + i * 10_000 for i in range(GUILDS)]
+    events = [converter.structure(guild_create(id), GuildCreateEvent) for id in guild_ids]
+    entities = GUILDS * (1 + MEMBERS + CHANNELS + ROLES)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, per_guild in [('per guild', True), ('batched', False)]:
+            path = os.path.join(directory, f'{name}.db')
+            elapsed = burst(events, path, per_guild=per_guild)
+            print(f'{name:<10} {elapsed:>6.2f} s  {entities / elapsed:>10,.0f} entities/s')
+
+        backend = SQLiteBackend(path)
+        lookups = [
+            (rng.choice(guild_ids), BASE_ID + rng.randrange(GUILDS * MEMBERS))
+            for _ in range(100_000)
+        ]
+        start = time.perf_counter()
+        for guild_id, user_id in lookups:
+            backend.member(guild_id, user_id)
+        lookup = (time.perf_counter() - start) / len(lookups)
+        print(f'lookup     {lookup * 1e6:>6.2f} us')
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""CPU per event for batched substrate listeners.
+
+Run with ``python benchmarks/substrate_batching.py`` after ``pip install -e .``.
+A batch size of 1 uses a plain `Substrate.register` listener, for comparison.
+The producer does the same work in every run, so differences between rows are
+consumer overhead (channel receives and task wakeups).
+"""
+import time
+import typing
+
+import attr
+import trio
+
+from bloom.ll.substrate import Substrate
+
+EVENTS = 200_000
+
+
+@attr.frozen()
+class Event:
+    value: int
+
+
+async def run(batch_size: int) -> typing.Tuple[float, int]:
+    substrate = Substrate()
+    wakeups = 0
+
+    async def consume_single() -> None:
+        nonlocal wakeups
+        async for _ in substrate.register(Event, 1024):
+            wakeups += 1
+
+    async def consume_batched() -> None:
+        nonlocal wakeups
+        recv = substrate.register_batched(Event, 1024, max_batch=batch_size, max_linger=0.01)
+
+        async for batch in recv:
+            wakeups += 1
+            for _ in batch:
+                pass
+
+    start = time.process_time()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(consume_single if batch_size == 1 else consume_batched)
+        await trio.sleep(0)
+
+        for i in range(EVENTS):
+            await substrate.broadcast(Event(i))
+
+        await substrate.aclose()
+
+    return (time.process_time() - start) / EVENTS, wakeups
+
+
+def main() -> None:
+    print(f'{"batch":>6} {"us/event":>9} {"wakeups":>8}')
+
+    for batch_size in (1, 8, 64, 256):
+        per_event, wakeups = trio.run(run, batch_size)
+        print(f'{batch_size:>6} {per_event * 1e6:>9.2f} {wakeups:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Substrate dispatch cost while short-lived listeners come and go.
+
+Run with ``python benchmarks/substrate_dispatch.py`` after ``pip install -e .``.
+There are 60 event types (about as many as gateway dispatches), half of which
+have a steady listener. With churn, a short-lived listener for a random type
+is registered and unregistered around every broadcast.
+"""
+import random
+import time
+
+import attr
+import trio
+
+from bloom.ll.substrate import Substrate
+
+ROUNDS = 100_000
+
+
+@attr.frozen()
+class Base:
+    value: int
+
+
+TYPES = [attr.frozen()(type(f'Event{i}', (Base,), {})) for i in range(60)]
+
+
+async def run(churn: bool) -> float:
+    substrate = Substrate()
+    rng = random.Random(0)
+
+    for typ in TYPES[::2]:
+        substrate.register(typ, None)
+
+    start = time.process_time()
+
+    for i in range(ROUNDS):
+        typ = rng.choice(TYPES)
+
+        if churn:
+            recv = substrate.register(typ, None)
+            await substrate.broadcast(typ(i))
+            substrate.unregister(typ, recv)
+        else:
+            await substrate.broadcast(typ(i))
+
+    return (time.process_time() - start) / ROUNDS
+
+
+def main() -> None:
+    print(f'steady: {trio.run(run, False) * 1e6:.2f}us per broadcast')
+    print(f'churn:  {trio.run(run, True) * 1e6:.2f}us per register/broadcast/unregister')
+
+
+if __name__ == '__main__':
+    main()
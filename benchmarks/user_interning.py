@@ -0,0 +1,74 @@
+"""Structuring messages from a few chatty users, with and without interning.
+
+Run with ``python benchmarks/user_interning.py`` after ``pip install -e .``.
+Every message is kept, like a message cache would, and the memory column is
+what that costs per message.
+"""
+import time
+import tracemalloc
+import typing
+
+from bloom.ll.cache.users import UserInterner
+from bloom.ll.models.message import Message
+from bloom.ll.shard import gateway_converter
+
+COUNT = 50_000
+AUTHORS = 500
+BASE_ID = 800_000_000_000_000_000
+
+
+def message_payload(i: int) -> typing.Dict[str, typing.Any]:
+    author = i % AUTHORS
+    return {
+        'id': str(BASE_ID + i),
+        'channel_id': str(BASE_ID),
+        'author': {
+            'id': str(BASE_ID + author),
+            'username': f'user {author}',
+            'discriminator': f'{author:04}',
+            'avatar': f'{author:032x}',
+            'public_flags': 0,
+        },
+        'content': f'message {i}',
+        'timestamp': '2021-06-01T12:34:56.789000+00:00',
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+    }
+
+
+def measure(interner: typing.Optional[UserInterner]) -> typing.Tuple[float, float]:
+    converter = gateway_converter()
+    if interner is not None:
+        interner.install(converter)
+
+    payloads = [message_payload(i) for i in range(COUNT)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    kept = [converter.structure(payload, Message) for payload in payloads]
+
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+
+    return elapsed / COUNT * 1e6, (after - before) / COUNT
+
+
+def main() -> None:
+    for name, interner in [('plain', None), ('interned', UserInterner())]:
+        us, size = measure(interner)
+        print(f'{name:<10} {us:>6.1f} us/message {size:>6.0f} bytes/message')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""Forward substrate events between processes over a Unix domain socket.
+
+A `BridgePublisher` serves events from its process's substrate, and a
+`BridgeSubscriber` rebroadcasts them into another process's substrate as the
+usual gateway models. Subscribers ask for the event types something in
+their substrate listens for (following registrations as they happen), so
+only those are ever serialized.
+
+A subscriber that falls behind loses events (by default, the oldest ones)
+instead of holding up the publisher's substrate; see `BridgePublisher.stats`.
+
+Every frame is ``>IB`` (payload length, frame kind) followed by the payload:
+
+- ``SUBSCRIBE`` / ``UNSUBSCRIBE``: the gateway tag, e.g. ``MESSAGE_CREATE``
+- ``EVENT``: a byte with the tag's length, the tag, then the event as JSON
+"""
+from __future__ import annotations
+
+import collections
+import json
+import math
+import socket
+import struct
+import typing
+
+import attr
+import trio
+from cattr import Converter
+
+import bloom.ll.shard as shard
+import bloom.ll.substrate as subs
+
+if typing.TYPE_CHECKING:
+    import trio_typing
+
+_HEADER = struct.Struct('>IB')
+_SUBSCRIBE = 0
+_UNSUBSCRIBE = 1
+_EVENT = 2
+
+# tags are prefixed by a byte with their length
+_MAX_TAG = 255
+
+# what reading from or writing to a subscriber that hung up raises
+_DISCONNECTED = (trio.BrokenResourceError, trio.ClosedResourceError, OSError)
+
+
+def _frame(kind: int, payload: bytes) -> bytes:
+    return _HEADER.pack(len(payload), kind) + payload
+
+
+async def _frames(
+    stream: trio.abc.ReceiveStream, max_length: float = math.inf
+) -> typing.AsyncIterator[typing.Tuple[int, bytes]]:
+    buffer = bytearray()
+
+    while True:
+        while len(buffer) >= _HEADER.size:
+            length, kind = _HEADER.unpack_from(buffer)
+            if length > max_length:
+                raise ValueError(f'frame of {length} bytes is too long')
+
+            end = _HEADER.size + length
+            if len(buffer) < end:
+                break
+
+            yield kind, bytes(buffer[_HEADER.size : end])
+            del buffer[:end]
+
+        data = await stream.receive_some()
+        if not data:
+            return
+
+        buffer += data
+
+
+def _check_tags(instance: object, attribute: object, tags: typing.Collection[str]) -> None:
+    unknown = set(tags) - shard.tags_to_model.keys()
+    if unknown:
+        raise ValueError(f'unknown gateway tags: {sorted(unknown)}')
+
+
+@attr.define()
+class BridgePublisher:
+    """Serve events of the types in ``tags`` from ``substrate``."""
+
+    substrate: subs.Substrate
+    tags: typing.Collection[str] = attr.field(validator=_check_tags)
+    converter: Converter = attr.Factory(shard.gateway_converter)
+    #: how many events can be waiting to be written to one subscriber
+    buffer_size: int = 256
+    #: what to do with events for a subscriber whose buffer is full.
+    #: ``Overflow.BLOCK`` lets one stuck subscriber stall the substrate (and
+    #: whatever broadcasts to it, like a shard).
+    overflow: subs.Overflow = subs.Overflow.DROP_OLDEST
+
+    # tag -> the listeners forwarding it, one per subscriber
+    _forwarding: typing.Dict[str, typing.List[trio.abc.ReceiveChannel[typing.Any]]] = attr.Factory(
+        lambda: collections.defaultdict(lambda: [])
+    )
+
+    def stats(self, tag: str) -> typing.List[subs.ListenerStats]:
+        """The stats of every connected subscriber's listener for ``tag``,
+        e.g. how many events were dropped because it fell behind."""
+        typ = shard.tags_to_model[tag]
+        return [self.substrate.stats(typ, recv) for recv in self._forwarding.get(tag, ())]
+
+    async def serve(
+        self, path: str, *, task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        sock = trio.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        await sock.bind(path)
+        sock.listen()
+
+        async with trio.SocketListener(sock) as listener:
+            task_status.started()
+            await trio.serve_listeners(self._handle, [listener])
+
+    async def _forward(
+        self,
+        tag: str,
+        stream: trio.abc.SendStream,
+        lock: trio.Lock,
+        cancel: trio.CancelScope,
+        hang_up: trio.CancelScope,
+    ) -> None:
+        typ = shard.tags_to_model[tag]
+        prefix = bytes([len(tag)]) + tag.encode()
+
+        with cancel:
+            recv: trio.abc.ReceiveChannel[object] = self.substrate.register(
+                typ, self.buffer_size, overflow=self.overflow
+            )
+            self._forwarding[tag].append(recv)
+            try:
+                async for event in recv:
+                    body = json.dumps(self.converter.unstructure(event), separators=(',', ':'))
+                    async with lock:
+                        await stream.send_all(_frame(_EVENT, prefix + body.encode()))
+            except _DISCONNECTED:
+                # the subscriber went away mid-write, which only ends its
+                # connection.
+                hang_up.cancel()
+            finally:
+                self.substrate.unregister(typ, recv)
+                self._forwarding[tag].remove(recv)
+                if not self._forwarding[tag]:
+                    del self._forwarding[tag]
+
+    async def _handle(self, stream: trio.SocketStream) -> None:
+        subscriptions: typing.Dict[str, trio.CancelScope] = {}
+        lock = trio.Lock()
+
+        async with stream, trio.open_nursery() as nursery:
+            try:
+                async for kind, payload in _frames(stream, _MAX_TAG):
+                    tag = payload.decode()
+                    if kind not in (_SUBSCRIBE, _UNSUBSCRIBE) or tag not in shard.tags_to_model:
+                        raise ValueError(f'bad frame: {kind}, {tag!r}')
+
+                    if kind == _SUBSCRIBE and tag in self.tags and tag not in subscriptions:
+                        subscriptions[tag] = trio.CancelScope()
+                        nursery.start_soon(
+                            self._forward,
+                            tag,
+                            stream,
+                            lock,
+                            subscriptions[tag],
+                            nursery.cancel_scope,
+                        )
+                    elif kind == _UNSUBSCRIBE and tag in subscriptions:
+                        subscriptions.pop(tag).cancel()
+            except _DISCONNECTED:
+                pass
+            except ValueError:
+                # garbage (including text that isn't UTF-8) only costs the
+                # subscriber that sent it its connection.
+                pass
+
+            # the subscriber hung up (or is being hung up on).
+            nursery.cancel_scope.cancel()
+
+
+@attr.define()
+class BridgeSubscriber:
+    """Rebroadcast events from a `BridgePublisher` into ``substrate``.
+
+    Whatever event types are listened for in ``substrate`` are subscribed to
+    (and unsubscribed from once nothing listens for them anymore).
+    """
+
+    substrate: subs.Substrate
+    converter: Converter = attr.Factory(shard.gateway_converter)
+
+    # set when the substrate's listened-to types might have changed
+    _changed: trio.Event = attr.Factory(trio.Event)
+
+    def __attrs_post_init__(self) -> None:
+        self.substrate.watchers.append(self._watched)
+
+    def _watched(self, typ: typing.Type[typing.Any]) -> None:
+        self._changed.set()
+
+    async def _sync(self, stream: trio.abc.SendStream, subscribed: typing.Set[str]) -> None:
+        # (un)subscribe until ``subscribed`` is what the substrate wants.
+        self._changed = trio.Event()
+        wanted = {tag for tag, typ in shard.tags_to_model.items() if self.substrate.wants(typ)}
+
+        for tag in sorted(wanted - subscribed):
+            await stream.send_all(_frame(_SUBSCRIBE, tag.encode()))
+        for tag in sorted(subscribed - wanted):
+            await stream.send_all(_frame(_UNSUBSCRIBE, tag.encode()))
+
+        subscribed.clear()
+        subscribed.update(wanted)
+
+    async def _follow(self, stream: trio.abc.SendStream, subscribed: typing.Set[str]) -> None:
+        while True:
+            await self._changed.wait()
+            await self._sync(stream, subscribed)
+
+    async def run(
+        self, path: str, *, task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        """Connect to the publisher at ``path`` and rebroadcast until it goes
+        away."""
+        subscribed: typing.Set[str] = set()
+
+        async with await trio.open_unix_socket(path) as stream, trio.open_nursery() as nursery:
+            await self._sync(stream, subscribed)
+            nursery.start_soon(self._follow, stream, subscribed)
+            task_status.started()
+
+            async for kind, payload in _frames(stream):
+                if kind != _EVENT:
+                    continue
+
+                tag = payload[1 : payload[0] + 1].decode()
+                data = json.loads(payload[payload[0] + 1 :])
+                await self.substrate.broadcast(
+                    self.converter.structure(data, shard.tags_to_model[tag])
+                )
+
+            nursery.cancel_scope.cancel()
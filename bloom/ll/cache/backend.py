@@ -0,0 +1,275 @@
+"""Copy a `Cache` into storage that other processes can read.
+
+A `CacheBackend` stores guilds, channels (and threads), roles, members and
+their users, and is written to with `Changes`. `BackendWriter` follows a
+cache: it notes what each applied event touched, and every so often writes
+the current state of just those entities in one batch, so a burst of
+GUILD_CREATEs is a few large writes instead of one per entity. What's
+written is whatever the cache holds after applying the events, so the
+member policy decides which members are shared (though members it evicts
+stay in the backend until an event about them).
+
+`bloom.ll.cache.sqlite.SQLiteBackend` is the reference backend.
+"""
+from __future__ import annotations
+
+import typing
+
+import attr
+import trio
+
+import bloom.ll.models.gateway as gateway_models
+from bloom.ll.cache.records import ChannelRecord, GuildRecord, MemberRecord, RoleRecord
+from bloom.ll.cache.snapshot import copy_record
+from bloom.ll.cache.state import Cache, CacheRestored, Entities
+from bloom.ll.models.base import UNKNOWN_TYPE
+from bloom.ll.models.user import User
+
+if typing.TYPE_CHECKING:
+    import trio_typing
+
+#: the entities a backend stores
+STORED = Entities.GUILDS | Entities.CHANNELS | Entities.THREADS | Entities.ROLES | Entities.MEMBERS
+
+
+@attr.define()
+class Changes:
+    """A batch of writes. Replacements are applied before everything
+    else."""
+
+    #: guild id -> the kinds of entities to delete from the guild (and then
+    #: write again, from the rest of the batch)
+    replaced: typing.Dict[int, Entities] = attr.Factory(dict)
+    guilds: typing.List[GuildRecord] = attr.Factory(list)
+    channels: typing.List[ChannelRecord] = attr.Factory(list)
+    roles: typing.List[RoleRecord] = attr.Factory(list)
+    #: (guild id, member)
+    members: typing.List[typing.Tuple[int, MemberRecord]] = attr.Factory(list)
+    users: typing.List[User] = attr.Factory(list)
+    #: channel and thread ids
+    deleted_channels: typing.List[int] = attr.Factory(list)
+    deleted_roles: typing.List[int] = attr.Factory(list)
+    #: (guild id, user id)
+    deleted_members: typing.List[typing.Tuple[int, int]] = attr.Factory(list)
+
+    def __bool__(self) -> bool:
+        return any(attr.astuple(self, recurse=False))
+
+    def detached(self) -> Changes:
+        """These changes, with copies of the records (which the cache keeps
+        changing)."""
+        return attr.evolve(
+            self,
+            guilds=[copy_record(guild) for guild in self.guilds],
+            channels=[copy_record(channel) for channel in self.channels],
+            roles=[copy_record(role) for role in self.roles],
+            members=[(guild_id, copy_record(member)) for guild_id, member in self.members],
+        )
+
+
+class CacheBackend(typing.Protocol):
+    """Shared storage for cached entities.
+
+    Users are deleted by the backend once no stored member is that user.
+    """
+
+    def write(self, changes: Changes) -> None: ...
+
+    def guild(self, guild_id: int) -> typing.Optional[GuildRecord]: ...
+
+    def channel(self, channel_id: int) -> typing.Optional[ChannelRecord]: ...
+
+    def channels(self, guild_id: int) -> typing.List[ChannelRecord]:
+        """A guild's channels and threads."""
+        ...
+
+    def children(self, parent_id: int) -> typing.List[ChannelRecord]:
+        """The channels in a category, or the threads in a channel, sorted
+        by position."""
+        ...
+
+    def role(self, role_id: int) -> typing.Optional[RoleRecord]: ...
+
+    def roles(self, guild_id: int) -> typing.List[RoleRecord]: ...
+
+    def member(self, guild_id: int, user_id: int) -> typing.Optional[MemberRecord]: ...
+
+    def members(self, guild_id: int) -> typing.List[MemberRecord]: ...
+
+    def user(self, user_id: int) -> typing.Optional[User]: ...
+
+
+@attr.define()
+class BackendWriter:
+    """Write what a cache's events change to a backend, in batches."""
+
+    cache: Cache
+    backend: CacheBackend
+    #: the most seconds between writes
+    interval: float = 0.5
+    #: write early once this many entities are waiting
+    max_pending: int = 10_000
+
+    # what to write, as of the next write
+    _replaced: typing.Dict[int, Entities] = attr.Factory(dict)
+    _guilds: typing.Set[int] = attr.Factory(set)
+    _channels: typing.Set[int] = attr.Factory(set)
+    _roles: typing.Set[int] = attr.Factory(set)
+    _members: typing.Set[typing.Tuple[int, int]] = attr.Factory(set)
+    _full: trio.Event = attr.Factory(trio.Event)
+
+    def __attrs_post_init__(self) -> None:
+        self.cache.listeners.append(self._applied)
+
+    @property
+    def pending(self) -> int:
+        return (
+            len(self._replaced)
+            + len(self._guilds)
+            + len(self._channels)
+            + len(self._roles)
+            + len(self._members)
+        )
+
+    def changes(self) -> Changes:
+        """What to write to bring the backend up to date, as of now."""
+        cache = self.cache
+        changes = Changes(replaced=self._replaced)
+        users: typing.Dict[int, User] = {}
+
+        def put_member(guild_id: int, member: MemberRecord) -> None:
+            changes.members.append((guild_id, member))
+            user = cache.user(member.user_id)
+            if user is not None:
+                users[member.user_id] = user
+
+        for guild_id, replaced in self._replaced.items():
+            if replaced & Entities.GUILDS:
+                self._guilds.add(guild_id)
+            if replaced & Entities.CHANNELS:
+                changes.channels.extend(cache.channels(guild_id))
+            if replaced & Entities.THREADS:
+                changes.channels.extend(cache.threads(guild_id))
+            if replaced & Entities.ROLES:
+                changes.roles.extend(cache.roles(guild_id))
+            if replaced & Entities.MEMBERS:
+                for member in cache.members(guild_id):
+                    put_member(guild_id, member)
+
+        for guild_id in self._guilds:
+            guild = cache.guild(guild_id)
+            if guild is not None:
+                changes.guilds.append(guild)
+
+        for channel_id in self._channels:
+            channel = cache.channel(channel_id) or cache.thread(channel_id)
+            if channel is None:
+                changes.deleted_channels.append(channel_id)
+            else:
+                changes.channels.append(channel)
+
+        for role_id in self._roles:
+            role = cache.role(role_id)
+            if role is None:
+                changes.deleted_roles.append(role_id)
+            else:
+                changes.roles.append(role)
+
+        for guild_id, user_id in self._members:
+            cached = cache.peek_member(guild_id, user_id)
+            if cached is None:
+                changes.deleted_members.append((guild_id, user_id))
+            else:
+                put_member(guild_id, cached)
+
+        changes.users = list(users.values())
+
+        self._replaced = {}
+        self._guilds.clear()
+        self._channels.clear()
+        self._roles.clear()
+        self._members.clear()
+
+        return changes
+
+    def flush(self) -> None:
+        """Write everything waiting now."""
+        changes = self.changes()
+        if changes:
+            self.backend.write(changes)
+
+    async def run(
+        self, *, task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        """Write every ``interval`` seconds (or sooner, when there's a lot to
+        write) until cancelled. Writes happen in a worker thread, with
+        copies of the records so applying events can go on meanwhile."""
+        task_status.started()
+
+        while True:
+            with trio.move_on_after(self.interval):
+                await self._full.wait()
+            self._full = trio.Event()
+
+            changes = self.changes()
+            if changes:
+                await trio.to_thread.run_sync(self.backend.write, changes.detached())
+
+    def _replace(self, guild_id: int, entities: Entities) -> None:
+        guild_id = int(guild_id)
+        self._replaced[guild_id] = self._replaced.get(guild_id, Entities(0)) | entities
+
+    def _applied(self, event: object) -> None:
+        if isinstance(event, gateway_models.GuildCreateEvent):
+            self._replace(event.id, STORED)
+        elif isinstance(event, gateway_models.GuildDeleteEvent):
+            self._replace(event.id, STORED)
+        elif isinstance(event, gateway_models.GuildUpdateEvent):
+            self._guilds.add(int(event.id))
+            self._replace(event.id, Entities.ROLES)
+        elif isinstance(
+            event,
+            (
+                gateway_models.ChannelCreateEvent,
+                gateway_models.ChannelUpdateEvent,
+                gateway_models.ChannelDeleteEvent,
+                gateway_models.ThreadCreateEvent,
+                gateway_models.ThreadUpdateEvent,
+                gateway_models.ThreadDeleteEvent,
+                gateway_models.ThreadMembersUpdateEvent,
+            ),
+        ):
+            self._channels.add(int(event.id))
+        elif isinstance(event, gateway_models.ThreadListSyncEvent):
+            self._replace(event.guild_id, Entities.THREADS)
+        elif isinstance(
+            event, (gateway_models.GuildRoleCreateEvent, gateway_models.GuildRoleUpdateEvent)
+        ):
+            self._roles.add(int(event.role.id))
+        elif isinstance(event, gateway_models.GuildRoleDeleteEvent):
+            self._roles.add(int(event.role_id))
+        elif isinstance(event, gateway_models.GuildMemberAddEvent):
+            # the member count changed too
+            self._guilds.add(int(event.guild_id))
+            if not isinstance(event.user, UNKNOWN_TYPE):
+                self._members.add((int(event.guild_id), int(event.user.id)))
+        elif isinstance(event, gateway_models.GuildMemberRemoveEvent):
+            self._guilds.add(int(event.guild_id))
+            self._members.add((int(event.guild_id), int(event.user.id)))
+        elif isinstance(event, gateway_models.GuildMemberUpdateEvent):
+            self._members.add((int(event.guild_id), int(event.user.id)))
+        elif isinstance(event, gateway_models.GuildMembersChunkEvent):
+            self._members.update(
+                (int(event.guild_id), int(member.user.id))
+                for member in event.members
+                if not isinstance(member.user, UNKNOWN_TYPE)
+            )
+        elif isinstance(event, gateway_models.VoiceStateUpdateEvent):
+            if not isinstance(event.guild_id, UNKNOWN_TYPE):
+                self._members.add((int(event.guild_id), int(event.user_id)))
+        elif isinstance(event, CacheRestored):
+            for guild_id in event.guild_ids:
+                self._replace(guild_id, STORED)
+
+        if self.pending >= self.max_pending:
+            self._full.set()
@@ -0,0 +1,214 @@
+"""Policies for which guild members a `Cache` keeps.
+
+Caching every member of every guild doesn't work for large bots, so the cache
+asks its `MemberPolicy` before storing a member, tells it about lookups, and
+drops whatever the policy says to evict. The policy also decides what
+`Cache.fetch_member` does when a member isn't cached.
+"""
+from __future__ import annotations
+
+import collections
+import enum
+import sys
+import time
+import typing
+
+import attr
+
+from bloom.ll.cache.records import MemberRecord
+
+# (guild id, user id)
+MemberKey = typing.Tuple[int, int]
+
+
+class OnMiss(enum.Enum):
+    """What `Cache.fetch_member` does for a member that isn't cached."""
+
+    #: nothing; the member is assumed to not exist
+    NOTHING = enum.auto()
+    #: ask the gateway for the member (``REQUEST_GUILD_MEMBERS``)
+    REQUEST_CHUNK = enum.auto()
+    #: ask the REST API for the member
+    REST = enum.auto()
+
+
+@attr.define()
+class MemberCacheStats:
+    #: lookups that found the member
+    hits: int = 0
+    #: lookups that didn't
+    misses: int = 0
+    #: members dropped because of the policy (not because they left)
+    evictions: int = 0
+
+
+@attr.define()
+class MemberPolicy:
+    """Cache every member. Subclasses cache less."""
+
+    on_miss: OnMiss = attr.field(default=OnMiss.NOTHING, kw_only=True)
+
+    def admit(self, guild_id: int, member: MemberRecord) -> bool:
+        """Whether to store (or keep storing) ``member``."""
+        return True
+
+    def stored(self, guild_id: int, member: MemberRecord) -> None:
+        """``member`` was stored, or replaced an older version."""
+
+    def accessed(self, guild_id: int, user_id: int) -> None:
+        """A cached member was looked up."""
+
+    def removed(self, guild_id: int, user_id: int) -> None:
+        """A member was dropped from the cache, for any reason."""
+
+    def voice_state(self, guild_id: int, user_id: int, channel_id: typing.Optional[int]) -> None:
+        """A member joined, moved between or left (``None``) voice
+        channels."""
+
+    def evictions(self) -> typing.List[MemberKey]:
+        """Members to drop right now."""
+        return []
+
+
+@attr.define()
+class NoMembers(MemberPolicy):
+    on_miss: OnMiss = attr.field(default=OnMiss.REST, kw_only=True)
+
+    def admit(self, guild_id: int, member: MemberRecord) -> bool:
+        return False
+
+
+@attr.define()
+class _LRU(MemberPolicy):
+    # least recently used first
+    _order: typing.Dict[MemberKey, float] = attr.field(factory=collections.OrderedDict, init=False)
+
+    def _touch(self, key: MemberKey, now: float) -> None:
+        self._order[key] = now
+        self._order.move_to_end(key)  # type: ignore[attr-defined]
+
+    def removed(self, guild_id: int, user_id: int) -> None:
+        self._order.pop((guild_id, user_id), None)
+
+
+@attr.define()
+class RecentMembers(_LRU):
+    """Cache the members that were most recently stored or looked up.
+
+    At most ``max_members`` are kept, and members that haven't been seen for
+    ``ttl`` seconds are dropped. Either can be ``None`` for no limit.
+    """
+
+    max_members: typing.Optional[int] = None
+    ttl: typing.Optional[float] = None
+    clock: typing.Callable[[], float] = time.monotonic
+    on_miss: OnMiss = attr.field(default=OnMiss.REST, kw_only=True)
+
+    def stored(self, guild_id: int, member: MemberRecord) -> None:
+        self._touch((guild_id, member.user_id), self.clock())
+
+    def accessed(self, guild_id: int, user_id: int) -> None:
+        self._touch((guild_id, user_id), self.clock())
+
+    def evictions(self) -> typing.List[MemberKey]:
+        evicted: typing.List[MemberKey] = []
+        now = self.clock()
+
+        for key, seen in self._order.items():
+            too_many = self.max_members is not None and len(self._order) - len(evicted) > (
+                self.max_members
+            )
+            too_old = self.ttl is not None and now - seen > self.ttl
+
+            if not too_many and not too_old:
+                break
+
+            evicted.append(key)
+
+        return evicted
+
+
+def _member_size(member: MemberRecord) -> int:
+    # roughly; the user is shared between guilds, so it isn't counted.
+    size = sys.getsizeof(member) + sys.getsizeof(member.roles)
+    if member.nick is not None:
+        size += sys.getsizeof(member.nick)
+    return size
+
+
+@attr.define()
+class MemberBudget(_LRU):
+    """Cache members, dropping the least recently used ones to stay under
+    ``max_bytes`` (an estimate, which doesn't include users)."""
+
+    max_bytes: int
+    on_miss: OnMiss = attr.field(default=OnMiss.REST, kw_only=True)
+
+    #: the estimated size of the cached members
+    used: int = attr.field(default=0, init=False)
+    _sizes: typing.Dict[MemberKey, int] = attr.field(factory=dict, init=False)
+
+    def stored(self, guild_id: int, member: MemberRecord) -> None:
+        key = (guild_id, member.user_id)
+        size = _member_size(member)
+
+        self.used += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._touch(key, 0)
+
+    def accessed(self, guild_id: int, user_id: int) -> None:
+        self._touch((guild_id, user_id), 0)
+
+    def removed(self, guild_id: int, user_id: int) -> None:
+        super().removed(guild_id, user_id)
+        self.used -= self._sizes.pop((guild_id, user_id), 0)
+
+    def evictions(self) -> typing.List[MemberKey]:
+        evicted: typing.List[MemberKey] = []
+        over = self.used - self.max_bytes
+
+        for key in self._order:
+            if over <= 0:
+                break
+
+            evicted.append(key)
+            over -= self._sizes[key]
+
+        return evicted
+
+
+@attr.define()
+class VoiceMembers(MemberPolicy):
+    """Cache members while they are in a voice channel."""
+
+    on_miss: OnMiss = attr.field(default=OnMiss.REST, kw_only=True)
+
+    _in_voice: typing.Set[MemberKey] = attr.field(factory=set, init=False)
+    _left: typing.List[MemberKey] = attr.field(factory=list, init=False)
+
+    def admit(self, guild_id: int, member: MemberRecord) -> bool:
+        return (guild_id, member.user_id) in self._in_voice
+
+    def voice_state(self, guild_id: int, user_id: int, channel_id: typing.Optional[int]) -> None:
+        if channel_id is not None:
+            self._in_voice.add((guild_id, user_id))
+        elif (guild_id, user_id) in self._in_voice:
+            self._in_voice.remove((guild_id, user_id))
+            self._left.append((guild_id, user_id))
+
+    def removed(self, guild_id: int, user_id: int) -> None:
+        self._in_voice.discard((guild_id, user_id))
+
+    def evictions(self) -> typing.List[MemberKey]:
+        evicted, self._left = self._left, []
+        return evicted
+
+
+@attr.define()
+class MembersWithRoles(MemberPolicy):
+    """Cache members that have at least one role (besides ``@everyone``)."""
+
+    on_miss: OnMiss = attr.field(default=OnMiss.REST, kw_only=True)
+
+    def admit(self, guild_id: int, member: MemberRecord) -> bool:
+        return len(member.roles) > 0
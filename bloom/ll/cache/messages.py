@@ -0,0 +1,220 @@
+"""A bounded cache of recent messages, for "before" versions of edits and
+deletes.
+
+Every channel keeps its last ``per_channel`` messages in a ring buffer, at
+most ``max_messages`` are kept overall, and messages older than ``max_age``
+seconds are dropped. Whenever a cached message is edited or deleted, the
+cache broadcasts a `CachedMessageUpdate`, `CachedMessageDelete` or
+`CachedMessageDeleteBulk` with the previous version.
+"""
+from __future__ import annotations
+
+import collections
+import time
+import typing
+
+import attr
+import trio
+
+import bloom.ll.models.gateway as gateway_models
+import bloom.ll.substrate as subs
+from bloom.ll.cache.records import MessageRecord
+
+if typing.TYPE_CHECKING:
+    import trio_typing
+
+# milliseconds since the unix epoch of the first snowflake
+_DISCORD_EPOCH = 1420070400000
+
+
+def _created_at(message_id: int) -> float:
+    return ((message_id >> 22) + _DISCORD_EPOCH) / 1000
+
+
+@attr.frozen(kw_only=True)
+class CachedMessageUpdate:
+    event: gateway_models.MessageUpdateEvent
+    #: the message before this update, if it was cached
+    before: typing.Optional[MessageRecord]
+
+
+@attr.frozen(kw_only=True)
+class CachedMessageDelete:
+    event: gateway_models.MessageDeleteEvent
+    #: the deleted message, if it was cached
+    before: typing.Optional[MessageRecord]
+
+
+@attr.frozen(kw_only=True)
+class CachedMessageDeleteBulk:
+    event: gateway_models.MessageDeleteBulkEvent
+    #: the deleted messages that were cached
+    before: typing.List[MessageRecord]
+
+
+@attr.define()
+class MessageCacheStats:
+    #: lookups (including for updates and deletes) that found the message
+    hits: int = 0
+    #: lookups that didn't
+    misses: int = 0
+    #: messages dropped because of the limits (not because they were deleted)
+    evictions: int = 0
+
+
+@attr.define()
+class MessageCache:
+    #: messages kept per channel
+    per_channel: int = 100
+    #: messages kept overall
+    max_messages: int = 10_000
+    #: seconds after being sent that messages are dropped, if not ``None``
+    max_age: typing.Optional[float] = None
+    clock: typing.Callable[[], float] = time.time
+    stats: MessageCacheStats = attr.Factory(MessageCacheStats)
+
+    # oldest first. messages usually arrive in order, so this is also by age.
+    _messages: typing.OrderedDict[int, MessageRecord] = attr.Factory(collections.OrderedDict)
+    # channel id -> ring of message ids; deleted messages leave their id
+    # behind until it falls off the end.
+    _channels: typing.Dict[int, typing.Deque[int]] = attr.Factory(dict)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def get(self, message_id: int) -> typing.Optional[MessageRecord]:
+        return self._lookup(message_id)
+
+    def channel(self, channel_id: int) -> typing.List[MessageRecord]:
+        """The cached messages in a channel, oldest first."""
+        ring = self._channels.get(channel_id, ())
+        return [self._messages[id] for id in ring if id in self._messages]
+
+    def event_types(self) -> typing.List[typing.Type[typing.Any]]:
+        return list(_HANDLERS)
+
+    def apply(self, event: object) -> typing.Optional[object]:
+        """Update the cache, returning the `CachedMessageUpdate` (etc.) for
+        ``event`` if there is one."""
+        handler = _HANDLERS.get(type(event))
+        if handler is None:
+            return None
+
+        result = handler(self, event)
+        self._expire()
+        return result
+
+    async def run(
+        self,
+        substrate: subs.Substrate,
+        *,
+        buffer_size: typing.Optional[int] = 1024,
+        task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED,
+    ) -> None:
+        """Apply events broadcast to ``substrate`` and broadcast the results
+        until cancelled."""
+        types = self.event_types()
+        recv = substrate.register_many(types, buffer_size)
+
+        try:
+            task_status.started()
+            async for event in recv:
+                result = self.apply(event)
+                if result is not None:
+                    await substrate.broadcast(result)
+        finally:
+            substrate.unregister_many(types, recv)
+
+    def _lookup(self, message_id: int) -> typing.Optional[MessageRecord]:
+        message = self._messages.get(message_id)
+
+        if message is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+
+        return message
+
+    def _create(self, event: gateway_models.MessageCreateEvent) -> None:
+        record = MessageRecord.from_model(event)
+        if record.id in self._messages:
+            self._messages[record.id] = record
+            return
+
+        ring = self._channels.get(record.channel_id)
+        if ring is None:
+            ring = self._channels[record.channel_id] = collections.deque(maxlen=self.per_channel)
+
+        if len(ring) == ring.maxlen and self._messages.pop(ring[0], None) is not None:
+            self.stats.evictions += 1
+
+        ring.append(record.id)
+        self._messages[record.id] = record
+
+        while len(self._messages) > self.max_messages:
+            self._evict_oldest()
+
+    def _update(self, event: gateway_models.MessageUpdateEvent) -> CachedMessageUpdate:
+        before = self._lookup(event.id)
+        if before is not None:
+            self._messages[before.id] = before.updated(event)
+
+        return CachedMessageUpdate(event=event, before=before)
+
+    def _delete(self, event: gateway_models.MessageDeleteEvent) -> CachedMessageDelete:
+        before = self._lookup(event.id)
+        if before is not None:
+            del self._messages[before.id]
+
+        return CachedMessageDelete(event=event, before=before)
+
+    def _delete_bulk(
+        self, event: gateway_models.MessageDeleteBulkEvent
+    ) -> CachedMessageDeleteBulk:
+        before = []
+        for id in event.ids:
+            message = self._lookup(id)
+            if message is not None:
+                del self._messages[message.id]
+                before.append(message)
+
+        return CachedMessageDeleteBulk(event=event, before=before)
+
+    def _channel_delete(
+        self,
+        event: typing.Union[gateway_models.ChannelDeleteEvent, gateway_models.ThreadDeleteEvent],
+    ) -> None:
+        for id in self._channels.pop(event.id, ()):
+            self._messages.pop(id, None)
+
+    def _evict_oldest(self) -> None:
+        id, message = self._messages.popitem(last=False)
+        self.stats.evictions += 1
+
+        # the oldest message is almost always at the start of its ring, so
+        # this is where rings are emptied.
+        ring = self._channels[message.channel_id]
+        while ring and ring[0] not in self._messages:
+            ring.popleft()
+        if not ring:
+            del self._channels[message.channel_id]
+
+    def _expire(self) -> None:
+        if self.max_age is None:
+            return
+
+        cutoff = self.clock() - self.max_age
+        while self._messages and _created_at(next(iter(self._messages))) < cutoff:
+            self._evict_oldest()
+
+
+_HANDLERS: typing.Dict[
+    typing.Type[typing.Any], typing.Callable[[MessageCache, typing.Any], typing.Optional[object]]
+] = {
+    gateway_models.MessageCreateEvent: MessageCache._create,
+    gateway_models.MessageUpdateEvent: MessageCache._update,
+    gateway_models.MessageDeleteEvent: MessageCache._delete,
+    gateway_models.MessageDeleteBulkEvent: MessageCache._delete_bulk,
+    gateway_models.ChannelDeleteEvent: MessageCache._channel_delete,
+    gateway_models.ThreadDeleteEvent: MessageCache._channel_delete,
+}
@@ -0,0 +1,222 @@
+"""Compute members' effective permissions from a `Cache`.
+
+This follows Discord's algorithm: the owner and administrators have every
+permission, everyone else has the permissions of ``@everyone`` and their
+roles, changed by the channel's ``@everyone`` overwrite, then the
+overwrites of their roles, then their own overwrite. Threads use their
+parent channel's overwrites. Timeouts aren't taken into account.
+
+Results are memoized per (guild, member, channel), for up to
+``max_members`` members at once. The engine listens to its cache, and
+events only drop the results they can change.
+"""
+from __future__ import annotations
+
+import typing
+
+import attr
+
+import bloom.ll.models.gateway as gateway_models
+from bloom.ll.cache.records import ChannelRecord
+from bloom.ll.cache.state import Cache, CacheRestored
+from bloom.ll.models.base import UNKNOWN_TYPE
+from bloom.ll.models.permissions import BitwisePermissionFlags
+
+ALL = 0
+for _flag in BitwisePermissionFlags:
+    ALL |= int(_flag)
+
+_ADMINISTRATOR = int(BitwisePermissionFlags.ADMINISTRATOR)
+_ROLE = 0
+
+
+@attr.define()
+class PermissionEngine:
+    cache: Cache
+    #: the most members whose permissions are memoized at once. once there
+    #: would be more, the memo starts over. ``None`` for no limit.
+    max_members: typing.Optional[int] = 100_000
+
+    # guild id -> user id -> channel id (None for the guild) -> permissions
+    _memo: typing.Dict[int, typing.Dict[int, typing.Dict[typing.Optional[int], int]]] = (
+        attr.Factory(dict)
+    )
+    # how many members are in `_memo`
+    _memoized: int = 0
+
+    def __attrs_post_init__(self) -> None:
+        self.cache.listeners.append(self._applied)
+
+    def guild_permissions(self, guild_id: int, user_id: int) -> typing.Optional[int]:
+        """The permissions of a member outside of any channel, or ``None`` if
+        the guild or the member isn't cached."""
+        memo = self._memo.get(guild_id, {}).get(user_id)
+        if memo is not None and None in memo:
+            return memo[None]
+
+        permissions = self._base(guild_id, user_id)
+        if permissions is not None:
+            if memo is None:
+                memo = self._add_member(guild_id, user_id)
+            memo[None] = permissions
+
+        return permissions
+
+    def permissions(self, channel_id: int, user_id: int) -> typing.Optional[int]:
+        """The permissions of a member in a channel or thread, or ``None`` if
+        the channel, its guild or the member isn't cached (or it's a DM)."""
+        channel = self.cache.channel(channel_id) or self._parent(channel_id)
+        if channel is None or channel.guild_id is None:
+            return None
+
+        guild_id = channel.guild_id
+        memo = self._memo.get(guild_id, {}).get(user_id)
+        if memo is not None and channel.id in memo:
+            return memo[channel.id]
+
+        base = self.guild_permissions(guild_id, user_id)
+        if base is None:
+            return None
+
+        permissions = base
+        member = self.cache.peek_member(guild_id, user_id)
+        if base != ALL and member is not None:
+            permissions = _overwritten(base, channel, user_id, member.roles)
+
+        self._memo[guild_id][user_id][channel.id] = permissions
+        return permissions
+
+    def _add_member(self, guild_id: int, user_id: int) -> typing.Dict[typing.Optional[int], int]:
+        if self.max_members is not None and self._memoized >= self.max_members:
+            self._memo.clear()
+            self._memoized = 0
+
+        self._memoized += 1
+        memo: typing.Dict[typing.Optional[int], int] = {}
+        self._memo.setdefault(guild_id, {})[user_id] = memo
+        return memo
+
+    def _forget(self, guild_id: int, user_id: typing.Optional[int] = None) -> None:
+        # a member's results, or a whole guild's
+        if user_id is None:
+            self._memoized -= len(self._memo.pop(guild_id, {}))
+        elif self._memo.get(guild_id, {}).pop(user_id, None) is not None:
+            self._memoized -= 1
+
+    def _applied(self, event: object) -> None:
+        handler = _HANDLERS.get(type(event))
+        if handler is not None:
+            handler(self, event)
+
+    def _parent(self, thread_id: int) -> typing.Optional[ChannelRecord]:
+        thread = self.cache.thread(thread_id)
+        if thread is None or thread.parent_id is None:
+            return None
+        return self.cache.channel(thread.parent_id)
+
+    def _base(self, guild_id: int, user_id: int) -> typing.Optional[int]:
+        guild = self.cache.guild(guild_id)
+        if guild is not None and guild.owner_id == user_id:
+            return ALL
+
+        member = self.cache.peek_member(guild_id, user_id)
+        if guild is None or member is None:
+            return None
+
+        everyone = self.cache.role(guild_id)
+        permissions = 0 if everyone is None else everyone.permissions
+        for role_id in member.roles:
+            role = self.cache.role(role_id)
+            if role is not None:
+                permissions |= role.permissions
+
+        return ALL if permissions & _ADMINISTRATOR else permissions
+
+    def _forget_guild(
+        self,
+        event: typing.Union[
+            gateway_models.GuildCreateEvent,
+            gateway_models.GuildUpdateEvent,
+            gateway_models.GuildDeleteEvent,
+        ],
+    ) -> None:
+        self._forget(event.id)
+
+    def _forget_restored(self, event: CacheRestored) -> None:
+        for guild_id in event.guild_ids:
+            self._forget(guild_id)
+
+    def _forget_member(
+        self,
+        event: typing.Union[
+            gateway_models.GuildMemberUpdateEvent, gateway_models.GuildMemberRemoveEvent
+        ],
+    ) -> None:
+        self._forget(event.guild_id, event.user.id)
+
+    def _forget_channel(
+        self,
+        event: typing.Union[gateway_models.ChannelUpdateEvent, gateway_models.ChannelDeleteEvent],
+    ) -> None:
+        if isinstance(event.guild_id, UNKNOWN_TYPE):
+            return
+
+        for memo in self._memo.get(event.guild_id, {}).values():
+            memo.pop(event.id, None)
+
+    def _forget_role_delete(self, event: gateway_models.GuildRoleDeleteEvent) -> None:
+        # members can't have a new role yet, but they could have had a deleted
+        # one and there won't be member updates for that.
+        self._forget(event.guild_id)
+
+    def _forget_role(self, event: gateway_models.GuildRoleUpdateEvent) -> None:
+        guild_id = int(event.guild_id)
+        if event.role.id == guild_id:
+            # @everyone
+            self._forget(guild_id)
+            return
+
+        for user_id in list(self._memo.get(guild_id, {})):
+            member = self.cache.peek_member(guild_id, user_id)
+            if member is None or event.role.id in member.roles:
+                self._forget(guild_id, user_id)
+
+
+def _overwritten(
+    permissions: int, channel: ChannelRecord, user_id: int, roles: typing.Iterable[int]
+) -> int:
+    everyone_allow = everyone_deny = role_allow = role_deny = member_allow = member_deny = 0
+    roles = set(roles)
+
+    overwrites = channel.overwrites
+    for i in range(0, len(overwrites), 4):
+        id, type, allow, deny = overwrites[i : i + 4]
+
+        if id == channel.guild_id:
+            everyone_allow, everyone_deny = allow, deny
+        elif type == _ROLE:
+            if id in roles:
+                role_allow |= allow
+                role_deny |= deny
+        elif id == user_id:
+            member_allow, member_deny = allow, deny
+
+    permissions = (permissions & ~everyone_deny) | everyone_allow
+    permissions = (permissions & ~role_deny) | role_allow
+    return (permissions & ~member_deny) | member_allow
+
+
+_HANDLERS: typing.Dict[
+    typing.Type[typing.Any], typing.Callable[[PermissionEngine, typing.Any], None]
+] = {
+    gateway_models.GuildCreateEvent: PermissionEngine._forget_guild,
+    gateway_models.GuildUpdateEvent: PermissionEngine._forget_guild,
+    gateway_models.GuildDeleteEvent: PermissionEngine._forget_guild,
+    CacheRestored: PermissionEngine._forget_restored,
+    gateway_models.GuildRoleUpdateEvent: PermissionEngine._forget_role,
+    gateway_models.GuildRoleDeleteEvent: PermissionEngine._forget_role_delete,
+    gateway_models.GuildMemberUpdateEvent: PermissionEngine._forget_member,
+    gateway_models.GuildMemberRemoveEvent: PermissionEngine._forget_member,
+    gateway_models.ChannelUpdateEvent: PermissionEngine._forget_channel,
+    gateway_models.ChannelDeleteEvent: PermissionEngine._forget_channel,
+}
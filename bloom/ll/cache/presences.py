@@ -0,0 +1,164 @@
+"""Online and activity counts per guild, without keeping presences around.
+
+`PresenceCounts` listens to `RawEvent` instead of `PresenceUpdateEvent`, so
+presences are never structured into models: each update is a JSON parse and
+a few counter changes. Per user, all that's kept is a one byte `Status` in a
+`bytearray` and the names of their activities, which is what the counts
+need to be updated when the next presence replaces it.
+
+The shard only broadcasts raw events if something listens for them, and
+only structures the presence models if something else listens for those.
+"""
+from __future__ import annotations
+
+import collections
+import enum
+import json
+import typing
+
+import attr
+import trio
+
+import bloom.ll.substrate as subs
+from bloom.ll.shard import RawEvent
+
+if typing.TYPE_CHECKING:
+    import trio_typing
+
+
+class Status(enum.IntEnum):
+    #: also invisible, and users whose presence was never sent
+    OFFLINE = 0
+    ONLINE = 1
+    IDLE = 2
+    DND = 3
+
+
+_STATUSES = {'online': Status.ONLINE, 'idle': Status.IDLE, 'dnd': Status.DND}
+
+#: the events that change the counts
+TAGS = frozenset({'GUILD_CREATE', 'GUILD_DELETE', 'GUILD_MEMBER_REMOVE', 'PRESENCE_UPDATE'})
+
+
+@attr.define()
+class _Guild:
+    # user id -> index in ``statuses``. offline users aren't in here.
+    slots: typing.Dict[int, int] = attr.Factory(dict)
+    statuses: bytearray = attr.Factory(bytearray)
+    # indexes in ``statuses`` that can be reused
+    free: typing.List[int] = attr.Factory(list)
+    # status -> how many users have it (always 0 for offline)
+    counts: typing.List[int] = attr.Factory(lambda: [0] * len(Status))
+    # user id -> their activities' names, for users with any
+    activities: typing.Dict[int, typing.Tuple[str, ...]] = attr.Factory(dict)
+    # activity name -> how many users are doing it
+    activity_counts: typing.Counter[str] = attr.Factory(collections.Counter)
+
+    def status(self, user_id: int) -> Status:
+        slot = self.slots.get(user_id)
+        return Status.OFFLINE if slot is None else Status(self.statuses[slot])
+
+    def set(self, user_id: int, status: Status, names: typing.Tuple[str, ...]) -> None:
+        slot = self.slots.get(user_id)
+        if slot is not None:
+            self.counts[self.statuses[slot]] -= 1
+        if status is not Status.OFFLINE:
+            self.counts[status] += 1
+
+        if status is Status.OFFLINE:
+            if slot is not None:
+                del self.slots[user_id]
+                self.free.append(slot)
+        elif slot is not None:
+            self.statuses[slot] = status
+        elif self.free:
+            slot = self.slots[user_id] = self.free.pop()
+            self.statuses[slot] = status
+        else:
+            self.slots[user_id] = len(self.statuses)
+            self.statuses.append(status)
+
+        old_names = self.activities.pop(user_id, ())
+        if names:
+            self.activities[user_id] = names
+        if old_names != names:
+            self.activity_counts.subtract(old_names)
+            self.activity_counts.update(names)
+            for name in old_names:
+                if not self.activity_counts[name]:
+                    del self.activity_counts[name]
+
+
+def _status(presence: typing.Mapping[str, typing.Any]) -> Status:
+    return _STATUSES.get(presence.get('status'), Status.OFFLINE)  # type: ignore[arg-type]
+
+
+def _names(presence: typing.Mapping[str, typing.Any]) -> typing.Tuple[str, ...]:
+    # each name once, however many activities have it
+    return tuple(sorted({activity['name'] for activity in presence.get('activities') or ()}))
+
+
+@attr.define()
+class PresenceCounts:
+    """Counts of statuses and activities in each guild, kept from the raw
+    presence events. Needs the ``GUILD_PRESENCES`` intent."""
+
+    _guilds: typing.Dict[int, _Guild] = attr.Factory(dict)
+
+    def online(self, guild_id: int) -> int:
+        """How many users in a guild aren't offline."""
+        guild = self._guilds.get(guild_id)
+        return 0 if guild is None else sum(guild.counts)
+
+    def count(self, guild_id: int, status: Status) -> int:
+        """How many users in a guild have a status. Offline users aren't
+        tracked, so this is 0 for `Status.OFFLINE`."""
+        guild = self._guilds.get(guild_id)
+        return 0 if guild is None else guild.counts[status]
+
+    def status(self, guild_id: int, user_id: int) -> Status:
+        guild = self._guilds.get(guild_id)
+        return Status.OFFLINE if guild is None else guild.status(user_id)
+
+    def activities(self, guild_id: int) -> typing.Mapping[str, int]:
+        """Activity name -> how many users in a guild are doing it."""
+        guild = self._guilds.get(guild_id)
+        return {} if guild is None else guild.activity_counts
+
+    def apply(self, event: RawEvent) -> None:
+        if event.tag in TAGS:
+            self.apply_payload(event.tag, json.loads(event.payload)['d'])
+
+    def apply_payload(self, tag: str, data: typing.Mapping[str, typing.Any]) -> None:
+        """Apply the ``d`` of a dispatch."""
+        if tag == 'PRESENCE_UPDATE':
+            guild = self._guilds.get(int(data['guild_id']))
+            if guild is not None:
+                guild.set(int(data['user']['id']), _status(data), _names(data))
+        elif tag == 'GUILD_CREATE':
+            guild = self._guilds[int(data['id'])] = _Guild()
+            for presence in data.get('presences') or ():
+                guild.set(int(presence['user']['id']), _status(presence), _names(presence))
+        elif tag == 'GUILD_DELETE':
+            self._guilds.pop(int(data['id']), None)
+        elif tag == 'GUILD_MEMBER_REMOVE':
+            guild = self._guilds.get(int(data['guild_id']))
+            if guild is not None:
+                guild.set(int(data['user']['id']), Status.OFFLINE, ())
+
+    async def run(
+        self,
+        substrate: subs.Substrate,
+        *,
+        buffer_size: typing.Optional[int] = 1024,
+        task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED,
+    ) -> None:
+        """Apply the raw events broadcast to ``substrate`` until cancelled."""
+        recv = substrate.register(RawEvent, buffer_size)
+
+        try:
+            task_status.started()
+            async for event in recv:
+                self.apply(event)
+        finally:
+            substrate.unregister(RawEvent, recv)
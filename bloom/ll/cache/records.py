@@ -0,0 +1,363 @@
+"""Compact representations of cached entities.
+
+The attrs models carry every field Discord might send, as ``Snowflake``
+instances, nested ``User`` objects and lists. That adds up with millions of
+members, so the cache stores these slotted records instead. Snowflakes are
+plain ints, role ids are packed into an ``array('Q')``, booleans are packed
+into a ``flags`` int, timestamps are unix seconds and fields that are rarely
+needed are dropped entirely.
+"""
+from __future__ import annotations
+
+import array
+import datetime
+import enum
+import typing
+
+import attr
+
+from bloom.ll.models.base import UNKNOWN_TYPE, Unknownish
+from bloom.ll.models.channel import Channel
+from bloom.ll.models.gateway import GuildMemberUpdateEvent, MessageUpdateEvent
+from bloom.ll.models.guild import Guild, GuildMember
+from bloom.ll.models.message import Message
+from bloom.ll.models.permissions import Role
+from bloom.ll.models.voice import VoiceState
+
+T = typing.TypeVar('T')
+
+
+class MemberFlags(enum.IntFlag):
+    DEAF = 1 << 0
+    MUTE = 1 << 1
+    PENDING = 1 << 2
+
+
+class ChannelFlags(enum.IntFlag):
+    NSFW = 1 << 0
+    #: threads only
+    ARCHIVED = 1 << 1
+    #: threads only
+    LOCKED = 1 << 2
+
+
+class RoleFlags(enum.IntFlag):
+    HOIST = 1 << 0
+    MANAGED = 1 << 1
+    MENTIONABLE = 1 << 2
+
+
+class GuildFlags(enum.IntFlag):
+    UNAVAILABLE = 1 << 0
+    LARGE = 1 << 1
+
+
+class VoiceFlags(enum.IntFlag):
+    DEAF = 1 << 0
+    MUTE = 1 << 1
+    SELF_DEAF = 1 << 2
+    SELF_MUTE = 1 << 3
+    SELF_STREAM = 1 << 4
+    SELF_VIDEO = 1 << 5
+    SUPPRESS = 1 << 6
+
+
+class MessageFlags(enum.IntFlag):
+    TTS = 1 << 0
+    MENTION_EVERYONE = 1 << 1
+    PINNED = 1 << 2
+
+
+def _known(value: Unknownish[T], default: T) -> T:
+    return default if isinstance(value, UNKNOWN_TYPE) else value
+
+
+def _seconds(value: Unknownish[typing.Optional[datetime.datetime]]) -> typing.Optional[int]:
+    if isinstance(value, UNKNOWN_TYPE) or value is None:
+        return None
+    return int(value.timestamp())
+
+
+def _bits(*pairs: typing.Tuple[object, int]) -> int:
+    # the flags of the values that are true, or'd together.
+    flags = 0
+    for value, flag in pairs:
+        if value is True:
+            flags |= int(flag)
+    return flags
+
+
+@attr.define(weakref_slot=False)
+class MemberRecord:
+    user_id: int
+    #: role ids, not including ``@everyone``
+    roles: array.array[int]
+    #: unix seconds
+    joined_at: int
+    #: `MemberFlags`
+    flags: int = 0
+    nick: typing.Optional[str] = None
+    #: unix seconds
+    premium_since: typing.Optional[int] = None
+    #: unix seconds
+    communication_disabled_until: typing.Optional[int] = None
+
+    @classmethod
+    def from_model(cls, user_id: int, member: GuildMember) -> MemberRecord:
+        return cls(
+            int(user_id),
+            array.array('Q', member.roles),
+            int(member.joined_at.timestamp()),
+            _bits(
+                (member.deaf, MemberFlags.DEAF),
+                (member.mute, MemberFlags.MUTE),
+                (member.pending, MemberFlags.PENDING),
+            ),
+            _known(member.nick, None),
+            _seconds(member.premium_since),
+            _seconds(member.communication_disabled_until),
+        )
+
+    def update(self, event: GuildMemberUpdateEvent) -> None:
+        self.roles = array.array('Q', event.roles)
+        if event.joined_at is not None:
+            self.joined_at = int(event.joined_at.timestamp())
+
+        for value, flag in (
+            (event.deaf, MemberFlags.DEAF),
+            (event.mute, MemberFlags.MUTE),
+            (event.pending, MemberFlags.PENDING),
+        ):
+            if value is True:
+                self.flags |= int(flag)
+            elif value is False:
+                self.flags &= ~int(flag)
+
+        if not isinstance(event.nick, UNKNOWN_TYPE):
+            self.nick = event.nick
+        if not isinstance(event.premium_since, UNKNOWN_TYPE):
+            self.premium_since = _seconds(event.premium_since)
+        if not isinstance(event.communication_disabled_until, UNKNOWN_TYPE):
+            self.communication_disabled_until = _seconds(event.communication_disabled_until)
+
+
+@attr.define(weakref_slot=False)
+class ChannelRecord:
+    id: int
+    #: ``None`` for DMs
+    guild_id: typing.Optional[int]
+    #: a `ChannelTypes` value
+    type: int
+    position: int = 0
+    #: `ChannelFlags`
+    flags: int = 0
+    name: typing.Optional[str] = None
+    #: the category, or for threads, the channel the thread is in
+    parent_id: typing.Optional[int] = None
+    #: permission overwrites, as consecutive (id, type, allow, deny) groups
+    overwrites: array.array[int] = attr.Factory(lambda: array.array('Q'))
+    #: for threads, about how many members they have (it stops at 50)
+    member_count: typing.Optional[int] = None
+
+    @classmethod
+    def from_model(cls, channel: Channel, guild_id: typing.Optional[int] = None) -> ChannelRecord:
+        overwrites = array.array('Q')
+        for overwrite in _known(channel.permission_overwrites, []):
+            overwrites.extend(
+                (overwrite.id, overwrite.type, int(overwrite.allow), int(overwrite.deny))
+            )
+
+        metadata = _known(channel.thread_metadata, None)
+
+        return cls(
+            int(channel.id),
+            _optional_int(_known(channel.guild_id, guild_id)),
+            channel.type.value,
+            _known(channel.position, 0),
+            _bits(
+                (channel.nsfw, ChannelFlags.NSFW),
+                (metadata and metadata.archived, ChannelFlags.ARCHIVED),
+                (metadata and metadata.locked, ChannelFlags.LOCKED),
+            ),
+            _known(channel.name, None),
+            _optional_int(_known(channel.parent_id, None)),
+            overwrites,
+            _known(channel.member_count, None),
+        )
+
+
+@attr.define(weakref_slot=False)
+class RoleRecord:
+    id: int
+    guild_id: int
+    position: int
+    permissions: int
+    color: int = 0
+    #: `RoleFlags`
+    flags: int = 0
+    name: str = ''
+
+    @classmethod
+    def from_model(cls, guild_id: int, role: Role) -> RoleRecord:
+        return cls(
+            int(role.id),
+            int(guild_id),
+            role.position,
+            int(role.permissions),
+            role.color,
+            _bits(
+                (role.hoist, RoleFlags.HOIST),
+                (role.managed, RoleFlags.MANAGED),
+                (role.mentionable, RoleFlags.MENTIONABLE),
+            ),
+            role.name,
+        )
+
+
+@attr.define(weakref_slot=False)
+class GuildRecord:
+    id: int
+    name: str
+    owner_id: int
+    icon: typing.Optional[str] = None
+    #: ``None`` if never sent (it's only in GUILD_CREATE)
+    member_count: typing.Optional[int] = None
+    #: `GuildFlags`
+    flags: int = 0
+    #: unix seconds
+    joined_at: typing.Optional[int] = None
+
+    @classmethod
+    def from_model(cls, guild: Guild) -> GuildRecord:
+        return cls(
+            int(guild.id),
+            guild.name,
+            int(guild.owner_id),
+            guild.icon,
+            _known(guild.member_count, None),
+            _bits(
+                (guild.unavailable, GuildFlags.UNAVAILABLE),
+                (guild.large, GuildFlags.LARGE),
+            ),
+            _seconds(guild.joined_at),
+        )
+
+
+@attr.define(weakref_slot=False)
+class VoiceStateRecord:
+    user_id: int
+    guild_id: int
+    channel_id: int
+    session_id: str
+    #: `VoiceFlags`
+    flags: int = 0
+    #: unix seconds
+    request_to_speak: typing.Optional[int] = None
+
+    @classmethod
+    def from_model(cls, guild_id: int, state: VoiceState) -> VoiceStateRecord:
+        return cls(
+            int(state.user_id),
+            int(guild_id),
+            int(typing.cast(int, state.channel_id)),
+            state.session_id,
+            _bits(
+                (state.deaf, VoiceFlags.DEAF),
+                (state.mute, VoiceFlags.MUTE),
+                (state.self_deaf, VoiceFlags.SELF_DEAF),
+                (state.self_mute, VoiceFlags.SELF_MUTE),
+                (state.self_stream, VoiceFlags.SELF_STREAM),
+                (state.self_video, VoiceFlags.SELF_VIDEO),
+                (state.suppress, VoiceFlags.SUPPRESS),
+            ),
+            _seconds(state.request_to_speak_timestamp),
+        )
+
+    @classmethod
+    def from_payload(
+        cls, guild_id: int, state: typing.Mapping[str, typing.Any]
+    ) -> VoiceStateRecord:
+        """From the raw voice states in GUILD_CREATE."""
+        requested = state.get('request_to_speak_timestamp')
+
+        return cls(
+            int(state['user_id']),
+            int(guild_id),
+            int(state['channel_id']),
+            state['session_id'],
+            # the flags are named after the payload's fields.
+            _bits(*((state.get(str(flag.name).lower()), flag) for flag in VoiceFlags)),
+            None if requested is None else _seconds(datetime.datetime.fromisoformat(requested)),
+        )
+
+
+@attr.frozen(weakref_slot=False)
+class MessageRecord:
+    """Unlike the other records, these are never changed in place, so that
+    the version from before an edit can be handed out."""
+
+    id: int
+    channel_id: int
+    author_id: int
+    content: str
+    #: ``None`` for DMs
+    guild_id: typing.Optional[int] = None
+    type: int = 0
+    #: `MessageFlags`
+    flags: int = 0
+    #: unix seconds
+    edited_at: typing.Optional[int] = None
+    #: ids of the mentioned users
+    mentions: typing.Tuple[int, ...] = ()
+    #: urls of the attachments
+    attachments: typing.Tuple[str, ...] = ()
+
+    @classmethod
+    def from_model(cls, message: Message) -> MessageRecord:
+        return cls(
+            int(message.id),
+            int(message.channel_id),
+            int(message.author.id),
+            message.content,
+            _optional_int(_known(message.guild_id, None)),
+            message.type,
+            _bits(
+                (message.tts, MessageFlags.TTS),
+                (message.mention_everyone, MessageFlags.MENTION_EVERYONE),
+                (message.pinned, MessageFlags.PINNED),
+            ),
+            _seconds(message.edited_timestamp),
+            tuple(int(user.id) for user in message.mentions),
+            tuple(attachment.url for attachment in message.attachments),
+        )
+
+    def updated(self, event: MessageUpdateEvent) -> MessageRecord:
+        """This message, with the changes in ``event``."""
+        changes: typing.Dict[str, typing.Any] = {}
+
+        if not isinstance(event.content, UNKNOWN_TYPE):
+            changes['content'] = event.content
+        if not isinstance(event.edited_timestamp, UNKNOWN_TYPE):
+            changes['edited_at'] = _seconds(event.edited_timestamp)
+        if not isinstance(event.mentions, UNKNOWN_TYPE):
+            changes['mentions'] = tuple(int(user.id) for user in event.mentions)
+        if not isinstance(event.attachments, UNKNOWN_TYPE):
+            changes['attachments'] = tuple(attachment.url for attachment in event.attachments)
+
+        flags = self.flags
+        for value, flag in (
+            (event.tts, MessageFlags.TTS),
+            (event.mention_everyone, MessageFlags.MENTION_EVERYONE),
+            (event.pinned, MessageFlags.PINNED),
+        ):
+            if value is True:
+                flags |= int(flag)
+            elif value is False:
+                flags &= ~int(flag)
+        changes['flags'] = flags
+
+        return attr.evolve(self, **changes)
+
+
+def _optional_int(value: typing.Optional[int]) -> typing.Optional[int]:
+    return None if value is None else int(value)
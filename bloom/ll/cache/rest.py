@@ -0,0 +1,179 @@
+"""Answer REST GETs from the cache when possible, before spending a request.
+
+`CachedRest` wraps a `RatelimitingState`. A GET is answered, in order, by:
+
+1. the gateway-fed `Cache`, for the endpoints whose models it keeps whole
+   (users, emojis and stickers; guilds, channels, roles and members are
+   stored as records that drop fields the REST models have), then
+2. a response from an earlier request to the same URL, if it's younger
+   than the endpoint's entry in `CachedRest.freshness`, then
+3. the REST API.
+
+Any other method goes straight to the REST API, and forgets the cached
+responses for its URL and the one above it (like a role's guild's roles),
+since it probably changed them.
+"""
+from __future__ import annotations
+
+import collections
+import time
+import typing
+
+import attr
+
+from bloom.ll.cache.records import GuildFlags
+from bloom.ll.cache.state import Cache, Entities
+from bloom.ll.ratelimits import RatelimitingState
+from bloom.ll.rest.models import Request
+
+ReturnT = typing.TypeVar('ReturnT')
+
+# route -> seconds a response stays fresh. these change rarely, or are
+# fine to be a bit out of date.
+FRESHNESS: typing.Dict[str, float] = {
+    '/users/{user_id}': 600,
+    '/users/@me': 60,
+    '/guilds/{guild_id}': 60,
+    '/guilds/{guild_id}/preview': 600,
+    '/guilds/{guild_id}/channels': 30,
+    '/guilds/{guild_id}/roles': 30,
+    '/guilds/{guild_id}/members/{user_id}': 30,
+    '/guilds/{guild_id}/emojis': 300,
+    '/guilds/{guild_id}/emojis/{emoji_id}': 300,
+    '/guilds/{guild_id}/stickers': 300,
+    '/guilds/{guild_id}/stickers/{sticker_id}': 300,
+    '/channels/{channel_id}': 30,
+    '/voice/regions': 3600,
+}
+
+
+@attr.define()
+class RestCacheStats:
+    #: answered by the gateway cache
+    gateway_hits: int = 0
+    #: answered by an earlier response
+    hits: int = 0
+    #: sent to the REST API
+    misses: int = 0
+
+
+def _user(cache: Cache, args: typing.Mapping[str, typing.Union[int, str]]) -> object:
+    return cache.user(int(args['user_id']))
+
+
+def _emoji(cache: Cache, args: typing.Mapping[str, typing.Union[int, str]]) -> object:
+    emoji = cache.emoji(int(args['emoji_id']))
+    return emoji if emoji is not None and _has_guild(cache, args, Entities.EMOJIS) else None
+
+
+def _emojis(cache: Cache, args: typing.Mapping[str, typing.Union[int, str]]) -> object:
+    if not _has_guild(cache, args, Entities.EMOJIS):
+        return None
+    return tuple(cache.emojis(int(args['guild_id'])))
+
+
+def _sticker(cache: Cache, args: typing.Mapping[str, typing.Union[int, str]]) -> object:
+    sticker = cache.sticker(int(args['sticker_id']))
+    return sticker if sticker is not None and _has_guild(cache, args, Entities.STICKERS) else None
+
+
+def _stickers(cache: Cache, args: typing.Mapping[str, typing.Union[int, str]]) -> object:
+    if not _has_guild(cache, args, Entities.STICKERS):
+        return None
+    return tuple(cache.stickers(int(args['guild_id'])))
+
+
+def _has_guild(
+    cache: Cache, args: typing.Mapping[str, typing.Union[int, str]], entity: Entities
+) -> bool:
+    # a guild's emojis and stickers are all there once its GUILD_CREATE is,
+    # so an empty list is an answer too.
+    needed = entity | Entities.GUILDS
+    guild = cache.guild(int(args['guild_id']))
+    return (
+        cache.entities & needed == needed
+        and guild is not None
+        and not guild.flags & GuildFlags.UNAVAILABLE
+    )
+
+
+# route -> how to answer it from the gateway cache, or None if it can't
+_GATEWAY: typing.Dict[
+    str,
+    typing.Callable[[Cache, typing.Mapping[str, typing.Union[int, str]]], object],
+] = {
+    '/users/{user_id}': _user,
+    '/guilds/{guild_id}/emojis/{emoji_id}': _emoji,
+    '/guilds/{guild_id}/emojis': _emojis,
+    '/guilds/{guild_id}/stickers/{sticker_id}': _sticker,
+    '/guilds/{guild_id}/stickers': _stickers,
+}
+
+
+@attr.define()
+class CachedRest:
+    """Make requests like `RatelimitingState.request`, but answer GETs from
+    the cache first."""
+
+    rest: RatelimitingState
+    #: answers what it can before anything else
+    cache: typing.Optional[Cache] = None
+    #: route -> seconds a response can be reused for. routes that aren't in
+    #: here aren't cached.
+    freshness: typing.Dict[str, float] = attr.Factory(lambda: dict(FRESHNESS))
+    #: the most URLs to keep responses for
+    max_urls: int = 10_000
+    clock: typing.Callable[[], float] = time.monotonic
+    #: route -> how its requests were answered
+    stats: typing.Dict[str, RestCacheStats] = attr.Factory(dict)
+
+    # url -> params -> (when it stops being fresh, response), least recently
+    # used url first
+    _responses: typing.OrderedDict[str, typing.Dict[str, typing.Tuple[float, object]]] = (
+        attr.Factory(collections.OrderedDict)
+    )
+
+    async def request(self, req: Request[ReturnT]) -> ReturnT:
+        if req.method != 'GET':
+            self._responses.pop(req.url, None)
+            self._responses.pop(req.url.rpartition('/')[0], None)
+            return await self.rest.request(req)
+
+        stats = self.stats.setdefault(req.route, RestCacheStats())
+
+        gateway = _GATEWAY.get(req.route)
+        if gateway is not None and self.cache is not None:
+            found = gateway(self.cache, req.args)
+            if found is not None:
+                stats.gateway_hits += 1
+                return typing.cast(ReturnT, found)
+
+        ttl = self.freshness.get(req.route, 0)
+        params = repr(sorted((req.params or {}).items()))
+        now = self.clock()
+
+        responses = self._responses.get(req.url)
+        if responses is not None:
+            self._responses.move_to_end(req.url)
+            expires, cached = responses.get(params, (now, None))
+            if now < expires:
+                stats.hits += 1
+                return typing.cast(ReturnT, cached)
+
+        stats.misses += 1
+        response = await self.rest.request(req)
+
+        if ttl > 0:
+            self._responses.setdefault(req.url, {})[params] = (now + ttl, response)
+            self._responses.move_to_end(req.url)
+            while len(self._responses) > self.max_urls:
+                self._responses.popitem(last=False)
+
+        return response
+
+    def forget(self, url: typing.Optional[str] = None) -> None:
+        """Drop the cached responses for a URL, or every one."""
+        if url is None:
+            self._responses.clear()
+        else:
+            self._responses.pop(url, None)
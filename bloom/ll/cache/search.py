@@ -0,0 +1,212 @@
+"""Search cached members by name, like the member search REST endpoint.
+
+`MemberSearch` keeps a sorted list of (name, user id) for every guild, with
+each member's username and nick in it. A query is a binary search followed
+by a scan, so autocomplete doesn't cost a ratelimited request per keystroke.
+The index listens to its cache: single member events update it in place,
+and GUILD_CREATE, member chunks and restores mark the guild to be re-sorted
+on its next query. Guilds that were cached before the index was made are
+indexed on their first query.
+"""
+from __future__ import annotations
+
+import bisect
+import typing
+
+import attr
+
+import bloom.ll.models.gateway as gateway_models
+from bloom.ll.cache.members import MemberPolicy
+from bloom.ll.cache.records import MemberRecord
+from bloom.ll.cache.state import Cache, CacheRestored, Entities
+from bloom.ll.models.base import UNKNOWN_TYPE, Snowflake
+from bloom.ll.models.guild import GuildMember
+from bloom.ll.ratelimits import RatelimitingState
+from bloom.ll.rest.raw import RawRest
+
+#: the most results the REST endpoint returns
+MAX_LIMIT = 1000
+
+
+def _names(username: typing.Optional[str], nick: typing.Optional[str]) -> typing.Tuple[str, ...]:
+    # matching is case insensitive
+    names = {name.casefold() for name in (username, nick) if name}
+    return tuple(sorted(names))
+
+
+@attr.define()
+class _GuildIndex:
+    # user id -> names in ``keys``
+    names: typing.Dict[int, typing.Tuple[str, ...]] = attr.Factory(dict)
+    # sorted (name, user id) pairs, unless ``dirty``
+    keys: typing.List[typing.Tuple[str, int]] = attr.Factory(list)
+    dirty: bool = False
+
+    def set(self, user_id: int, names: typing.Tuple[str, ...], *, bulk: bool = False) -> None:
+        if self.names.get(user_id) == names:
+            return
+
+        if bulk or self.dirty:
+            self.names[user_id] = names
+            self.dirty = True
+            return
+
+        self.remove(user_id)
+        self.names[user_id] = names
+        for name in names:
+            bisect.insort(self.keys, (name, user_id))
+
+    def remove(self, user_id: int) -> None:
+        names = self.names.pop(user_id, ())
+        if self.dirty:
+            return
+
+        for name in names:
+            i = bisect.bisect_left(self.keys, (name, user_id))
+            del self.keys[i]
+
+    def sorted(self) -> typing.List[typing.Tuple[str, int]]:
+        if self.dirty:
+            self.keys = sorted(
+                (name, user_id) for user_id, names in self.names.items() for name in names
+            )
+            self.dirty = False
+        return self.keys
+
+
+@attr.define()
+class MemberSearch:
+    cache: Cache
+
+    _guilds: typing.Dict[int, _GuildIndex] = attr.Factory(dict)
+
+    def __attrs_post_init__(self) -> None:
+        self.cache.listeners.append(self._applied)
+
+    def complete(self, guild_id: int) -> bool:
+        """Whether every member of the guild is cached, so local results are
+        the same as the REST API's."""
+        guild = self.cache.guild(guild_id)
+        return (
+            type(self.cache.member_policy) is MemberPolicy
+            and guild_id in self._guilds
+            and guild is not None
+            and guild.member_count is not None
+            and len(self.cache.members(guild_id)) >= guild.member_count
+        )
+
+    def search(self, guild_id: int, query: str, limit: int = 1) -> typing.List[MemberRecord]:
+        """Cached members whose username or nick starts with ``query``.
+
+        Like the REST endpoint, this is case insensitive and ``limit`` is
+        between 1 and 1000.
+        """
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+
+        index = self._guilds.get(guild_id)
+        if index is None:
+            if not self.cache.members(guild_id):
+                return []
+            index = self._rebuild(guild_id)
+
+        prefix = query.casefold()
+        keys = index.sorted()
+        found: typing.List[MemberRecord] = []
+        seen: typing.Set[int] = set()
+        stale: typing.List[int] = []
+
+        for i in range(bisect.bisect_left(keys, (prefix, 0)), len(keys)):
+            name, user_id = keys[i]
+            if not name.startswith(prefix) or len(found) == limit:
+                break
+            if user_id in seen:
+                continue
+
+            seen.add(user_id)
+            member = self.cache.member(guild_id, user_id)
+            if member is None:
+                # evicted by the member policy
+                stale.append(user_id)
+            else:
+                found.append(member)
+
+        for user_id in stale:
+            index.remove(user_id)
+
+        return found
+
+    async def search_members(
+        self,
+        guild_id: int,
+        query: str,
+        limit: int = 1,
+        *,
+        rest: typing.Optional[RatelimitingState] = None,
+    ) -> typing.List[MemberRecord]:
+        """`search`, but if the cache may be missing matches, ask the REST
+        API instead (if ``rest`` is passed). Members found that way are
+        cached if the member policy admits them."""
+        found = self.search(guild_id, query, limit)
+        if rest is None or len(found) == limit or self.complete(guild_id):
+            return found
+
+        request = RawRest(rest.converter).search_guild_members(
+            Snowflake(guild_id), query=query, limit=limit
+        )
+        members = [
+            (MemberRecord.from_model(member.user.id, member), member.user)
+            for member in await rest.request(request)
+            if not isinstance(member.user, UNKNOWN_TYPE)
+        ]
+
+        if self.cache.entities & Entities.MEMBERS:
+            self.cache.put_members(guild_id, members)
+            self._refresh(guild_id, [record.user_id for record, _ in members], bulk=False)
+
+        return [record for record, _ in members]
+
+    def _refresh(self, guild_id: int, user_ids: typing.Iterable[int], *, bulk: bool) -> None:
+        index = self._guilds.get(guild_id)
+        if index is None:
+            # it gets all of the guild's members once it's made
+            return
+
+        for user_id in user_ids:
+            member = self.cache.peek_member(guild_id, user_id)
+            user = self.cache.user(user_id)
+            if member is None or user is None:
+                index.remove(user_id)
+            else:
+                index.set(user_id, _names(user.username, member.nick), bulk=bulk)
+
+    def _rebuild(self, guild_id: int) -> _GuildIndex:
+        index = self._guilds[guild_id] = _GuildIndex()
+        user_ids = [member.user_id for member in self.cache.members(guild_id)]
+        self._refresh(guild_id, user_ids, bulk=True)
+        return index
+
+    def _applied(self, event: object) -> None:
+        if isinstance(event, gateway_models.GuildCreateEvent):
+            self._rebuild(int(event.id))
+        elif isinstance(event, CacheRestored):
+            for guild_id in event.guild_ids:
+                self._rebuild(guild_id)
+        elif isinstance(event, gateway_models.GuildDeleteEvent):
+            self._guilds.pop(event.id, None)
+        elif isinstance(event, gateway_models.GuildMembersChunkEvent):
+            self._refresh(event.guild_id, _user_ids(event.members), bulk=True)
+        elif isinstance(event, gateway_models.GuildMemberAddEvent):
+            self._refresh(event.guild_id, _user_ids([event]), bulk=False)
+        elif isinstance(
+            event, (gateway_models.GuildMemberUpdateEvent, gateway_models.GuildMemberRemoveEvent)
+        ):
+            self._refresh(event.guild_id, [event.user.id], bulk=False)
+        elif isinstance(event, gateway_models.VoiceStateUpdateEvent):
+            if not isinstance(event.guild_id, UNKNOWN_TYPE):
+                self._refresh(event.guild_id, [event.user_id], bulk=False)
+
+
+def _user_ids(members: typing.Iterable[GuildMember]) -> typing.List[int]:
+    # members from these events and the search endpoint always have a user
+    return [int(m.user.id) for m in members if not isinstance(m.user, UNKNOWN_TYPE)]
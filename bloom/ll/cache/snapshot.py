@@ -0,0 +1,393 @@
+"""Save a `Cache` to a file and load it back, to warm start after a restart.
+
+The file is a header followed by one section per kind of entity. Each
+section is a sorted index of fixed-size ``(key, key, offset, length)``
+entries followed by the entities, each `marshal`-ed on its own. `Snapshot`
+maps the file into memory and binary searches the index, so single lookups
+only decode what they return, and `Snapshot.restore` fills a cache without
+going through any gateway models.
+
+Snapshots are only meant to be read by the same version of bloom that wrote
+them, since the records can change between versions. Voice states and
+thread members aren't saved; GUILD_CREATE and thread events fill them in
+again after the restart.
+"""
+from __future__ import annotations
+
+import array
+import contextlib
+import gc
+import itertools
+import marshal
+import mmap
+import operator
+import os
+import struct
+import typing
+
+import attr
+from cattr import Converter
+
+import bloom.ll.cache.records as records
+import bloom.ll.shard as shard
+from bloom.ll.cache.state import Cache, CacheRestored, Entities
+from bloom.ll.models.emoji import Emoji
+from bloom.ll.models.sticker import Sticker
+from bloom.ll.models.user import User
+
+T = typing.TypeVar('T')
+
+_MAGIC = b'BLMSNAP1'
+# magic, marshal version, section count
+_HEADER = struct.Struct('<8sIH')
+# name, entry count, index offset, data offset
+_SECTION = struct.Struct('<8sQQQ')
+# key, second key (or 0), offset in the section's data, length
+_ENTRY = struct.Struct('<QQQI')
+
+# record type -> positions of its ``array('Q')`` fields, which are stored as
+# bytes
+_ARRAYS: typing.Dict[type, typing.Tuple[int, ...]] = {
+    cls: tuple(i for i, field in enumerate(attr.fields(cls)) if field.name in arrays)
+    for cls, arrays in [
+        (records.GuildRecord, ()),
+        (records.ChannelRecord, ('overwrites',)),
+        (records.RoleRecord, ()),
+        (records.MemberRecord, ('roles',)),
+    ]
+}
+
+
+class SnapshotError(Exception):
+    """The file isn't a snapshot this version of bloom can read."""
+
+
+@contextlib.contextmanager
+def _no_gc() -> typing.Iterator[None]:
+    # none of this makes reference cycles, and with millions of new objects
+    # the collector would otherwise run over and over.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# record type -> gets its fields' values, in order (faster than astuple)
+_GETTERS: typing.Dict[type, typing.Callable[[typing.Any], typing.Tuple[typing.Any, ...]]] = {
+    cls: operator.attrgetter(*(field.name for field in attr.fields(cls))) for cls in _ARRAYS
+}
+
+
+def encode_record(record: typing.Any) -> bytes:
+    """A guild, channel, role or member record as bytes."""
+    cls = type(record)
+    values = _GETTERS[cls](record)
+    arrays = _ARRAYS[cls]
+    if not arrays:
+        return marshal.dumps(values)
+
+    encoded = list(values)
+    for i in arrays:
+        encoded[i] = encoded[i].tobytes()
+    return marshal.dumps(tuple(encoded))
+
+
+def decode_record(cls: typing.Type[T], data: bytes) -> T:
+    """The record of type ``cls`` that `encode_record` turned into
+    ``data``."""
+    arrays = _ARRAYS[cls]
+    if not arrays:
+        return cls(*marshal.loads(data))
+
+    values = list(marshal.loads(data))
+    for i in arrays:
+        packed = array.array('Q')
+        packed.frombytes(values[i])
+        values[i] = packed
+    return cls(*values)
+
+
+def copy_record(record: T) -> T:
+    """A copy of a record that shares nothing mutable with it."""
+    cls = type(record)
+    values = list(_GETTERS[cls](record))
+    for i in _ARRAYS[cls]:
+        values[i] = values[i][:]
+    return cls(*values)
+
+
+def write(
+    cache: Cache,
+    path: typing.Union[str, os.PathLike[str]],
+    *,
+    converter: typing.Optional[Converter] = None,
+) -> None:
+    """Save everything in ``cache`` to ``path``, replacing it atomically."""
+    converter = converter or shard.gateway_converter()
+
+    def models(
+        store: typing.Mapping[int, typing.Set[int]], items: typing.Mapping[int, typing.Any]
+    ) -> typing.Iterator[typing.Tuple[int, int, bytes]]:
+        for guild_id, ids in store.items():
+            for id in ids:
+                yield guild_id, id, marshal.dumps(converter.unstructure(items[id]))
+
+    sections: typing.List[typing.Tuple[bytes, typing.Iterable[typing.Tuple[int, int, bytes]]]] = [
+        (b'guilds', ((id, 0, encode_record(r)) for id, r in cache._guilds.items())),
+        (b'channels', ((id, 0, encode_record(r)) for id, r in cache._channels.items.items())),
+        (b'threads', ((id, 0, encode_record(r)) for id, r in cache._threads.items.items())),
+        (b'roles', ((id, 0, encode_record(r)) for id, r in cache._roles.items.items())),
+        (
+            b'members',
+            (
+                (guild_id, user_id, encode_record(r))
+                for guild_id, members in cache._members.items()
+                for user_id, r in members.items()
+            ),
+        ),
+        (
+            b'users',
+            (
+                (id, 0, marshal.dumps(converter.unstructure(user)))
+                for id, (user, _) in cache._users.items()
+            ),
+        ),
+        (b'emojis', models(cache._emojis.guilds, cache._emojis.items)),
+        (b'stickers', models(cache._stickers.guilds, cache._stickers.items)),
+    ]
+
+    temporary = f'{os.fspath(path)}.tmp'
+    with _no_gc(), open(temporary, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, marshal.version, len(sections)))
+        table = f.tell()
+        f.write(b'\0' * _SECTION.size * len(sections))
+
+        headers = []
+        for name, entries in sections:
+            sorted_entries = sorted(entries, key=lambda entry: (entry[0], entry[1]))
+
+            index = f.tell()
+            data = index + _ENTRY.size * len(sorted_entries)
+            offset = 0
+            for key, second, blob in sorted_entries:
+                f.write(_ENTRY.pack(key, second, offset, len(blob)))
+                offset += len(blob)
+            for _, _, blob in sorted_entries:
+                f.write(blob)
+
+            headers.append(_SECTION.pack(name, len(sorted_entries), index, data))
+
+        f.seek(table)
+        f.write(b''.join(headers))
+
+    os.replace(temporary, path)
+
+
+@attr.define()
+class _Section:
+    buffer: mmap.mmap
+    count: int
+    index: int
+    data: int
+
+    def _key(self, i: int) -> typing.Tuple[int, int]:
+        key, second, _, _ = _ENTRY.unpack_from(self.buffer, self.index + i * _ENTRY.size)
+        return key, second
+
+    def _blob(self, i: int) -> bytes:
+        _, _, offset, length = _ENTRY.unpack_from(self.buffer, self.index + i * _ENTRY.size)
+        start = self.data + offset
+        return self.buffer[start : start + length]
+
+    def _lower_bound(self, key: typing.Tuple[int, int]) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key: int, second: int = 0) -> typing.Optional[bytes]:
+        i = self._lower_bound((key, second))
+        if i < self.count and self._key(i) == (key, second):
+            return self._blob(i)
+        return None
+
+    def with_key(self, key: int) -> typing.Iterator[typing.Tuple[int, bytes]]:
+        """``(second key, blob)`` for the entries whose first key is ``key``."""
+        i = self._lower_bound((key, 0))
+        while i < self.count:
+            found, second = self._key(i)
+            if found != key:
+                return
+            yield second, self._blob(i)
+            i += 1
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[int, int, bytes]]:
+        data = self.buffer
+        for i in range(self.count):
+            key, second, offset, length = _ENTRY.unpack_from(data, self.index + i * _ENTRY.size)
+            start = self.data + offset
+            yield key, second, data[start : start + length]
+
+
+@attr.define()
+class Snapshot:
+    """A snapshot file, mapped into memory. Use `open` to make one."""
+
+    _file: typing.BinaryIO
+    _buffer: mmap.mmap
+    _sections: typing.Dict[bytes, _Section]
+    converter: Converter = attr.Factory(shard.gateway_converter)
+
+    @classmethod
+    def open(
+        cls,
+        path: typing.Union[str, os.PathLike[str]],
+        *,
+        converter: typing.Optional[Converter] = None,
+    ) -> Snapshot:
+        f = open(path, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            f.close()
+            raise
+
+        try:
+            magic, version, count = _HEADER.unpack_from(buffer)
+            if magic != _MAGIC or version != marshal.version:
+                raise SnapshotError(f'{os.fspath(path)} is not a snapshot from this version')
+
+            sections = {}
+            for i in range(count):
+                name, entries, index, data = _SECTION.unpack_from(
+                    buffer, _HEADER.size + i * _SECTION.size
+                )
+                sections[name.rstrip(b'\0')] = _Section(buffer, entries, index, data)
+        except BaseException:
+            buffer.close()
+            f.close()
+            raise
+
+        return cls(f, buffer, sections, converter or shard.gateway_converter())
+
+    def close(self) -> None:
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def guild(self, guild_id: int) -> typing.Optional[records.GuildRecord]:
+        return self._record(b'guilds', records.GuildRecord, guild_id)
+
+    def channel(self, channel_id: int) -> typing.Optional[records.ChannelRecord]:
+        return self._record(b'channels', records.ChannelRecord, channel_id)
+
+    def thread(self, thread_id: int) -> typing.Optional[records.ChannelRecord]:
+        return self._record(b'threads', records.ChannelRecord, thread_id)
+
+    def role(self, role_id: int) -> typing.Optional[records.RoleRecord]:
+        return self._record(b'roles', records.RoleRecord, role_id)
+
+    def member(self, guild_id: int, user_id: int) -> typing.Optional[records.MemberRecord]:
+        return self._record(b'members', records.MemberRecord, guild_id, user_id)
+
+    def members(self, guild_id: int) -> typing.List[records.MemberRecord]:
+        return [
+            decode_record(records.MemberRecord, blob)
+            for _, blob in self._sections[b'members'].with_key(guild_id)
+        ]
+
+    def user(self, user_id: int) -> typing.Optional[User]:
+        blob = self._sections[b'users'].find(user_id)
+        return None if blob is None else self.converter.structure(marshal.loads(blob), User)
+
+    def restore(self, cache: Cache) -> None:
+        """Put everything in this snapshot that ``cache`` stores into it.
+
+        Members still go through the cache's member policy, and the cache's
+        listeners are passed a `CacheRestored` afterwards.
+        """
+        with _no_gc():
+            guild_ids = self._restore(cache)
+
+        restored = CacheRestored(frozenset(guild_ids))
+        for listener in cache.listeners:
+            listener(restored)
+
+    def _restore(self, cache: Cache) -> typing.Set[int]:
+        entities = cache.entities
+        sections = self._sections
+        guild_ids: typing.Set[int] = set()
+
+        if entities & Entities.GUILDS:
+            for id, _, blob in sections[b'guilds']:
+                cache._guilds[id] = decode_record(records.GuildRecord, blob)
+                guild_ids.add(id)
+
+        # (entities, section, store, record type or model)
+        stores: typing.List[typing.Tuple[Entities, bytes, typing.Any, type]] = [
+            (Entities.CHANNELS, b'channels', cache._channels, records.ChannelRecord),
+            (Entities.THREADS, b'threads', cache._threads, records.ChannelRecord),
+            (Entities.ROLES, b'roles', cache._roles, records.RoleRecord),
+            (Entities.EMOJIS, b'emojis', cache._emojis, Emoji),
+            (Entities.STICKERS, b'stickers', cache._stickers, Sticker),
+        ]
+        for entity, name, store, cls in stores:
+            if not entities & entity:
+                continue
+
+            for key, second, blob in sections[name]:
+                if cls in _ARRAYS:
+                    record: typing.Any = decode_record(cls, blob)
+                    store.put(record.guild_id, key, record)
+                    if record.guild_id is not None:
+                        guild_ids.add(record.guild_id)
+                else:
+                    # models are stored by (guild id, id)
+                    store.put(key, second, self.converter.structure(marshal.loads(blob), cls))
+                    guild_ids.add(key)
+
+        if entities & Entities.MEMBERS:
+            guild_ids.update(self._restore_members(cache))
+
+        return guild_ids
+
+    def _restore_members(self, cache: Cache) -> typing.Set[int]:
+        """Returns the ids of the guilds members were restored in."""
+        users: typing.Dict[int, User] = {}
+        for id, _, blob in self._sections[b'users']:
+            users[id] = self.converter.structure(marshal.loads(blob), User)
+
+        guild_ids: typing.Set[int] = set()
+
+        # members are stored sorted by guild
+        by_guild = itertools.groupby(self._sections[b'members'], operator.itemgetter(0))
+        for guild_id, rows in by_guild:
+            guild_ids.add(guild_id)
+            cache.put_members(
+                guild_id,
+                (
+                    (decode_record(records.MemberRecord, blob), users[user_id])
+                    for _, user_id, blob in rows
+                    if user_id in users
+                ),
+            )
+
+        return guild_ids
+
+    def _record(
+        self, section: bytes, cls: typing.Type[T], key: int, second: int = 0
+    ) -> typing.Optional[T]:
+        blob = self._sections[section].find(key, second)
+        return None if blob is None else decode_record(cls, blob)
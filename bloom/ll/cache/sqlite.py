@@ -0,0 +1,235 @@
+"""A `CacheBackend` in a SQLite database, shared by the processes on a host.
+
+The database is in WAL mode, so any number of processes can read while one
+writes, and each `Changes` is written in one transaction. Records are
+stored the same way snapshots store them, next to the columns they're
+looked up by, which are all indexed.
+"""
+from __future__ import annotations
+
+import marshal
+import os
+import sqlite3
+import threading
+import typing
+
+from cattr import Converter
+
+from bloom.ll.cache.backend import Changes
+from bloom.ll.cache.records import ChannelRecord, GuildRecord, MemberRecord, RoleRecord
+from bloom.ll.cache.snapshot import decode_record, encode_record
+from bloom.ll.cache.state import Entities
+from bloom.ll.models.channel import ChannelTypes
+from bloom.ll.models.user import User
+from bloom.ll.shard import gateway_converter
+
+T = typing.TypeVar('T')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS guilds (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    parent_id INTEGER,
+    position INTEGER NOT NULL,
+    thread INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channels_by_guild ON channels (guild_id, thread);
+CREATE INDEX IF NOT EXISTS channels_by_parent ON channels (parent_id, position, id);
+CREATE TABLE IF NOT EXISTS roles (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS roles_by_guild ON roles (guild_id);
+CREATE TABLE IF NOT EXISTS members (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS members_by_user ON members (user_id);
+CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+'''
+
+# what a replacement deletes, by the kinds of entities replaced
+_REPLACEMENTS = [
+    (Entities.GUILDS, 'DELETE FROM guilds WHERE id = ?'),
+    (Entities.ROLES, 'DELETE FROM roles WHERE guild_id = ?'),
+    (Entities.MEMBERS, 'DELETE FROM members WHERE guild_id = ?'),
+]
+# channels and threads share a table, so they're told apart by type
+_THREAD_TYPES = frozenset(
+    typ.value
+    for typ in (
+        ChannelTypes.GUILD_NEWS_THREAD,
+        ChannelTypes.GUILD_PUBLIC_THREAD,
+        ChannelTypes.GUILD_PRIVATE_THREAD,
+    )
+)
+
+
+class SQLiteBackend:
+    """A cache backend in the SQLite database at ``path``, made if it doesn't
+    exist.
+
+    Reads use a connection for the thread that made the backend, and
+    `write` uses its own, so writes can happen in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, os.PathLike[str]],
+        *,
+        converter: typing.Optional[Converter] = None,
+        timeout: float = 30,
+    ) -> None:
+        self.path = os.fspath(path)
+        self.converter = converter or gateway_converter()
+        self.timeout = timeout
+        self._connection = self._connect(check_same_thread=True)
+        self._writer: typing.Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def _connect(self, *, check_same_thread: bool) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, check_same_thread=check_same_thread
+        )
+        connection.execute('PRAGMA journal_mode = WAL')
+        # with WAL, a crash can only lose the last few transactions.
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def close(self) -> None:
+        self._connection.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def write(self, changes: Changes) -> None:
+        with self._write_lock:
+            if self._writer is None:
+                # trio runs each write in whichever worker thread is free.
+                self._writer = self._connect(check_same_thread=False)
+            with self._writer:
+                self._write(self._writer, changes)
+
+    def _write(self, db: sqlite3.Connection, changes: Changes) -> None:
+        # users whose members went away, to delete if no others are left
+        released: typing.List[typing.Tuple[int]] = []
+
+        for guild_id, replaced in changes.replaced.items():
+            for entities, statement in _REPLACEMENTS:
+                if replaced & entities:
+                    if entities is Entities.MEMBERS:
+                        released.extend(
+                            db.execute(
+                                'SELECT user_id FROM members WHERE guild_id = ?', (guild_id,)
+                            )
+                        )
+                    db.execute(statement, (guild_id,))
+
+            for entities, thread in [(Entities.CHANNELS, False), (Entities.THREADS, True)]:
+                if replaced & entities:
+                    db.execute(
+                        'DELETE FROM channels WHERE guild_id = ? AND thread = ?',
+                        (guild_id, thread),
+                    )
+
+        db.executemany(
+            'INSERT OR REPLACE INTO guilds VALUES (?, ?)',
+            [(guild.id, encode_record(guild)) for guild in changes.guilds],
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    c.id,
+                    c.guild_id,
+                    c.parent_id,
+                    c.position,
+                    c.type in _THREAD_TYPES,
+                    encode_record(c),
+                )
+                for c in changes.channels
+            ],
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO roles VALUES (?, ?, ?)',
+            [(role.id, role.guild_id, encode_record(role)) for role in changes.roles],
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO users VALUES (?, ?)',
+            [(user.id, marshal.dumps(self.converter.unstructure(user))) for user in changes.users],
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO members VALUES (?, ?, ?)',
+            [
+                (guild_id, member.user_id, encode_record(member))
+                for guild_id, member in changes.members
+            ],
+        )
+
+        db.executemany(
+            'DELETE FROM channels WHERE id = ?', [(id,) for id in changes.deleted_channels]
+        )
+        db.executemany('DELETE FROM roles WHERE id = ?', [(id,) for id in changes.deleted_roles])
+        db.executemany(
+            'DELETE FROM members WHERE guild_id = ? AND user_id = ?', changes.deleted_members
+        )
+        released.extend((user_id,) for _, user_id in changes.deleted_members)
+
+        db.executemany(
+            'DELETE FROM users WHERE id = ?1 AND NOT EXISTS '
+            '(SELECT 1 FROM members WHERE user_id = ?1)',
+            released,
+        )
+
+    def guild(self, guild_id: int) -> typing.Optional[GuildRecord]:
+        return self._one(GuildRecord, 'SELECT data FROM guilds WHERE id = ?', guild_id)
+
+    def channel(self, channel_id: int) -> typing.Optional[ChannelRecord]:
+        return self._one(ChannelRecord, 'SELECT data FROM channels WHERE id = ?', channel_id)
+
+    def channels(self, guild_id: int) -> typing.List[ChannelRecord]:
+        return self._all(ChannelRecord, 'SELECT data FROM channels WHERE guild_id = ?', guild_id)
+
+    def children(self, parent_id: int) -> typing.List[ChannelRecord]:
+        return self._all(
+            ChannelRecord,
+            'SELECT data FROM channels WHERE parent_id = ? ORDER BY position, id',
+            parent_id,
+        )
+
+    def role(self, role_id: int) -> typing.Optional[RoleRecord]:
+        return self._one(RoleRecord, 'SELECT data FROM roles WHERE id = ?', role_id)
+
+    def roles(self, guild_id: int) -> typing.List[RoleRecord]:
+        return self._all(RoleRecord, 'SELECT data FROM roles WHERE guild_id = ?', guild_id)
+
+    def member(self, guild_id: int, user_id: int) -> typing.Optional[MemberRecord]:
+        return self._one(
+            MemberRecord,
+            'SELECT data FROM members WHERE guild_id = ? AND user_id = ?',
+            guild_id,
+            user_id,
+        )
+
+    def members(self, guild_id: int) -> typing.List[MemberRecord]:
+        return self._all(MemberRecord, 'SELECT data FROM members WHERE guild_id = ?', guild_id)
+
+    def user(self, user_id: int) -> typing.Optional[User]:
+        row = self._connection.execute(
+            'SELECT data FROM users WHERE id = ?', (user_id,)
+        ).fetchone()
+        return None if row is None else self.converter.structure(marshal.loads(row[0]), User)
+
+    def _one(self, cls: typing.Type[T], query: str, *args: int) -> typing.Optional[T]:
+        row = self._connection.execute(query, args).fetchone()
+        return None if row is None else decode_record(cls, row[0])
+
+    def _all(self, cls: typing.Type[T], query: str, *args: int) -> typing.List[T]:
+        return [decode_record(cls, data) for data, in self._connection.execute(query, args)]
@@ -0,0 +1,774 @@
+"""An in-memory cache of guild state, kept up to date from a `Substrate`.
+
+Only the kinds of entities in `Cache.entities` are stored, and only the events
+those need are listened to, so you only pay for what you use. Every lookup is
+a dict lookup by snowflake.
+"""
+from __future__ import annotations
+
+import bisect
+import enum
+import itertools
+import typing
+
+import attr
+import httpx
+import trio
+
+import bloom.ll.cache.members as members
+import bloom.ll.cache.records as records
+import bloom.ll.models.gateway as gateway_models
+import bloom.ll.substrate as subs
+from bloom.ll.cache.users import UserInterner
+from bloom.ll.models.base import UNKNOWN_TYPE, Snowflake, Unknownish
+from bloom.ll.models.channel import Channel, ThreadMember
+from bloom.ll.models.emoji import Emoji
+from bloom.ll.models.guild import Guild, GuildMember
+from bloom.ll.models.sticker import Sticker
+from bloom.ll.models.user import User
+from bloom.ll.ratelimits import RatelimitingState
+from bloom.ll.rest.raw import RawRest
+
+if typing.TYPE_CHECKING:
+    import trio_typing
+
+T = typing.TypeVar('T')
+
+
+class Entities(enum.IntFlag):
+    """Kinds of entities a `Cache` can store."""
+
+    GUILDS = 1 << 0
+    CHANNELS = 1 << 1
+    THREADS = 1 << 2
+    ROLES = 1 << 3
+    MEMBERS = 1 << 4
+    EMOJIS = 1 << 5
+    STICKERS = 1 << 6
+    VOICE_STATES = 1 << 7
+
+    ALL = GUILDS | CHANNELS | THREADS | ROLES | MEMBERS | EMOJIS | STICKERS | VOICE_STATES
+
+
+@attr.define()
+class _Store(typing.Generic[T]):
+    # entities by id, plus the ids in each guild so they can be listed (and
+    # dropped along with the guild).
+    items: typing.Dict[int, T] = attr.Factory(dict)
+    guilds: typing.Dict[int, typing.Set[int]] = attr.Factory(dict)
+
+    def put(self, guild_id: typing.Optional[int], id: int, item: T) -> None:
+        self.items[id] = item
+        if guild_id is not None:
+            self.guilds.setdefault(guild_id, set()).add(id)
+
+    def pop(self, guild_id: typing.Optional[int], id: int) -> None:
+        self.items.pop(id, None)
+        if guild_id is not None and guild_id in self.guilds:
+            self.guilds[guild_id].discard(id)
+
+    def of_guild(self, guild_id: int) -> typing.List[T]:
+        return [self.items[id] for id in self.guilds.get(guild_id, ())]
+
+    def drop_guild(self, guild_id: int) -> None:
+        for id in self.guilds.pop(guild_id, ()):
+            self.items.pop(id, None)
+
+    def replace_guild(self, guild_id: int, items: typing.Iterable[typing.Tuple[int, T]]) -> None:
+        self.drop_guild(guild_id)
+        for id, item in items:
+            self.put(guild_id, id, item)
+
+
+@attr.define()
+class _ChannelStore(_Store[records.ChannelRecord]):
+    # parent id -> sorted (position, id) of its children
+    children: typing.Dict[int, typing.List[typing.Tuple[int, int]]] = attr.Factory(dict)
+
+    def put(self, guild_id: typing.Optional[int], id: int, item: records.ChannelRecord) -> None:
+        old = self.items.get(id)
+        if old is not None:
+            self._unlink(old)
+
+        super().put(guild_id, id, item)
+        if item.parent_id is not None:
+            bisect.insort(self.children.setdefault(item.parent_id, []), (item.position, id))
+
+    def pop(self, guild_id: typing.Optional[int], id: int) -> None:
+        old = self.items.get(id)
+        if old is not None:
+            self._unlink(old)
+
+        super().pop(guild_id, id)
+
+    def drop_guild(self, guild_id: int) -> None:
+        for id in self.guilds.get(guild_id, ()):
+            old = self.items.get(id)
+            if old is not None:
+                self._unlink(old)
+
+        super().drop_guild(guild_id)
+
+    def in_parent(self, parent_id: int) -> typing.List[records.ChannelRecord]:
+        return [self.items[id] for _, id in self.children.get(parent_id, ())]
+
+    def _unlink(self, item: records.ChannelRecord) -> None:
+        if item.parent_id is None:
+            return
+
+        children = self.children[item.parent_id]
+        del children[bisect.bisect_left(children, (item.position, item.id))]
+        if not children:
+            del self.children[item.parent_id]
+
+
+def _known(value: Unknownish[T]) -> typing.Optional[T]:
+    return None if isinstance(value, UNKNOWN_TYPE) else value
+
+
+@attr.frozen()
+class CacheRestored:
+    """Passed to `Cache.listeners` when guilds were filled in some other
+    way than applying events, e.g. by `Snapshot.restore`. Listeners should
+    rebuild whatever they keep for those guilds from the cache."""
+
+    guild_ids: typing.FrozenSet[int]
+
+
+@attr.define()
+class Cache:
+    """Guild state, updated by `apply`-ing gateway events to it.
+
+    `run` does that for every relevant event broadcast to a substrate. Guilds,
+    channels, roles and members are stored as the compact records from
+    `bloom.ll.cache.records`, and members' users are stored once, however many
+    guilds they are in.
+
+    Lookups by something other than id (`members_with_role`, `children`,
+    `voice_states`) use indexes kept up to date as events are applied, so
+    they cost as much as what they return.
+    """
+
+    #: what to store
+    entities: Entities = Entities.ALL
+    #: which members to store
+    member_policy: members.MemberPolicy = attr.Factory(members.MemberPolicy)
+    #: how well the member policy is doing
+    member_stats: members.MemberCacheStats = attr.Factory(members.MemberCacheStats)
+    #: shares users with everything else using the interner
+    user_interner: UserInterner = attr.Factory(UserInterner)
+    #: called with every event the cache applied, after applying it (or a
+    #: `CacheRestored`); this is how indexes over the cache stay up to date
+    listeners: typing.List[typing.Callable[[object], None]] = attr.Factory(list)
+
+    _guilds: typing.Dict[int, records.GuildRecord] = attr.Factory(dict)
+    _channels: _ChannelStore = attr.Factory(_ChannelStore)
+    _threads: _ChannelStore = attr.Factory(_ChannelStore)
+    _roles: _Store[records.RoleRecord] = attr.Factory(_Store)
+    _emojis: _Store[Emoji] = attr.Factory(_Store)
+    _stickers: _Store[Sticker] = attr.Factory(_Store)
+    # guild id -> user id -> member
+    _members: typing.Dict[int, typing.Dict[int, records.MemberRecord]] = attr.Factory(dict)
+    # user id -> (user, how many cached members are that user)
+    _users: typing.Dict[int, typing.Tuple[User, int]] = attr.Factory(dict)
+    # role id -> ids of the cached members with it
+    _role_members: typing.Dict[int, typing.Set[int]] = attr.Factory(dict)
+    # guild id -> user id -> voice state, and the same by channel id
+    _voice_guilds: typing.Dict[int, typing.Dict[int, records.VoiceStateRecord]] = attr.Factory(
+        dict
+    )
+    _voice_channels: typing.Dict[int, typing.Dict[int, records.VoiceStateRecord]] = attr.Factory(
+        dict
+    )
+    # thread id -> ids of the thread members that were sent
+    _thread_members: typing.Dict[int, typing.Set[int]] = attr.Factory(dict)
+    # nonce -> (set when the chunk arrives, the members in it)
+    _chunk_waiters: typing.Dict[str, typing.Tuple[trio.Event, typing.List[GuildMember]]] = (
+        attr.Factory(dict)
+    )
+    _nonces: typing.Iterator[int] = attr.Factory(itertools.count)
+
+    def guild(self, guild_id: int) -> typing.Optional[records.GuildRecord]:
+        return self._guilds.get(guild_id)
+
+    def channel(self, channel_id: int) -> typing.Optional[records.ChannelRecord]:
+        return self._channels.items.get(channel_id)
+
+    def thread(self, thread_id: int) -> typing.Optional[records.ChannelRecord]:
+        return self._threads.items.get(thread_id)
+
+    def role(self, role_id: int) -> typing.Optional[records.RoleRecord]:
+        return self._roles.items.get(role_id)
+
+    def emoji(self, emoji_id: int) -> typing.Optional[Emoji]:
+        return self._emojis.items.get(emoji_id)
+
+    def sticker(self, sticker_id: int) -> typing.Optional[Sticker]:
+        return self._stickers.items.get(sticker_id)
+
+    def member(self, guild_id: int, user_id: int) -> typing.Optional[records.MemberRecord]:
+        member = self._members.get(guild_id, {}).get(user_id)
+
+        if member is None:
+            self.member_stats.misses += 1
+        else:
+            self.member_stats.hits += 1
+            self.member_policy.accessed(guild_id, user_id)
+
+        return member
+
+    def put_members(
+        self,
+        guild_id: int,
+        entries: typing.Iterable[typing.Tuple[records.MemberRecord, User]],
+    ) -> None:
+        """Store members of a guild and their users, as far as the member
+        policy admits them.
+
+        This is what applying events that carry members does. Listeners
+        aren't told, so pass them a `CacheRestored` for bulk loads.
+        """
+        guild_id = int(guild_id)
+        cached = self._members.setdefault(guild_id, {})
+        # the default policy admits everyone and keeps no books
+        admit_all = type(self.member_policy) is members.MemberPolicy
+
+        for record, user in entries:
+            user_id = record.user_id
+
+            if not admit_all and not self.member_policy.admit(guild_id, record):
+                if user_id in cached:
+                    self._remove_member(guild_id, user_id)
+                    self.member_stats.evictions += 1
+                continue
+
+            refs = self._users.get(user_id, (None, 0))[1]
+            old = cached.get(user_id)
+            if old is None:
+                refs += 1
+
+            cached[user_id] = record
+            self._index_roles(user_id, () if old is None else old.roles, record.roles)
+            self._users[user_id] = (self.user_interner.intern(user), refs)
+            if not admit_all:
+                self.member_policy.stored(guild_id, record)
+
+        self._evict()
+
+    def peek_member(self, guild_id: int, user_id: int) -> typing.Optional[records.MemberRecord]:
+        """Like `member`, but not counted in `member_stats` or shown to the
+        member policy. This is for indexes over the cache, whose lookups
+        aren't the member being used."""
+        return self._members.get(guild_id, {}).get(user_id)
+
+    async def fetch_member(
+        self,
+        guild_id: int,
+        user_id: int,
+        *,
+        rest: typing.Optional[RatelimitingState] = None,
+        request_members: typing.Optional[
+            typing.Callable[[gateway_models.GuildRequestMembers], typing.Awaitable[None]]
+        ] = None,
+        timeout: float = 10,
+    ) -> typing.Optional[records.MemberRecord]:
+        """Look up a member, and if it isn't cached, do what the member
+        policy's ``on_miss`` says.
+
+        Fetching from the gateway needs ``request_members`` to send the
+        request on the right shard, and fetching from the REST API needs
+        ``rest``. The member is cached afterwards if the policy admits it.
+        """
+        cached = self.member(guild_id, user_id)
+        if cached is not None:
+            return cached
+
+        found: typing.List[GuildMember] = []
+        on_miss = self.member_policy.on_miss
+
+        if on_miss is members.OnMiss.REST and rest is not None:
+            request = RawRest(rest.converter).get_guild_member(
+                Snowflake(guild_id), Snowflake(user_id)
+            )
+            try:
+                found.append(await rest.request(request))
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+        elif on_miss is members.OnMiss.REQUEST_CHUNK and request_members is not None:
+            nonce = str(next(self._nonces))
+            done = trio.Event()
+            self._chunk_waiters[nonce] = (done, found)
+
+            try:
+                await request_members(
+                    gateway_models.GuildRequestMembers(
+                        guild_id=Snowflake(guild_id),
+                        limit=None,
+                        user_ids=Snowflake(user_id),
+                        nonce=nonce,
+                    )
+                )
+                with trio.move_on_after(timeout):
+                    await done.wait()
+            finally:
+                del self._chunk_waiters[nonce]
+
+        if not found:
+            return None
+
+        if self.entities & Entities.MEMBERS:
+            self._put_members(guild_id, found)
+
+        return records.MemberRecord.from_model(user_id, found[0])
+
+    def user(self, user_id: int) -> typing.Optional[User]:
+        """The user of a cached member."""
+        entry = self._users.get(user_id)
+        return None if entry is None else entry[0]
+
+    def channels(self, guild_id: int) -> typing.List[records.ChannelRecord]:
+        return self._channels.of_guild(guild_id)
+
+    def threads(self, guild_id: int) -> typing.List[records.ChannelRecord]:
+        return self._threads.of_guild(guild_id)
+
+    def roles(self, guild_id: int) -> typing.List[records.RoleRecord]:
+        return self._roles.of_guild(guild_id)
+
+    def emojis(self, guild_id: int) -> typing.List[Emoji]:
+        return self._emojis.of_guild(guild_id)
+
+    def stickers(self, guild_id: int) -> typing.List[Sticker]:
+        return self._stickers.of_guild(guild_id)
+
+    def members(self, guild_id: int) -> typing.Collection[records.MemberRecord]:
+        return self._members.get(guild_id, {}).values()
+
+    def members_with_role(self, guild_id: int, role_id: int) -> typing.AbstractSet[int]:
+        """The ids of the cached members with a role. This is a live view, so
+        copy it to keep it across events."""
+        if role_id == guild_id:
+            # everyone has @everyone
+            return self._members.get(guild_id, {}).keys()
+        return self._role_members.get(role_id, set())
+
+    def children(self, parent_id: int) -> typing.List[records.ChannelRecord]:
+        """The channels in a category, or the threads in a channel, sorted by
+        position."""
+        return self._channels.in_parent(parent_id) + self._threads.in_parent(parent_id)
+
+    def active_threads(self, channel_id: int) -> typing.List[records.ChannelRecord]:
+        """The unarchived threads in a channel, sorted by position."""
+        return self._threads.in_parent(channel_id)
+
+    def thread_members(self, thread_id: int) -> typing.AbstractSet[int]:
+        """The ids of a thread's members, of the ones that were sent: the bot
+        itself, and with the ``GUILD_MEMBERS`` intent, everyone who joined
+        or left since the thread was cached."""
+        return self._thread_members.get(thread_id, set())
+
+    def voice_state(
+        self, guild_id: int, user_id: int
+    ) -> typing.Optional[records.VoiceStateRecord]:
+        return self._voice_guilds.get(guild_id, {}).get(user_id)
+
+    def voice_states(self, channel_id: int) -> typing.Collection[records.VoiceStateRecord]:
+        """The voice states of the users connected to a voice channel."""
+        return self._voice_channels.get(channel_id, {}).values()
+
+    def event_types(self) -> typing.List[typing.Type[typing.Any]]:
+        """The gateway events that can change what this cache stores."""
+        return [typ for typ, (entities, _) in _HANDLERS.items() if entities & self.entities]
+
+    def apply(self, event: object) -> None:
+        handler = _HANDLERS.get(type(event))
+        if handler is not None and handler[0] & self.entities:
+            handler[1](self, event)
+
+            for listener in self.listeners:
+                listener(event)
+
+    async def run(
+        self,
+        substrate: subs.Substrate,
+        *,
+        buffer_size: typing.Optional[int] = 1024,
+        task_status: trio_typing.TaskStatus[None] = trio.TASK_STATUS_IGNORED,
+    ) -> None:
+        """Apply events broadcast to ``substrate`` until cancelled."""
+        types = self.event_types()
+        recv = substrate.register_many(types, buffer_size)
+
+        try:
+            task_status.started()
+            async for event in recv:
+                self.apply(event)
+        finally:
+            substrate.unregister_many(types, recv)
+
+    def _guild_create(self, event: gateway_models.GuildCreateEvent) -> None:
+        guild_id = int(event.id)
+
+        if self.entities & Entities.GUILDS:
+            self._guilds[guild_id] = records.GuildRecord.from_model(event)
+        if self.entities & Entities.CHANNELS and not isinstance(event.channels, UNKNOWN_TYPE):
+            self._channels.replace_guild(guild_id, _channels(event.channels, guild_id))
+        if self.entities & Entities.THREADS and not isinstance(event.threads, UNKNOWN_TYPE):
+            self._forget_thread_members(self._threads.guilds.get(guild_id, ()))
+            self._threads.replace_guild(guild_id, _channels(event.threads, guild_id))
+        if self.entities & Entities.STICKERS and not isinstance(event.stickers, UNKNOWN_TYPE):
+            self._stickers.replace_guild(guild_id, ((s.id, s) for s in event.stickers))
+        if self.entities & Entities.VOICE_STATES and not isinstance(
+            event.voice_states, UNKNOWN_TYPE
+        ):
+            self._drop_voice_states(guild_id)
+            for state in event.voice_states:
+                if state.get('channel_id') is not None:
+                    self._put_voice_state(records.VoiceStateRecord.from_payload(guild_id, state))
+        if self.entities & Entities.MEMBERS and not isinstance(event.members, UNKNOWN_TYPE):
+            self._drop_members(guild_id)
+
+            # so the member policy knows who's in voice before seeing them.
+            for state in _known(event.voice_states) or ():
+                self.member_policy.voice_state(
+                    guild_id, int(state['user_id']), _optional_int(state.get('channel_id'))
+                )
+
+            self._put_members(guild_id, event.members)
+
+        self._guild_roles_and_emojis(event)
+
+    def _guild_update(self, event: gateway_models.GuildUpdateEvent) -> None:
+        old = self._guilds.get(event.id)
+
+        if self.entities & Entities.GUILDS:
+            guild = records.GuildRecord.from_model(event)
+
+            if old is not None:
+                # these are only sent in GUILD_CREATE.
+                guild.member_count = old.member_count
+                guild.joined_at = old.joined_at
+                guild.flags |= old.flags & records.GuildFlags.LARGE
+
+            self._guilds[guild.id] = guild
+
+        self._guild_roles_and_emojis(event)
+
+    def _guild_roles_and_emojis(self, guild: Guild) -> None:
+        if self.entities & Entities.ROLES:
+            self._roles.replace_guild(
+                guild.id, ((r.id, records.RoleRecord.from_model(guild.id, r)) for r in guild.roles)
+            )
+        if self.entities & Entities.EMOJIS:
+            self._emojis.replace_guild(guild.id, _custom_emojis(guild.emojis))
+
+    def _guild_delete(self, event: gateway_models.GuildDeleteEvent) -> None:
+        guild = self._guilds.pop(event.id, None)
+
+        # an outage; everything will be sent again in a GUILD_CREATE.
+        if event.unavailable and guild is not None:
+            guild.flags |= records.GuildFlags.UNAVAILABLE
+            self._guilds[guild.id] = guild
+
+        self._forget_thread_members(self._threads.guilds.get(event.id, ()))
+        for store in self._stores():
+            store.drop_guild(event.id)
+        self._drop_members(event.id)
+        self._drop_voice_states(event.id)
+
+    def _stores(self) -> typing.List[_Store[typing.Any]]:
+        return [self._channels, self._threads, self._roles, self._emojis, self._stickers]
+
+    def _channel_create(self, event: Channel) -> None:
+        channel = records.ChannelRecord.from_model(event)
+        self._channels.put(channel.guild_id, channel.id, channel)
+
+    def _channel_delete(self, event: gateway_models.ChannelDeleteEvent) -> None:
+        self._channels.pop(_known(event.guild_id), event.id)
+
+    def _thread_create(self, event: Channel) -> None:
+        thread = records.ChannelRecord.from_model(event)
+        self._put_thread(thread.id, thread)
+
+    def _put_thread(self, thread_id: int, thread: records.ChannelRecord) -> None:
+        # only active threads are kept; archived ones are sent again if
+        # they're unarchived.
+        if thread.flags & records.ChannelFlags.ARCHIVED:
+            self._threads.pop(thread.guild_id, thread_id)
+            self._thread_members.pop(thread_id, None)
+        else:
+            self._threads.put(thread.guild_id, thread_id, thread)
+
+    def _thread_delete(self, event: gateway_models.ThreadDeleteEvent) -> None:
+        self._threads.pop(_known(event.guild_id), event.id)
+        self._thread_members.pop(event.id, None)
+
+    def _thread_list_sync(self, event: gateway_models.ThreadListSyncEvent) -> None:
+        synced = {int(thread.id) for thread in event.threads}
+
+        # threads in the synced channels that weren't sent aren't active.
+        if isinstance(event.channel_ids, UNKNOWN_TYPE):
+            stale = [id for id in self._threads.guilds.get(event.guild_id, ()) if id not in synced]
+        else:
+            stale = [
+                thread.id
+                for channel_id in event.channel_ids
+                for thread in self._threads.in_parent(channel_id)
+                if thread.id not in synced
+            ]
+        for id in stale:
+            self._threads.pop(event.guild_id, id)
+        self._forget_thread_members(stale)
+
+        for id, thread in _channels(event.threads, event.guild_id):
+            self._put_thread(id, thread)
+        for member in event.members:
+            self._add_thread_member(member)
+
+    def _thread_member_update(self, event: gateway_models.ThreadMemberUpdateEvent) -> None:
+        self._add_thread_member(event)
+
+    def _thread_members_update(self, event: gateway_models.ThreadMembersUpdateEvent) -> None:
+        thread = self._threads.items.get(event.id)
+        if thread is None:
+            return
+
+        thread.member_count = event.member_count
+        for member in _known(event.added_members) or ():
+            self._add_thread_member(member, event.id)
+
+        members = self._thread_members.get(event.id)
+        if members is not None:
+            members.difference_update(_known(event.removed_member_ids) or ())
+
+    def _add_thread_member(
+        self, member: ThreadMember, thread_id: typing.Optional[int] = None
+    ) -> None:
+        thread_id = _known(member.id) or thread_id
+        user_id = _known(member.user_id)
+        if thread_id in self._threads.items and user_id is not None:
+            self._thread_members.setdefault(thread_id, set()).add(user_id)
+
+    def _forget_thread_members(self, thread_ids: typing.Iterable[int]) -> None:
+        for id in thread_ids:
+            self._thread_members.pop(id, None)
+
+    def _role_create(
+        self,
+        event: typing.Union[
+            gateway_models.GuildRoleCreateEvent, gateway_models.GuildRoleUpdateEvent
+        ],
+    ) -> None:
+        role = records.RoleRecord.from_model(event.guild_id, event.role)
+        self._roles.put(role.guild_id, role.id, role)
+
+    def _role_delete(self, event: gateway_models.GuildRoleDeleteEvent) -> None:
+        self._roles.pop(event.guild_id, event.role_id)
+        # members lose the role without their own update.
+        self._role_members.pop(event.role_id, None)
+
+    def _member_add(self, event: gateway_models.GuildMemberAddEvent) -> None:
+        self._count_member(event.guild_id, 1)
+
+        if self.entities & Entities.MEMBERS:
+            self._put_members(event.guild_id, [event])
+
+    def _member_remove(self, event: gateway_models.GuildMemberRemoveEvent) -> None:
+        self._count_member(event.guild_id, -1)
+
+        if self.entities & Entities.MEMBERS:
+            self._remove_member(event.guild_id, event.user.id)
+
+    def _count_member(self, guild_id: int, delta: int) -> None:
+        guild = self._guilds.get(guild_id)
+        if guild is not None and guild.member_count is not None:
+            guild.member_count += delta
+
+    def _member_update(self, event: gateway_models.GuildMemberUpdateEvent) -> None:
+        member = self._members.get(event.guild_id, {}).get(event.user.id)
+
+        # there isn't enough in an update to make a member from scratch.
+        if member is None:
+            return
+
+        roles = member.roles
+        member.update(event)
+        self._index_roles(member.user_id, roles, member.roles)
+
+        if self.member_policy.admit(event.guild_id, member):
+            user = self.user_interner.intern(event.user)
+            self._users[member.user_id] = (user, self._users[member.user_id][1])
+            self.member_policy.stored(event.guild_id, member)
+        else:
+            self._remove_member(event.guild_id, member.user_id)
+            self.member_stats.evictions += 1
+
+        self._evict()
+
+    def _members_chunk(self, event: gateway_models.GuildMembersChunkEvent) -> None:
+        waiter = self._chunk_waiters.get(_known(event.nonce) or '')
+        if waiter is not None:
+            waiter[1].extend(event.members)
+            waiter[0].set()
+
+        self._put_members(event.guild_id, event.members)
+
+    def _voice_state_update(self, event: gateway_models.VoiceStateUpdateEvent) -> None:
+        guild_id = _known(event.guild_id)
+        if guild_id is None:
+            return
+
+        if self.entities & Entities.VOICE_STATES:
+            self._pop_voice_state(guild_id, event.user_id)
+            if event.channel_id is not None:
+                self._put_voice_state(records.VoiceStateRecord.from_model(guild_id, event))
+
+        if not self.entities & Entities.MEMBERS:
+            return
+
+        self.member_policy.voice_state(guild_id, event.user_id, event.channel_id)
+
+        if event.channel_id is not None and not isinstance(event.member, UNKNOWN_TYPE):
+            self._put_members(guild_id, [event.member])
+        else:
+            self._evict()
+
+    def _put_voice_state(self, state: records.VoiceStateRecord) -> None:
+        self._voice_guilds.setdefault(state.guild_id, {})[state.user_id] = state
+        self._voice_channels.setdefault(state.channel_id, {})[state.user_id] = state
+
+    def _pop_voice_state(self, guild_id: int, user_id: int) -> None:
+        state = self._voice_guilds.get(guild_id, {}).pop(user_id, None)
+        if state is not None:
+            self._unlink_voice_state(state)
+
+    def _drop_voice_states(self, guild_id: int) -> None:
+        for state in self._voice_guilds.pop(guild_id, {}).values():
+            self._unlink_voice_state(state)
+
+    def _unlink_voice_state(self, state: records.VoiceStateRecord) -> None:
+        channel = self._voice_channels[state.channel_id]
+        del channel[state.user_id]
+        if not channel:
+            del self._voice_channels[state.channel_id]
+
+    def _put_members(self, guild_id: int, members: typing.Iterable[GuildMember]) -> None:
+        self.put_members(
+            guild_id,
+            (
+                (records.MemberRecord.from_model(member.user.id, member), member.user)
+                for member in members
+                # members in GUILD_CREATE, chunks and GUILD_MEMBER_ADD always
+                # have a user.
+                if not isinstance(member.user, UNKNOWN_TYPE)
+            ),
+        )
+
+    def _evict(self) -> None:
+        for guild_id, user_id in self.member_policy.evictions():
+            self._remove_member(guild_id, user_id)
+            self.member_stats.evictions += 1
+
+    def _remove_member(self, guild_id: int, user_id: int) -> None:
+        member = self._members.get(guild_id, {}).pop(user_id, None)
+        if member is not None:
+            self._index_roles(user_id, member.roles, ())
+            self._release_user(user_id)
+            self.member_policy.removed(guild_id, user_id)
+
+    def _drop_members(self, guild_id: int) -> None:
+        for user_id, member in self._members.pop(guild_id, {}).items():
+            self._index_roles(user_id, member.roles, ())
+            self._release_user(user_id)
+            self.member_policy.removed(guild_id, user_id)
+
+    def _index_roles(
+        self, user_id: int, old: typing.Iterable[int], new: typing.Iterable[int]
+    ) -> None:
+        if not old:
+            # new members, which is most of them
+            for role_id in new:
+                self._role_members.setdefault(role_id, set()).add(user_id)
+            return
+
+        removed, added = set(old), set(new)
+        removed, added = removed - added, added - removed
+
+        for role_id in removed:
+            holders = self._role_members.get(role_id)
+            if holders is not None:
+                holders.discard(user_id)
+                if not holders:
+                    del self._role_members[role_id]
+        for role_id in added:
+            self._role_members.setdefault(role_id, set()).add(user_id)
+
+    def _release_user(self, user_id: int) -> None:
+        user, refs = self._users[user_id]
+        if refs == 1:
+            del self._users[user_id]
+        else:
+            self._users[user_id] = (user, refs - 1)
+
+    def _emojis_update(self, event: gateway_models.GuildEmojisUpdateEvent) -> None:
+        self._emojis.replace_guild(event.guild_id, _custom_emojis(event.emojis))
+
+    def _stickers_update(self, event: gateway_models.GuildStickersUpdateEvent) -> None:
+        self._stickers.replace_guild(event.guild_id, ((s.id, s) for s in event.stickers))
+
+
+def _optional_int(value: typing.Optional[str]) -> typing.Optional[int]:
+    return None if value is None else int(value)
+
+
+def _channels(
+    channels: typing.List[Channel], guild_id: int
+) -> typing.Iterator[typing.Tuple[int, records.ChannelRecord]]:
+    # channels in GUILD_CREATE don't have a guild id.
+    for channel in channels:
+        yield channel.id, records.ChannelRecord.from_model(channel, guild_id)
+
+
+def _custom_emojis(emojis: typing.List[Emoji]) -> typing.Iterator[typing.Tuple[int, Emoji]]:
+    return ((e.id, e) for e in emojis if e.id is not None)
+
+
+# event type -> (what it can change, how to apply it)
+_HANDLERS: typing.Dict[
+    typing.Type[typing.Any],
+    typing.Tuple[Entities, typing.Callable[[Cache, typing.Any], None]],
+] = {
+    # a guild's other entities arrive in GUILD_CREATE and go away with it.
+    gateway_models.GuildCreateEvent: (Entities.ALL, Cache._guild_create),
+    gateway_models.GuildUpdateEvent: (
+        Entities.GUILDS | Entities.ROLES | Entities.EMOJIS,
+        Cache._guild_update,
+    ),
+    gateway_models.GuildDeleteEvent: (Entities.ALL, Cache._guild_delete),
+    gateway_models.ChannelCreateEvent: (Entities.CHANNELS, Cache._channel_create),
+    gateway_models.ChannelUpdateEvent: (Entities.CHANNELS, Cache._channel_create),
+    gateway_models.ChannelDeleteEvent: (Entities.CHANNELS, Cache._channel_delete),
+    gateway_models.ThreadCreateEvent: (Entities.THREADS, Cache._thread_create),
+    gateway_models.ThreadUpdateEvent: (Entities.THREADS, Cache._thread_create),
+    gateway_models.ThreadDeleteEvent: (Entities.THREADS, Cache._thread_delete),
+    gateway_models.ThreadListSyncEvent: (Entities.THREADS, Cache._thread_list_sync),
+    gateway_models.ThreadMemberUpdateEvent: (Entities.THREADS, Cache._thread_member_update),
+    gateway_models.ThreadMembersUpdateEvent: (Entities.THREADS, Cache._thread_members_update),
+    gateway_models.GuildRoleCreateEvent: (Entities.ROLES, Cache._role_create),
+    gateway_models.GuildRoleUpdateEvent: (Entities.ROLES, Cache._role_create),
+    gateway_models.GuildRoleDeleteEvent: (Entities.ROLES, Cache._role_delete),
+    gateway_models.GuildMemberAddEvent: (Entities.GUILDS | Entities.MEMBERS, Cache._member_add),
+    gateway_models.GuildMemberRemoveEvent: (
+        Entities.GUILDS | Entities.MEMBERS,
+        Cache._member_remove,
+    ),
+    gateway_models.GuildMemberUpdateEvent: (Entities.MEMBERS, Cache._member_update),
+    gateway_models.GuildMembersChunkEvent: (Entities.MEMBERS, Cache._members_chunk),
+    gateway_models.VoiceStateUpdateEvent: (
+        Entities.MEMBERS | Entities.VOICE_STATES,
+        Cache._voice_state_update,
+    ),
+    gateway_models.GuildEmojisUpdateEvent: (Entities.EMOJIS, Cache._emojis_update),
+    gateway_models.GuildStickersUpdateEvent: (Entities.STICKERS, Cache._stickers_update),
+}
@@ -0,0 +1,96 @@
+"""Share one `User` instance between every event and cache entry for a user.
+
+The same user is sent in every message they author, every mention of them
+and every member entry for every guild they share with the bot. A
+`UserInterner` installed on a converter makes payloads with the same id and
+the same fields structure to the same instance, which skips structuring
+entirely for repeated users and means caches don't keep thousands of copies
+of the same object.
+
+Users are only kept while something else references them.
+"""
+from __future__ import annotations
+
+import typing
+import weakref
+
+import attr
+from cattr import Converter
+from cattr.gen import make_dict_structure_fn
+
+from bloom.ll.models.user import User
+
+# (user id, hash of the rest of the fields)
+_Key = typing.Tuple[int, int]
+
+
+def _fingerprint(data: typing.Mapping[str, object]) -> typing.Optional[int]:
+    # every field of a user is a scalar, so this only fails for junk.
+    try:
+        return hash(tuple(data.items()))
+    except TypeError:
+        return None
+
+
+@attr.define()
+class UserInterner:
+    #: payloads (or users) that resolved to an existing instance
+    hits: int = attr.field(default=0, init=False)
+    #: payloads (or users) that didn't
+    misses: int = attr.field(default=0, init=False)
+
+    # users are in here under a hash of the user, and if they were structured
+    # here, also under a hash of the payload.
+    _users: weakref.WeakValueDictionary[_Key, User] = attr.field(
+        factory=weakref.WeakValueDictionary, init=False
+    )
+    _structure: typing.Optional[typing.Callable[[typing.Any, typing.Any], User]] = attr.field(
+        default=None, init=False
+    )
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def install(self, converter: Converter) -> None:
+        """Structure users with ``converter`` through this interner.
+
+        This has to happen before ``converter`` structures anything that
+        contains a user, since cattrs remembers the hooks of nested types.
+        """
+        self._structure = make_dict_structure_fn(User, converter)
+        converter.register_structure_hook(User, self.structure)
+
+    def structure(self, data: typing.Mapping[str, typing.Any], _: object = None) -> User:
+        """A cattrs structure hook for `User`."""
+        fingerprint = _fingerprint(data)
+        if fingerprint is None:
+            return self.intern(self._structure_new(data))
+
+        key = (int(data['id']), fingerprint)
+        user = self._users.get(key)
+
+        if user is None:
+            user = self.intern(self._structure_new(data))
+            self._users[key] = user
+        else:
+            self.hits += 1
+
+        return user
+
+    def intern(self, user: User) -> User:
+        """The shared instance that is equal to ``user``."""
+        key = (int(user.id), hash(user))
+        shared = self._users.get(key)
+
+        if shared is None or shared != user:
+            self.misses += 1
+            self._users[key] = user
+            return user
+
+        self.hits += 1
+        return shared
+
+    def _structure_new(self, data: typing.Mapping[str, typing.Any]) -> User:
+        if self._structure is None:
+            raise RuntimeError('install() the interner on a converter first')
+        return self._structure(data, User)
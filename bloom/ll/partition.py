@@ -0,0 +1,95 @@
+"""Ordered per-key event processing on top of a `Substrate`.
+
+Events are spread over a fixed number of workers by hashing a key (say, the
+guild id). Events with the same key always land on the same worker, so they
+are handled in order, while different keys are handled concurrently.
+"""
+from __future__ import annotations
+
+import operator
+import typing
+
+import attr
+import trio
+
+import bloom.ll.substrate as subs
+
+T = typing.TypeVar('T')
+
+
+@attr.define()
+class PartitionStats:
+    #: events waiting in this partition's queue
+    backlog: int = 0
+    #: events this partition's worker has finished handling
+    handled: int = 0
+
+
+def _to_key(
+    key: typing.Union[str, typing.Callable[[T], typing.Hashable]],
+) -> typing.Callable[[T], typing.Hashable]:
+    if isinstance(key, str):
+        return operator.attrgetter(key)
+    return key
+
+
+@attr.define()
+class Partitioned(typing.Generic[T]):
+    """Handle events of type ``typ`` with ``handler`` across ``partitions``
+    worker tasks, keyed by ``key`` (an attribute name or a function).
+
+    Each partition has its own queue of ``buffer_size`` events. When one is
+    full, dispatch waits, which backpressures the substrate as usual.
+    """
+
+    substrate: subs.Substrate
+    typ: typing.Type[T]
+    handler: typing.Callable[[T], typing.Awaitable[None]]
+    key: typing.Callable[[T], typing.Hashable] = attr.field(converter=_to_key)
+    partitions: int = 8
+    buffer_size: int = 64
+
+    _receivers: typing.List[trio.MemoryReceiveChannel[T]] = attr.Factory(list)
+    _handled: typing.List[int] = attr.Factory(list)
+
+    def stats(self) -> typing.List[PartitionStats]:
+        return [
+            PartitionStats(recv.statistics().current_buffer_used, handled)
+            for recv, handled in zip(self._receivers, self._handled)
+        ]
+
+    def partition_of(self, event: T) -> int:
+        return hash(self.key(event)) % self.partitions
+
+    async def _worker(self, index: int, recv: trio.MemoryReceiveChannel[T]) -> None:
+        async with recv:
+            async for event in recv:
+                await self.handler(event)
+                self._handled[index] += 1
+
+    async def run(self) -> None:
+        """Dispatch events until the substrate is closed."""
+        senders: typing.List[trio.MemorySendChannel[T]] = []
+        self._receivers = []
+        self._handled = [0] * self.partitions
+
+        for _ in range(self.partitions):
+            send, recv = trio.open_memory_channel[T](self.buffer_size)
+            senders.append(send)
+            self._receivers.append(recv)
+
+        events = self.substrate.register(self.typ, self.buffer_size)
+
+        try:
+            async with trio.open_nursery() as nursery:
+                for index, recv in enumerate(self._receivers):
+                    nursery.start_soon(self._worker, index, recv)
+
+                async with events:
+                    async for event in events:
+                        await senders[self.partition_of(event)].send(event)
+
+                for send in senders:
+                    await send.aclose()
+        finally:
+            self.substrate.unregister(self.typ, events)
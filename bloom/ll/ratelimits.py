@@ -23,11 +23,15 @@ wrong. Here's the general process of ratelimiting that is used here.
 
 #. Get the bucket hash from the response, and update that bucket.
 
-It might be noted that this ignores things like global ratelimits, simply
-because those are impossible. The only correct implementation without using
+It might be noted that this doesn't try to avoid global ratelimits, simply
+because that's impossible. The only correct implementation without using
 the exact formulas Discord uses is this -- while someone may be tempted to
 hardcode a 50 req/s bucket in, this does not work for bots on large bot
-sharding.
+sharding. Instead, a 429 is handled after the fact: its ``retry_after`` is
+waited out (by every request but interaction responses, if it's global)
+and the request is retried a few times before giving up. If you do know
+your global limit (or want it guessed from global 429s), pass a
+`GlobalLimiter` to pace every request instead.
 
 Additionally, continuing the theme of trying to not run into ratelimits (like
 how requests to the route are serialized), bloom uses the Reset-After header.
@@ -39,6 +43,7 @@ from __future__ import annotations
 
 import collections
 import contextlib
+import itertools
 import math
 import typing
 
@@ -105,6 +110,118 @@ class Bucket:
             await trio.sleep_until(self.reset_at)
 
 
+@attr.define()
+class RatelimitStats:
+    #: scope (``user``, ``global`` or ``shared``) -> how many 429s had it
+    by_scope: typing.Counter[str] = attr.Factory(collections.Counter)
+    #: requests sent again after a 429
+    retries: int = 0
+    #: requests that failed with a 429 after all their retries
+    failures: int = 0
+
+
+def _is_exempt(route: str) -> bool:
+    # interaction responses (and webhooks, which interaction followups are)
+    # aren't under the bot's global limit, so requests to them neither wait
+    # for it (whether paced by a `GlobalLimiter` or after a global 429) nor
+    # count towards it.
+    return route.startswith(('/interactions/', '/webhooks/{webhook_id}/{webhook_token}'))
+
+
+def _file_positions(
+    files: typing.Mapping[str, object]
+) -> typing.Optional[typing.List[typing.Tuple[typing.IO[typing.Any], int]]]:
+    # the file objects being uploaded and where they are, or ``None`` if one
+    # can't be rewound (so the request can't be sent again).
+    positions = []
+
+    for value in files.values():
+        # httpx takes the content or a (filename, content, ...) tuple
+        content = value[1] if isinstance(value, tuple) else value
+        if isinstance(content, (bytes, str)):
+            continue
+
+        seekable = getattr(content, 'seekable', None)
+        if seekable is None or not seekable():
+            return None
+
+        stream = typing.cast(typing.IO[typing.Any], content)
+        positions.append((stream, stream.tell()))
+
+    return positions
+
+
+@attr.define()
+class GlobalLimiter:
+    """A token bucket that every request (except to interaction and webhook
+    endpoints) goes through, to stay under the global ratelimit instead of
+    finding it with a 429."""
+
+    #: requests per second, or ``None`` to not limit until a global 429
+    rate: typing.Optional[float] = None
+    #: whether global 429s lower ``rate`` to under what was being sent
+    learn: bool = True
+    #: how much a lowered ``rate`` goes back up for every minute without a
+    #: global 429, until it's back to what it was before. (if it was
+    #: ``None``, it keeps going up.)
+    recovery: float = 1.0
+
+    # tokens go negative as requests reserve the time they'll be sent at
+    _tokens: float = 0
+    _updated: float = -math.inf
+    # when the requests in the last second were sent
+    _sent: typing.Deque[float] = attr.Factory(collections.deque)
+    # the rate before global 429s lowered it and when the last one was, if
+    # it's still lowered
+    _unlearned: typing.Optional[float] = None
+    _limited_at: typing.Optional[float] = None
+
+    async def acquire(self) -> None:
+        if self._limited_at is not None:
+            self._recover()
+
+        if self.rate is not None:
+            now = trio.current_time()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens < 0:
+                await trio.sleep(-self._tokens / self.rate)
+
+        now = trio.current_time()
+        self._sent.append(now)
+        while self._sent[0] <= now - 1:
+            self._sent.popleft()
+
+    def limited(self) -> None:
+        """Note a global 429."""
+        if not self.learn:
+            return
+
+        if self._limited_at is None:
+            self._unlearned = self.rate
+        else:
+            self._recover()
+
+        sent = len(self._sent)
+        self.rate = max(1.0, 0.9 * (sent if self.rate is None else min(self.rate, sent)))
+        self._tokens = 0
+        self._updated = self._limited_at = trio.current_time()
+
+    def _recover(self) -> None:
+        assert self._limited_at is not None and self.rate is not None
+        minutes = (trio.current_time() - self._limited_at) // 60
+        if minutes < 1:
+            return
+
+        self._limited_at += minutes * 60
+        self.rate += minutes * self.recovery
+        if self._unlearned is not None and self.rate >= self._unlearned:
+            self.rate = self._unlearned
+            self._limited_at = None
+
+
 @attr.frozen()
 class RatelimitingState:
     http: HttpClientProto
@@ -125,8 +242,15 @@ class RatelimitingState:
         str, typing.Dict[typing.Optional[typing.Union[int, str]], Bucket]
     ] = attr.Factory(lambda: collections.defaultdict(lambda: {}))
 
+    #: how many times to retry a request that got a 429
+    max_retries: int = 3
+    stats: RatelimitStats = attr.Factory(lambda: RatelimitStats())
+    #: empty while a global ratelimit is in effect
+    global_bucket: Bucket = attr.Factory(lambda: Bucket(1, 0))
+    #: paces requests to stay under the global ratelimit, if passed
+    global_limiter: typing.Optional[GlobalLimiter] = None
+
     # TODO:
-    #  - basic post-hoc global rl
     #  - sublimit (add a custom bucket? based on json resp)
     #  - shared ratelimits between routes (lock on buckets)
     async def request(self, req: Request[ReturnT], *, max_sleep: float = math.inf) -> ReturnT:
@@ -139,66 +263,47 @@ class RatelimitingState:
             # str key (cause interaction's webhook id is the app id...)
             major_parameter = str(req.args['webhook_id']) + str(req.args['webhook_token'])
 
-        async with self.locks[req.route][major_parameter]:
-            with trio.fail_after(max_sleep):
-                async with trio.open_nursery() as nursery:
-                    for bucket in self.buckets[req.route][major_parameter]:
-                        nursery.start_soon(bucket.wait_for)
+        exempt = _is_exempt(req.route)
+        # where to rewind uploaded files to before retrying
+        streams = None if req.files is None else _file_positions(req.files)
 
-            # make the request
-            kw_args = {}
+        async with self.locks[req.route][major_parameter]:
+            for retries in itertools.count():
+                with trio.fail_after(max_sleep):
+                    async with trio.open_nursery() as nursery:
+                        if not exempt:
+                            nursery.start_soon(self.global_bucket.wait_for)
+                        for bucket in self.buckets[req.route][major_parameter]:
+                            nursery.start_soon(bucket.wait_for)
 
-            if req.params is not None:
-                kw_args['params'] = req.params
+                if self.global_limiter is not None and not exempt:
+                    await self.global_limiter.acquire()
 
-            if req.json is not None:
-                kw_args['json'] = req.json
+                result = await self._send(req)
+                self._update_buckets(req.route, major_parameter, result.headers)
 
-            if req.headers is not None:
-                kw_args['headers'] = req.headers
+                if result.status_code != 429:
+                    break
 
-            if req.data is not None:
-                kw_args['data'] = req.data
+                retry_after = self._ratelimited(result, exempt=exempt)
+                if (
+                    retries == self.max_retries
+                    or retry_after > max_sleep
+                    or (req.files is not None and streams is None)
+                ):
+                    self.stats.failures += 1
+                    result.raise_for_status()
 
-            if req.files is not None:
-                kw_args['files'] = req.files
+                self.stats.retries += 1
+                await trio.sleep(retry_after)
 
-            result = await self.http.request(req.method, req.url, **kw_args)
-            headers = result.headers
+                for stream, position in streams or ():
+                    stream.seek(position)
 
-            # TODO: handle errors (429, ...) correctly (including decoding of error type)
-            if result.status_code >= 500:
+            # TODO: decode returned error type, seperate out 400 vs 401 vs 403
+            if result.status_code >= 300:
                 # TODO: how to handle server errors? retry?
                 result.raise_for_status()
-            elif result.status_code >= 400:
-                # TODO: decode returned error type, seperate out 400 vs 401 vs 403 vs 429
-                result.raise_for_status()
-            elif result.status_code >= 300:
-                # this should never happen? should I log anyways?
-                result.raise_for_status()
-
-            # process the result
-
-            bucket_hash = headers.get('X-RateLimit-Bucket')
-
-            if bucket_hash is not None and major_parameter in self.buckets_by_hash[bucket_hash]:
-                bucket = self.buckets_by_hash[bucket_hash][major_parameter]
-                bucket.remaining = int(headers['X-RateLimit-Remaining'])
-                # TODO: should this have a configuration option to use `X-Ratelimit-Reset` instead?
-                bucket.reset_at = trio.current_time() + float(headers['X-RateLimit-Reset-After'])
-
-            elif bucket_hash is not None:
-                bucket = Bucket(
-                    int(headers['X-RateLimit-Remaining']),
-                    trio.current_time() + float(headers['X-RateLimit-Reset-After']),
-                )
-
-                self.buckets[req.route][major_parameter].append(bucket)
-                self.buckets_by_hash[bucket_hash][major_parameter] = bucket
-
-            else:
-                # ?? no ratelimit?
-                pass
 
             # runtime-only attribute :S
             # TODO: clean this up and put unsafe parts in utility class/function
@@ -217,6 +322,82 @@ class RatelimitingState:
                 return_val: ReturnT = self.converter.structure(result.json(), result_type)
                 return return_val
 
+    async def _send(self, req: Request[typing.Any]) -> HttpResponseProto:
+        kw_args = {}
+
+        if req.params is not None:
+            kw_args['params'] = req.params
+
+        if req.json is not None:
+            kw_args['json'] = req.json
+
+        if req.headers is not None:
+            kw_args['headers'] = req.headers
+
+        if req.data is not None:
+            kw_args['data'] = req.data
+
+        if req.files is not None:
+            kw_args['files'] = req.files
+
+        return await self.http.request(req.method, req.url, **kw_args)
+
+    def _update_buckets(
+        self,
+        route: str,
+        major_parameter: typing.Optional[typing.Union[int, str]],
+        headers: httpx.Headers,
+    ) -> None:
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+
+        if bucket_hash is not None and major_parameter in self.buckets_by_hash[bucket_hash]:
+            bucket = self.buckets_by_hash[bucket_hash][major_parameter]
+            bucket.remaining = int(headers['X-RateLimit-Remaining'])
+            # TODO: should this have a configuration option to use `X-Ratelimit-Reset` instead?
+            bucket.reset_at = trio.current_time() + float(headers['X-RateLimit-Reset-After'])
+
+        elif bucket_hash is not None:
+            bucket = Bucket(
+                int(headers['X-RateLimit-Remaining']),
+                trio.current_time() + float(headers['X-RateLimit-Reset-After']),
+            )
+
+            self.buckets[route][major_parameter].append(bucket)
+            self.buckets_by_hash[bucket_hash][major_parameter] = bucket
+
+        else:
+            # ?? no ratelimit?
+            pass
+
+    def _ratelimited(self, result: HttpResponseProto, *, exempt: bool) -> float:
+        # how long to wait before retrying a 429. the body is more precise
+        # than the Retry-After header, but isn't always JSON (e.g. from
+        # cloudflare).
+        headers = result.headers
+        try:
+            body = result.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+
+        retry_after = float(body.get('retry_after', headers.get('Retry-After', 1)))
+        is_global = body.get('global') is True or headers.get('X-RateLimit-Global') == 'true'
+        scope = headers.get('X-RateLimit-Scope', 'global' if is_global else 'user')
+        self.stats.by_scope[scope] += 1
+
+        if is_global and not exempt:
+            if self.global_limiter is not None:
+                self.global_limiter.limited()
+
+            # every other request waits for this too.
+            self.global_bucket.remaining = 0
+            self.global_bucket.reset_at = max(
+                self.global_bucket.reset_at, trio.current_time() + retry_after
+            )
+
+        return retry_after
+
     @classmethod
     @contextlib.asynccontextmanager
     async def with_httpx(
@@ -86,10 +86,35 @@ _LOGGER: typing_extensions.Final[logging.Logger] = logging.getLogger('bloom.shar
 ONE_HOUR = 60 * 60
 
 
+class UserInternerProto(typing.Protocol):
+    def install(self, converter: Converter) -> None:
+        ...
+
+
+@attr.frozen()
+class RawEvent:
+    """A dispatch as it came from the gateway, before any decoding.
+
+    This is broadcast alongside the usual models, but only if something
+    listens for it. Events whose models nothing listens for are not decoded at
+    all, so a pure forwarder only pays for the JSON parse.
+    """
+
+    #: the event name, e.g. ``MESSAGE_CREATE``
+    tag: str
+    #: the sequence number of the event
+    seq: int
+    #: the shard that received the event
+    shard_id: int
+    #: the whole gateway payload (``op``, ``t``, ``s`` and ``d``) as received
+    payload: typing.Union[str, bytes]
+
+
 @attr.define()
 class _ShardData:
     converter: Converter
     substrate: subs.Substrate
+    shard_id: int
     seq: typing.Optional[int] = None
     have_acked: bool = True
     session_id: typing.Optional[str] = None
@@ -255,10 +280,10 @@ async def _heartbeat(
 
 async def _stream(
     websocket: trio_websocket.WebSocketConnection,
-) -> typing.AsyncGenerator[_DiscordPayload, None]:
+) -> typing.AsyncGenerator[typing.Tuple[typing.Union[str, bytes], _DiscordPayload], None]:
     while True:
         message = await websocket.get_message()
-        yield json.loads(message)
+        yield message, json.loads(message)
 
 
 # TODO: figure out how to decrease the number of arguments this takes?
@@ -271,7 +296,7 @@ async def _shared_logic(
 ) -> bool:
     # the return value is whether or not to resume next time.
 
-    async for message in _stream(websocket):
+    async for raw, message in _stream(websocket):
         if message['op'] == 0:
             if message['t'] == 'READY':
                 data.session_id = message['d']['session_id']
@@ -293,8 +318,16 @@ async def _shared_logic(
             elif message['t'] == 'GUILD_JOIN_REQUEST_DELETE':
                 continue
 
+            if data.substrate.wants(RawEvent):
+                await data.substrate.broadcast(RawEvent(message['t'], seq, data.shard_id, raw))
+
+            # raw listeners still get dispatches bloom has no model for.
+            model_type = tags_to_model.get(message['t'])
+            if model_type is None or not data.substrate.wants(model_type):
+                continue
+
             try:
-                model: object = data.converter.structure(message['d'], tags_to_model[message['t']])
+                model: object = data.converter.structure(message['d'], model_type)
                 reverse: typing.Dict[str, object] = data.converter.unstructure(model)
 
                 if not _skip_differences(message['t']):
@@ -388,7 +421,7 @@ async def _run_once(
 async def _run_shard(
     info: _ConnectionInfo,
 ) -> typing.NoReturn:
-    data = _ShardData(info.converter, info.substrate)
+    data = _ShardData(info.converter, info.substrate, info.shard_id)
 
     # variables for not uselessly resuming
     should_resume = False
@@ -409,7 +442,7 @@ async def _run_shard(
         else:
             await info.bucket.park()
             _LOGGER.info('identifying')
-            data = _ShardData(info.converter, info.substrate)
+            data = _ShardData(info.converter, info.substrate, info.shard_id)
             last_identify = trio.current_time()
             identifies += 1
 
@@ -544,6 +577,12 @@ def _register_converter(converter: Converter) -> Converter:
     return converter
 
 
+def gateway_converter() -> Converter:
+    """A new converter for gateway models, set up like the one `connect`
+    structures events with."""
+    return _register_converter(make_converter(omit_if_default=True))
+
+
 def _allowed_differences(tag: str) -> typing.Set[str]:
     # TODO: remove in non-debug version
     if tag == 'READY':
@@ -789,9 +828,17 @@ async def connect(
     shard_ids: typing.Sequence[int] = (0,),
     shard_count: int = 1,
     max_concurrency: int = 1,
+    users: typing.Optional[UserInternerProto] = None,
 ) -> typing.NoReturn:
-    """Connects to the gateway with a specified token."""
-    converter = _register_converter(make_converter(omit_if_default=True))
+    """Connects to the gateway with a specified token.
+
+    If ``users`` (e.g. a `bloom.ll.cache.users.UserInterner`) is passed,
+    every user in every event is structured through it, so pass the same
+    interner to the cache.
+    """
+    converter = gateway_converter()
+    if users is not None:
+        users.install(converter)
     buckets = [_Bucket(trio.lowlevel.ParkingLot()) for _ in range(max_concurrency)]
 
     async with trio.open_nursery() as nursery:
@@ -805,4 +852,11 @@ async def connect(
     raise RuntimeError('Should never get here.')
 
 
-__all__ = ('connect', 'Intents', 'ShardException', 'TooManyIdentifies')
+__all__ = (
+    'connect',
+    'Intents',
+    'RawEvent',
+    'ShardException',
+    'TooManyIdentifies',
+    'UserInternerProto',
+)
@@ -1,9 +1,13 @@
-# this backpressures based on the slowest consumer.
+# by default this backpressures based on the slowest consumer. listeners that
+# would rather lose events than stall the gateway can pick another `Overflow`.
 # if you mess this up, then uh, raise an issue.
 # until then I do not want to think about design.
 from __future__ import annotations
 
 import collections
+import enum
+import itertools
+import logging
 import math
 import typing
 
@@ -12,68 +16,734 @@ import trio
 
 T = typing.TypeVar('T')
 
+_LOGGER = logging.getLogger('bloom.substrate')
+
+_MISSING = object()
+
+
+class Overflow(enum.Enum):
+    """What to do with an event when a listener's buffer is full."""
+
+    #: wait until the listener has room (this stalls every other listener!)
+    BLOCK = enum.auto()
+    #: throw away the incoming event
+    DROP_NEWEST = enum.auto()
+    #: throw away the oldest buffered event to make room
+    DROP_OLDEST = enum.auto()
+    #: replace the buffered event with the same key, otherwise act like
+    #: ``DROP_OLDEST``
+    COALESCE = enum.auto()
+
+
+class Balance(enum.Enum):
+    """How a `ConsumerGroup` picks the member that gets an event."""
+
+    #: take turns
+    ROUND_ROBIN = enum.auto()
+    #: the member with the fewest buffered events (ties take turns)
+    LEAST_LOADED = enum.auto()
+
+
+@attr.define()
+class ListenerStats:
+    #: events handed to the listener
+    delivered: int = 0
+    #: events thrown away (or replaced, for ``COALESCE``) due to the overflow
+    #: policy
+    dropped: int = 0
+    #: events waiting to be received, as of when the stats were taken
+    buffered: int = 0
+    #: the most events that were ever waiting at once
+    max_buffered: int = 0
+    #: seconds `Substrate.broadcast` spent waiting for the listener to make
+    #: room
+    blocked_for: float = 0.0
+
+
+@attr.define(eq=False)
+class _RingReceiveChannel(trio.abc.ReceiveChannel[T]):
+    # a receive channel that can drop its oldest item or coalesce items by
+    # key, neither of which trio's memory channels can do. it also backs
+    # batched listeners, because it can hold off waking the receiver until a
+    # whole batch is ready.
+    max_size: float
+    overflow: Overflow
+    key: typing.Optional[typing.Callable[[T], typing.Hashable]]
+    stats: ListenerStats
+    # the receiver is woken up for the first item and then every time there
+    # are at least this many.
+    wake_at: int = 1
+
+    _items: typing.Dict[typing.Hashable, T] = attr.Factory(collections.OrderedDict)
+    _counter: typing.Iterator[int] = attr.Factory(itertools.count)
+    _lot: trio.lowlevel.ParkingLot = attr.Factory(trio.lowlevel.ParkingLot)
+    _send_lot: trio.lowlevel.ParkingLot = attr.Factory(trio.lowlevel.ParkingLot)
+    _send_closed: bool = False
+    _recv_closed: bool = False
+
+    @property
+    def full(self) -> bool:
+        return len(self._items) >= self.max_size
+
+    def offer(self, message: T) -> None:
+        if self._recv_closed or self._send_closed:
+            raise trio.BrokenResourceError
+
+        key: typing.Hashable = next(self._counter) if self.key is None else self.key(message)
+
+        if key in self._items:
+            # an ordered dict keeps the position of a replaced key.
+            self.stats.dropped += 1
+        elif len(self._items) >= self.max_size:
+            if self.overflow is Overflow.DROP_NEWEST:
+                self.stats.dropped += 1
+                return
+
+            self._items.popitem(last=False)  # type: ignore[call-arg]
+            self.stats.dropped += 1
+
+        self._items[key] = message
+        self.stats.delivered += 1
+
+        if len(self._items) > self.stats.max_buffered:
+            self.stats.max_buffered = len(self._items)
+
+        if len(self._items) == 1 or len(self._items) >= self.wake_at:
+            self._lot.unpark()
+
+    async def put(self, message: T) -> None:
+        # cancellation-safe: if this raises `Cancelled`, nothing was queued.
+        await trio.lowlevel.checkpoint_if_cancelled()
+
+        while len(self._items) >= self.max_size and not self._recv_closed:
+            await self._send_lot.park()
+
+        self.offer(message)
+        await trio.lowlevel.cancel_shielded_checkpoint()
+
+    def buffered(self) -> int:
+        return len(self._items)
+
+    def close_sender(self) -> None:
+        self._send_closed = True
+        self._lot.unpark_all()
+
+    def _check_empty(self) -> None:
+        if self._recv_closed:
+            raise trio.ClosedResourceError
+        if self._send_closed:
+            raise trio.EndOfChannel
+
+    def _pop(self) -> T:
+        _, message = self._items.popitem(last=False)  # type: ignore[call-arg]
+        self._send_lot.unpark()
+        return message
+
+    def receive_nowait(self) -> T:
+        if not self._items:
+            self._check_empty()
+            raise trio.WouldBlock
+
+        return self._pop()
+
+    async def receive(self) -> T:
+        await trio.lowlevel.checkpoint_if_cancelled()
+
+        while not self._items:
+            self._check_empty()
+            await self._lot.park()
+
+        message = self._pop()
+        await trio.lowlevel.cancel_shielded_checkpoint()
+        return message
+
+    async def receive_batch(self, max_batch: int, max_linger: float) -> typing.List[T]:
+        await trio.lowlevel.checkpoint_if_cancelled()
+
+        while not self._items:
+            self._check_empty()
+            await self._lot.park()
+
+        with trio.move_on_after(max_linger):
+            while len(self._items) < max_batch and not self._send_closed:
+                await self._lot.park()
+
+        batch = [self._pop() for _ in range(min(max_batch, len(self._items)))]
+        await trio.lowlevel.cancel_shielded_checkpoint()
+        return batch
+
+    async def aclose(self) -> None:
+        self._recv_closed = True
+        self._items.clear()
+        self._lot.unpark_all()
+        self._send_lot.unpark_all()
+        await trio.lowlevel.checkpoint()
+
+
+@attr.define(eq=False)
+class _BatchReceiveChannel(trio.abc.ReceiveChannel[typing.List[T]]):
+    inner: _RingReceiveChannel[T]
+    max_batch: int
+    max_linger: float
+
+    async def receive(self) -> typing.List[T]:
+        return await self.inner.receive_batch(self.max_batch, self.max_linger)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+@attr.define(eq=False)
+class _GroupSender:
+    # quacks enough like a memory send channel for `_Listener`.
+    balance: Balance
+    members: typing.List[trio.MemorySendChannel[typing.Any]] = attr.Factory(list)
+    _turn: int = 0
+
+    def _pick(self) -> trio.MemorySendChannel[typing.Any]:
+        self._turn = (self._turn + 1) % len(self.members)
+
+        if self.balance is Balance.ROUND_ROBIN:
+            return self.members[self._turn]
+
+        best = self.members[self._turn]
+        best_load = best.statistics().current_buffer_used
+
+        for offset in range(1, len(self.members)):
+            member = self.members[(self._turn + offset) % len(self.members)]
+            load = member.statistics().current_buffer_used
+
+            if load < best_load:
+                best, best_load = member, load
+
+        return best
+
+    def send_nowait(self, message: object) -> None:
+        self._pick().send_nowait(message)
+
+    async def send(self, message: object) -> None:
+        await self._pick().send(message)
+
+    def buffered(self) -> int:
+        return sum(member.statistics().current_buffer_used for member in self.members)
+
+    async def aclose(self) -> None:
+        for member in self.members:
+            await member.aclose()
+
+
+@attr.define(eq=False)
+class _Listener:
+    overflow: Overflow
+    stats: ListenerStats
+    send: typing.Union[trio.MemorySendChannel[typing.Any], _GroupSender, None] = None
+    ring: typing.Optional[_RingReceiveChannel[typing.Any]] = None
+    # the first `where` item is looked up in `Substrate._indexed`, the rest
+    # are checked per event.
+    index_key: typing.Optional[typing.Tuple[typing.Type[typing.Any], str, typing.Hashable]] = None
+    where: typing.Tuple[typing.Tuple[str, typing.Hashable], ...] = ()
+    predicate: typing.Optional[typing.Callable[[typing.Any], bool]] = None
+    # (type, receive channel or consumer group), as in `Substrate._listeners`
+    handle: typing.Optional[typing.Tuple[typing.Type[typing.Any], object]] = None
+
+    def buffered(self) -> int:
+        if self.ring is not None:
+            return self.ring.buffered()
+
+        assert self.send is not None
+        if isinstance(self.send, _GroupSender):
+            return self.send.buffered()
+
+        return self.send.statistics().current_buffer_used
+
+    def _sent(self) -> None:
+        self.stats.delivered += 1
+
+        depth = self.buffered()
+        if depth > self.stats.max_buffered:
+            self.stats.max_buffered = depth
+
+    def matches(self, message: object) -> bool:
+        if not all(getattr(message, field, _MISSING) == value for field, value in self.where):
+            return False
+
+        return self.predicate is None or self.predicate(message)
+
+    def offer(self, message: object) -> None:
+        if self.ring is not None:
+            self.ring.offer(message)
+            return
+
+        assert self.send is not None
+        try:
+            self.send.send_nowait(message)
+        except trio.WouldBlock:
+            self.stats.dropped += 1
+        else:
+            self._sent()
+
+    def try_offer(self, message: object) -> bool:
+        # hand over the message if that can be done without waiting.
+        if self.ring is not None:
+            if self.ring.full:
+                return False
+
+            self.ring.offer(message)
+            return True
+
+        assert self.send is not None
+        try:
+            self.send.send_nowait(message)
+        except trio.WouldBlock:
+            return False
+
+        self._sent()
+        return True
+
+    async def deliver(self, message: object) -> None:
+        if self.ring is not None:
+            await self.ring.put(message)
+            return
+
+        assert self.send is not None
+        await self.send.send(message)
+        self._sent()
+
+    async def aclose(self) -> None:
+        if self.ring is not None:
+            self.ring.close_sender()
+        else:
+            assert self.send is not None
+            await self.send.aclose()
+
 
 @attr.define()
 class Substrate:
-    _events: typing.Dict[
-        typing.Type[typing.Any], typing.List[trio.abc.SendChannel[typing.Any]]
-    ] = attr.Factory(lambda: collections.defaultdict(lambda: []))
+    #: once `broadcast` has been waiting this many seconds for one listener
+    #: to make room, `on_slow_listener` is called (or a warning is logged)
+    slow_listener_threshold: typing.Optional[float] = None
+    #: called with the listened-to type and the receive channel (or consumer
+    #: group) of the slow listener
+    on_slow_listener: typing.Optional[typing.Callable[[typing.Type[typing.Any], object], None]] = (
+        None
+    )
+    #: called with a type whenever it gains its first listener or loses its
+    #: last one, e.g. to only ask for events something here wants
+    watchers: typing.List[typing.Callable[[typing.Type[typing.Any]], None]] = attr.Factory(list)
+
+    _events: typing.Dict[typing.Type[typing.Any], typing.List[_Listener]] = attr.Factory(
+        lambda: collections.defaultdict(lambda: [])
+    )
 
-    _recv_to_send: typing.Dict[
-        typing.Tuple[typing.Type[typing.Any], trio.abc.ReceiveChannel[typing.Any]],
-        trio.abc.SendChannel[typing.Any],
+    # (type, receive channel or consumer group) -> listener
+    _listeners: typing.Dict[
+        typing.Tuple[typing.Type[typing.Any], object],
+        _Listener,
     ] = attr.Factory(dict)
 
-    # this cache makes event -> channels amortized O(1)
-    _cache: typing.Dict[typing.Type[typing.Any], typing.List[typing.Any]] = attr.Factory(dict)
+    # (type, field, value) -> listeners with that `where` filter, so a
+    # broadcast only looks at listeners that could possibly match.
+    _indexed: typing.Dict[
+        typing.Tuple[typing.Type[typing.Any], str, typing.Hashable], typing.List[_Listener]
+    ] = attr.Factory(lambda: collections.defaultdict(lambda: []))
+
+    # type -> field -> number of listeners indexed on that field
+    _indexed_fields: typing.Dict[typing.Type[typing.Any], typing.Dict[str, int]] = attr.Factory(
+        lambda: collections.defaultdict(collections.Counter)
+    )
+
+    # type -> number of listeners (filtered or not) for exactly that type
+    _counts: typing.Dict[typing.Type[typing.Any], int] = attr.Factory(collections.Counter)
+
+    # event class -> the listened-to types in its MRO. entries are only ever
+    # made for classes that were broadcast, and are patched when a type gains
+    # its first listener or loses its last one instead of being thrown away.
+    _dispatch: typing.Dict[typing.Type[typing.Any], typing.List[typing.Type[typing.Any]]] = (
+        attr.Factory(dict)
+    )
+
+    # type -> the classes in `_dispatch` that have it in their MRO
+    _dependents: typing.Dict[typing.Type[typing.Any], typing.List[typing.Type[typing.Any]]] = (
+        attr.Factory(lambda: collections.defaultdict(lambda: []))
+    )
 
     def register(
-        self, typ: typing.Type[T], buffer_size: typing.Optional[int]
+        self,
+        typ: typing.Type[T],
+        buffer_size: typing.Optional[int],
+        *,
+        overflow: Overflow = Overflow.BLOCK,
+        key: typing.Optional[typing.Callable[[T], typing.Hashable]] = None,
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]] = None,
+    ) -> trio.abc.ReceiveChannel[T]:
+        """Listen for events of type ``typ`` (including subclasses).
+
+        ``overflow`` decides what happens when ``buffer_size`` events are
+        already waiting, and ``key`` is what ``Overflow.COALESCE`` dedupes on
+        (for example, the user id of a presence update).
+
+        ``where`` only lets through events whose attributes equal the given
+        values, e.g. ``where={'guild_id': guild_id}``. The first item is
+        indexed, so put the most selective one first.
+
+        A ``buffer_size`` of 0 is only allowed for ``Overflow.BLOCK`` and
+        ``Overflow.DROP_NEWEST``.
+        """
+        if (overflow is Overflow.COALESCE) != (key is not None):
+            raise ValueError('`key` must be passed if and only if coalescing')
+
+        return self._add_listener(typ, buffer_size, overflow, key, where, None)
+
+    def register_many(
+        self,
+        types: typing.Collection[typing.Type[typing.Any]],
+        buffer_size: typing.Optional[int],
+        *,
+        overflow: Overflow = Overflow.BLOCK,
+        key: typing.Optional[typing.Callable[[typing.Any], typing.Hashable]] = None,
+    ) -> trio.abc.ReceiveChannel[typing.Any]:
+        """Like `register`, but for events of any of ``types``, received in
+        the order they were broadcast.
+
+        None of ``types`` should be a subclass of another, or events would be
+        received twice. Unregister with `unregister_many`.
+        """
+        if (overflow is Overflow.COALESCE) != (key is not None):
+            raise ValueError('`key` must be passed if and only if coalescing')
+
+        return self._add_listener(tuple(types), buffer_size, overflow, key, None, None)
+
+    def register_batched(
+        self,
+        typ: typing.Type[T],
+        buffer_size: typing.Optional[int],
+        *,
+        max_batch: int,
+        max_linger: float,
+        overflow: Overflow = Overflow.BLOCK,
+        key: typing.Optional[typing.Callable[[T], typing.Hashable]] = None,
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]] = None,
+    ) -> trio.abc.ReceiveChannel[typing.List[T]]:
+        """Like `register`, but receive lists of events.
+
+        A batch is handed out once it has ``max_batch`` events, or
+        ``max_linger`` seconds after its first event arrived, whichever is
+        first. Unregister with the returned channel.
+        """
+        if (overflow is Overflow.COALESCE) != (key is not None):
+            raise ValueError('`key` must be passed if and only if coalescing')
+
+        if buffer_size == 0:
+            raise ValueError('batched listeners need room for at least one event')
+
+        buffer_size_ = math.inf if buffer_size is None else buffer_size
+        stats = ListenerStats()
+
+        ring = _RingReceiveChannel[T](buffer_size_, overflow, key, stats, wake_at=max_batch)
+        batched = _BatchReceiveChannel[T](ring, max_batch, max_linger)
+        self._insert(typ, batched, _Listener(overflow, stats, ring=ring), where)
+
+        return batched
+
+    async def wait_for(
+        self,
+        typ: typing.Type[T],
+        predicate: typing.Optional[typing.Callable[[T], bool]] = None,
+        *,
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]] = None,
+        timeout: float = math.inf,
+    ) -> T:
+        """Wait for the next event of type ``typ`` that matches.
+
+        ``where`` is indexed the same way as in `register`, so prefer it over
+        ``predicate`` for anything that can be expressed as an equality check.
+        Raises `trio.TooSlowError` if nothing matches within ``timeout``.
+        """
+        # anything matching after the first event is dropped, which is fine
+        # because the waiter is about to go away anyways.
+        recv = self._add_listener(typ, 1, Overflow.DROP_NEWEST, None, where, predicate)
+
+        try:
+            with trio.fail_after(timeout):
+                return await recv.receive()
+        finally:
+            self.unregister(typ, recv)
+
+    def group(
+        self,
+        typ: typing.Type[T],
+        *,
+        balance: Balance = Balance.ROUND_ROBIN,
+        overflow: Overflow = Overflow.BLOCK,
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]] = None,
+    ) -> ConsumerGroup[T]:
+        """Make a group of listeners that each get a share of the events.
+
+        Every event of type ``typ`` goes to exactly one member, picked by
+        ``balance``. Only ``Overflow.BLOCK`` and ``Overflow.DROP_NEWEST`` are
+        supported, and they apply to the chosen member's buffer.
+        """
+        if overflow not in (Overflow.BLOCK, Overflow.DROP_NEWEST):
+            raise ValueError('consumer groups can only block or drop the newest event')
+
+        listener = _Listener(overflow, ListenerStats(), send=_GroupSender(balance))
+        return ConsumerGroup(self, typ, listener, where)
+
+    def _add_listener(
+        self,
+        typ: typing.Union[typing.Type[T], typing.Tuple[typing.Type[typing.Any], ...]],
+        buffer_size: typing.Optional[int],
+        overflow: Overflow,
+        key: typing.Optional[typing.Callable[[T], typing.Hashable]],
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]],
+        predicate: typing.Optional[typing.Callable[[T], bool]],
     ) -> trio.abc.ReceiveChannel[T]:
         buffer_size_ = math.inf if buffer_size is None else buffer_size
+        stats = ListenerStats()
+        recv: trio.abc.ReceiveChannel[T]
 
-        if typ not in self._events:
-            # cache invalidation is hard, just flush it every time there's a
-            # possibility of change.
-            self._cache = {}
+        if overflow in (Overflow.BLOCK, Overflow.DROP_NEWEST):
+            send, recv = trio.open_memory_channel[T](buffer_size_)
+            listener = _Listener(overflow, stats, send=send)
+        elif buffer_size == 0:
+            # there's no oldest event to drop (or event to coalesce with).
+            raise ValueError(f'{overflow} needs room for at least one event')
+        else:
+            recv = _RingReceiveChannel[T](buffer_size_, overflow, key, stats)
+            listener = _Listener(overflow, stats, ring=recv)
 
-        send, recv = trio.open_memory_channel[T](buffer_size_)
-        self._events[typ].append(send)
-        self._recv_to_send[(typ, recv)] = send
+        listener.predicate = predicate
+
+        # one listener can be inserted under several types.
+        for typ_ in typ if isinstance(typ, tuple) else (typ,):
+            self._insert(typ_, recv, listener, where)
 
         return recv
 
+    def _insert(
+        self,
+        typ: typing.Type[typing.Any],
+        handle: object,
+        listener: _Listener,
+        where: typing.Optional[typing.Mapping[str, typing.Hashable]],
+    ) -> None:
+        self._counts[typ] += 1
+        if self._counts[typ] == 1:
+            self._redispatch(typ)
+            self._watched(typ)
+
+        if where:
+            (field, value), *rest = where.items()
+            listener.index_key = (typ, field, value)
+            listener.where = tuple(rest)
+            self._indexed[listener.index_key].append(listener)
+            self._indexed_fields[typ][field] += 1
+        else:
+            self._events[typ].append(listener)
+
+        listener.handle = (typ, handle)
+        self._listeners[listener.handle] = listener
+
     def unregister(self, typ: typing.Type[T], chan: trio.abc.ReceiveChannel[T]) -> None:
-        if (typ, chan) not in self._recv_to_send:
+        self._remove(typ, chan)
+
+    def unregister_many(
+        self,
+        types: typing.Collection[typing.Type[typing.Any]],
+        chan: trio.abc.ReceiveChannel[typing.Any],
+    ) -> None:
+        for typ in types:
+            self._remove(typ, chan)
+
+    def _remove(self, typ: typing.Type[typing.Any], handle: object) -> None:
+        if (typ, handle) not in self._listeners:
             return
 
-        self._events[typ].remove(self._recv_to_send.pop((typ, chan)))
+        listener = self._listeners.pop((typ, handle))
+
+        if listener.index_key is None:
+            self._events[typ].remove(listener)
+        else:
+            self._indexed[listener.index_key].remove(listener)
+            if not self._indexed[listener.index_key]:
+                del self._indexed[listener.index_key]
+
+            field = listener.index_key[1]
+            self._indexed_fields[typ][field] -= 1
+            if not self._indexed_fields[typ][field]:
+                del self._indexed_fields[typ][field]
+
+        self._counts[typ] -= 1
+        if not self._counts[typ]:
+            del self._counts[typ]
+            self._events.pop(typ, None)
+            self._indexed_fields.pop(typ, None)
+            self._redispatch(typ)
+            self._watched(typ)
+
+    def _redispatch(self, typ: typing.Type[typing.Any]) -> None:
+        # `typ` just started or stopped being listened to, so fix up the
+        # classes that have it in their MRO.
+        for cls in self._dependents.get(typ, ()):
+            self._dispatch[cls][:] = [t for t in cls.__mro__ if t in self._counts]
+
+    def _watched(self, typ: typing.Type[typing.Any]) -> None:
+        for watcher in self.watchers:
+            watcher(typ)
+
+    def stats(self, typ: typing.Type[T], chan: trio.abc.ReceiveChannel[T]) -> ListenerStats:
+        return _snapshot(self._listeners[(typ, chan)])
+
+    def _listener_types(self, cls: typing.Type[typing.Any]) -> typing.List[typing.Any]:
+        listener_types = self._dispatch.get(cls)
+
+        if listener_types is None:
+            # this means listening to virtual base classes (e.g. ABCs with
+            # `register`) doesn't work, but it's O(len(mro)) instead of
+            # O(listened-to types).
+            listener_types = [t for t in cls.__mro__ if t in self._counts]
+            self._dispatch[cls] = listener_types
+
+            for base in cls.__mro__:
+                self._dependents[base].append(cls)
+
+        return listener_types
+
+    def wants(self, cls: typing.Type[typing.Any]) -> bool:
+        """Whether anything is listening for events of type ``cls``.
+
+        Producers can use this to skip building events nobody will see.
+        """
+        return bool(self._listener_types(cls))
 
     async def broadcast(self, message: typing.Any) -> None:
-        listener_types = self._cache.get(type(message))
+        listener_types = self._listener_types(type(message))
+
+        listeners: typing.List[_Listener] = []
+
+        for listener_type in listener_types:
+            for listener in self._events.get(listener_type, ()):
+                if listener.predicate is None or listener.predicate(message):
+                    listeners.append(listener)
 
-        if not listener_types:
-            listener_types = [typ for typ in self._events.keys() if isinstance(message, typ)]
-            self._cache[type(message)] = listener_types
+            for field in self._indexed_fields.get(listener_type, ()):
+                value = getattr(message, field, _MISSING)
+                if value is _MISSING:
+                    continue
 
-        listeners = [
-            listener
-            for listener_type in listener_types
-            for listener in self._events[listener_type]
-        ]
+                for listener in self._indexed.get((listener_type, field, value), ()):
+                    if listener.matches(message):
+                        listeners.append(listener)
+
+        blocking: typing.List[_Listener] = []
+
+        for listener in listeners:
+            if listener.overflow is not Overflow.BLOCK:
+                listener.offer(message)
+            elif not listener.try_offer(message):
+                blocking.append(listener)
+
+        # only spin up tasks for listeners that are actually full.
+        if not blocking:
+            await trio.lowlevel.checkpoint()
+            return
+        elif len(blocking) == 1:
+            await self._deliver(blocking[0], message)
+            return
 
         async with trio.open_nursery() as nursery:
-            for listener in listeners:
-                nursery.start_soon(listener.send, message)
+            for listener in blocking:
+                nursery.start_soon(self._deliver, listener, message)
 
-    async def aclose(self) -> None:
-        self._recv_to_send.clear()
+    async def _deliver(self, listener: _Listener, message: object) -> None:
+        start = trio.current_time()
+
+        try:
+            if self.slow_listener_threshold is not None:
+                # delivering is cancellation-safe, so give up waiting quietly
+                # to report the listener, then keep waiting.
+                with trio.move_on_after(self.slow_listener_threshold):
+                    await listener.deliver(message)
+                    return
+
+                self._report_slow(listener)
 
-        for k, chans in self._events.items():
-            for chan in chans:
-                await chan.aclose()
+            await listener.deliver(message)
+        finally:
+            listener.stats.blocked_for += trio.current_time() - start
 
-            self._events[k].clear()
+    def _report_slow(self, listener: _Listener) -> None:
+        assert listener.handle is not None
+        typ, handle = listener.handle
+
+        if self.on_slow_listener is None:
+            _LOGGER.warning(
+                'broadcast has been blocked on a %s listener (%r) for over %s seconds',
+                typ.__name__,
+                handle,
+                self.slow_listener_threshold,
+            )
+        else:
+            self.on_slow_listener(typ, handle)
+
+    async def aclose(self) -> None:
+        for listener in self._listeners.values():
+            await listener.aclose()
+
+        self._listeners.clear()
+        self._indexed.clear()
+        self._indexed_fields.clear()
+        self._events.clear()
+        self._counts.clear()
+        self._dispatch.clear()
+        self._dependents.clear()
 
         # just in case, trio-nic
         await trio.lowlevel.checkpoint()
+
+
+@attr.define(eq=False)
+class ConsumerGroup(typing.Generic[T]):
+    """A set of interchangeable listeners, made with `Substrate.group`."""
+
+    _substrate: Substrate
+    _typ: typing.Type[T]
+    _listener: _Listener
+    _where: typing.Optional[typing.Mapping[str, typing.Hashable]]
+
+    _members: typing.Dict[
+        trio.abc.ReceiveChannel[T],
+        trio.MemorySendChannel[T],
+    ] = attr.Factory(dict)
+
+    @property
+    def _sender(self) -> _GroupSender:
+        assert isinstance(self._listener.send, _GroupSender)
+        return self._listener.send
+
+    def join(self, buffer_size: typing.Optional[int]) -> trio.abc.ReceiveChannel[T]:
+        send, recv = trio.open_memory_channel[T](math.inf if buffer_size is None else buffer_size)
+
+        if not self._members:
+            self._substrate._insert(self._typ, self, self._listener, self._where)
+
+        self._members[recv] = send
+        self._sender.members.append(send)
+        return recv
+
+    def leave(self, chan: trio.abc.ReceiveChannel[T]) -> None:
+        if chan not in self._members:
+            return
+
+        self._sender.members.remove(self._members.pop(chan))
+
+        # an empty group shouldn't be sent anything.
+        if not self._members:
+            self._substrate._remove(self._typ, self)
+
+    def stats(self) -> ListenerStats:
+        return _snapshot(self._listener)
+
+
+def _snapshot(listener: _Listener) -> ListenerStats:
+    return attr.evolve(listener.stats, buffered=listener.buffered())
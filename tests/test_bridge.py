@@ -0,0 +1,162 @@
+import pathlib
+import socket
+
+import pytest
+import trio
+import trio.testing
+
+import bloom.ll.bridge as bridge
+import bloom.ll.models.gateway as gateway_models
+import bloom.ll.substrate as subs
+from bloom.ll.models.base import Snowflake
+
+
+async def test_bridge_forwards_subscribed_types(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / 'bridge.sock')
+    upstream = subs.Substrate()
+    downstream = subs.Substrate()
+
+    publisher = bridge.BridgePublisher(upstream, {'GUILD_ROLE_DELETE', 'TYPING_START'})
+    subscriber = bridge.BridgeSubscriber(downstream)
+
+    recv = downstream.register(gateway_models.GuildRoleDeleteEvent, None)
+    event = gateway_models.GuildRoleDeleteEvent(guild_id=Snowflake(1), role_id=Snowflake(2))
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(publisher.serve, path)
+        await nursery.start(subscriber.run, path)
+        await trio.testing.wait_all_tasks_blocked()
+
+        # not listened to, so nothing is registered upstream
+        assert not upstream.wants(gateway_models.TypingStartEvent)
+        await upstream.broadcast(event)
+
+        assert await recv.receive() == event
+        nursery.cancel_scope.cancel()
+
+
+async def test_subscriber_follows_registrations(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / 'bridge.sock')
+    upstream = subs.Substrate()
+    downstream = subs.Substrate()
+
+    publisher = bridge.BridgePublisher(upstream, {'GUILD_ROLE_DELETE', 'TYPING_START'})
+    subscriber = bridge.BridgeSubscriber(downstream)
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(publisher.serve, path)
+        await nursery.start(subscriber.run, path)
+        await trio.testing.wait_all_tasks_blocked()
+        assert not upstream.wants(gateway_models.TypingStartEvent)
+
+        recv = downstream.register(gateway_models.TypingStartEvent, None)
+        await trio.testing.wait_all_tasks_blocked()
+        assert upstream.wants(gateway_models.TypingStartEvent)
+
+        downstream.unregister(gateway_models.TypingStartEvent, recv)
+        await trio.testing.wait_all_tasks_blocked()
+        assert not upstream.wants(gateway_models.TypingStartEvent)
+
+        nursery.cancel_scope.cancel()
+
+
+async def test_publisher_outlives_subscriber(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / 'bridge.sock')
+    upstream = subs.Substrate()
+    downstream = subs.Substrate()
+
+    publisher = bridge.BridgePublisher(upstream, {'GUILD_ROLE_DELETE'})
+    event = gateway_models.GuildRoleDeleteEvent(guild_id=Snowflake(1), role_id=Snowflake(2))
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(publisher.serve, path)
+
+        # a subscriber that stops reading, so the next write to it fails
+        stream = await trio.open_unix_socket(path)
+        await stream.send_all(bridge._frame(bridge._SUBSCRIBE, b'GUILD_ROLE_DELETE'))
+        await trio.testing.wait_all_tasks_blocked()
+        stream.socket.shutdown(socket.SHUT_RD)
+
+        await upstream.broadcast(event)
+        await trio.testing.wait_all_tasks_blocked()
+        assert not upstream._listeners
+
+        subscriber = bridge.BridgeSubscriber(downstream)
+        recv = downstream.register(gateway_models.GuildRoleDeleteEvent, None)
+        await nursery.start(subscriber.run, path)
+        await trio.testing.wait_all_tasks_blocked()
+
+        await upstream.broadcast(event)
+        assert await recv.receive() == event
+
+        await stream.aclose()
+        nursery.cancel_scope.cancel()
+
+
+async def test_stuck_subscriber_does_not_block(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / 'bridge.sock')
+    upstream = subs.Substrate()
+
+    publisher = bridge.BridgePublisher(upstream, {'GUILD_ROLE_DELETE'}, buffer_size=4)
+    event = gateway_models.GuildRoleDeleteEvent(guild_id=Snowflake(1), role_id=Snowflake(2))
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(publisher.serve, path)
+
+        # a subscriber that never reads
+        stream = await trio.open_unix_socket(path)
+        await stream.send_all(bridge._frame(bridge._SUBSCRIBE, b'GUILD_ROLE_DELETE'))
+        await trio.testing.wait_all_tasks_blocked()
+
+        # far more than fits in the socket's buffers
+        with trio.fail_after(5):
+            for _ in range(20_000):
+                await upstream.broadcast(event)
+
+        [stats] = publisher.stats('GUILD_ROLE_DELETE')
+        assert stats.dropped > 0 and stats.buffered == 4
+
+        await stream.aclose()
+        nursery.cancel_scope.cancel()
+
+
+@pytest.mark.parametrize(
+    'frame',
+    [
+        bridge._frame(bridge._SUBSCRIBE, b'\xff\xfe'),
+        bridge._frame(bridge._SUBSCRIBE, b'NOT_AN_EVENT'),
+        bridge._frame(bridge._EVENT, b'GUILD_ROLE_DELETE'),
+        bridge._HEADER.pack(2**20, bridge._SUBSCRIBE),
+    ],
+)
+async def test_bad_frames_only_close_their_connection(
+    tmp_path: pathlib.Path, frame: bytes
+) -> None:
+    path = str(tmp_path / 'bridge.sock')
+    upstream = subs.Substrate()
+    downstream = subs.Substrate()
+
+    publisher = bridge.BridgePublisher(upstream, {'GUILD_ROLE_DELETE'})
+    subscriber = bridge.BridgeSubscriber(downstream)
+    recv = downstream.register(gateway_models.GuildRoleDeleteEvent, None)
+    event = gateway_models.GuildRoleDeleteEvent(guild_id=Snowflake(1), role_id=Snowflake(2))
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(publisher.serve, path)
+        await nursery.start(subscriber.run, path)
+
+        stream = await trio.open_unix_socket(path)
+        await stream.send_all(frame)
+        # hung up on
+        assert await stream.receive_some() == b''
+
+        await upstream.broadcast(event)
+        assert await recv.receive() == event
+
+        await stream.aclose()
+        nursery.cancel_scope.cancel()
+
+
+def test_publisher_checks_tags() -> None:
+    with pytest.raises(ValueError):
+        bridge.BridgePublisher(subs.Substrate(), {'NOT_AN_EVENT'})
@@ -0,0 +1,838 @@
+import json
+import pathlib
+import typing
+
+import trio
+import trio.testing
+
+import bloom.ll.models.gateway as gateway_models
+import bloom.ll.substrate as subs
+from bloom.ll.cache import members, permissions, records, snapshot
+from bloom.ll.cache.backend import BackendWriter
+from bloom.ll.cache.messages import (
+    CachedMessageDelete,
+    CachedMessageDeleteBulk,
+    CachedMessageUpdate,
+    MessageCache,
+    MessageCacheStats,
+)
+from bloom.ll.cache.permissions import PermissionEngine
+from bloom.ll.cache.presences import PresenceCounts, Status
+from bloom.ll.cache.rest import CachedRest, RestCacheStats
+from bloom.ll.cache.search import MemberSearch
+from bloom.ll.cache.sqlite import SQLiteBackend
+from bloom.ll.cache.state import Cache, CacheRestored, Entities
+from bloom.ll.cache.users import UserInterner
+from bloom.ll.models.base import Snowflake
+from bloom.ll.models.guild import GuildMember
+from bloom.ll.models.message import Message
+from bloom.ll.models.permissions import BitwisePermissionFlags, Role
+from bloom.ll.rest.raw import RawRest
+from bloom.ll.shard import RawEvent, gateway_converter
+
+converter = gateway_converter()
+
+T = typing.TypeVar('T')
+
+
+def user(id: int, username: str = 'someone') -> typing.Dict[str, typing.Any]:
+    return {'id': str(id), 'username': username, 'discriminator': '0001', 'avatar': None}
+
+
+def member(
+    id: int, roles: typing.Sequence[int] = (), **kwargs: typing.Any
+) -> typing.Dict[str, typing.Any]:
+    return {
+        'roles': [str(role) for role in roles],
+        'joined_at': '2021-01-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'user': user(id),
+        **kwargs,
+    }
+
+
+def role(id: int, permissions: int = 0, position: int = 0) -> typing.Dict[str, typing.Any]:
+    return {
+        'id': str(id),
+        'name': 'role',
+        'color': 0,
+        'hoist': False,
+        'position': position,
+        'permissions': str(permissions),
+        'managed': False,
+        'mentionable': False,
+    }
+
+
+def guild(id: int, **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+    return {
+        'id': str(id),
+        'name': 'guild',
+        'icon': None,
+        'splash': None,
+        'discovery_splash': None,
+        'owner_id': '1',
+        'afk_channel_id': None,
+        'afk_timeout': 0,
+        'verification_level': 0,
+        'default_message_notifications': 0,
+        'explicit_content_filter': 0,
+        'roles': [role(id)],
+        'emojis': [],
+        'features': [],
+        'mfa_level': 0,
+        'application_id': None,
+        'system_channel_id': None,
+        'system_channel_flags': 0,
+        'rules_channel_id': None,
+        'vanity_url_code': None,
+        'description': None,
+        'banner': None,
+        'premium_tier': 0,
+        'preferred_locale': 'en-US',
+        'public_updates_channel_id': None,
+        'nsfw_level': 0,
+        'premium_progress_bar_enabled': False,
+        **kwargs,
+    }
+
+
+def message(id: int, channel_id: int = 10, **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+    return {
+        'id': str(id),
+        'channel_id': str(channel_id),
+        'author': user(2),
+        'content': f'message {id}',
+        'timestamp': '2021-01-01T00:00:00+00:00',
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+        **kwargs,
+    }
+
+
+def event(typ: typing.Type[T], **data: typing.Any) -> T:
+    return converter.structure(data, typ)
+
+
+def guild_create(id: int = 1, **kwargs: typing.Any) -> gateway_models.GuildCreateEvent:
+    data = guild(
+        id,
+        **{
+            'member_count': 2,
+            'channels': [{'id': '10', 'type': 0, 'name': 'general'}],
+            'members': [member(2), member(3)],
+            'emojis': [{'id': '20', 'name': 'blob'}, {'id': None, 'name': '🙂'}],
+            **kwargs,
+        },
+    )
+    return converter.structure(data, gateway_models.GuildCreateEvent)
+
+
+def test_guild_create_fills_lookups() -> None:
+    cache = Cache()
+    cache.apply(guild_create())
+
+    cached_guild = cache.guild(1)
+    assert cached_guild is not None and cached_guild.owner_id == 1
+
+    channel = cache.channel(10)
+    assert channel is not None and channel.guild_id == 1
+
+    assert cache.role(1) is not None
+    assert cache.emoji(20) is not None and [e.id for e in cache.emojis(1)] == [20]
+    assert cache.member(1, 2) is not None and len(cache.members(1)) == 2
+
+    cache.apply(event(gateway_models.GuildDeleteEvent, id='1'))
+    assert cache.guild(1) is None and cache.channel(10) is None and not cache.members(1)
+
+
+def test_incremental_updates() -> None:
+    cache = Cache()
+    cache.apply(guild_create())
+
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(4)))
+    cache.apply(event(gateway_models.GuildMemberRemoveEvent, guild_id='1', user=user(2)))
+    cache.apply(
+        event(gateway_models.GuildMemberUpdateEvent, guild_id='1', nick='hi', **member(3, [5]))
+    )
+    cache.apply(event(gateway_models.GuildRoleCreateEvent, guild_id='1', role=role(5)))
+    cache.apply(event(gateway_models.ChannelDeleteEvent, id='10', type=0, guild_id='1'))
+
+    assert cache.member(1, 2) is None and cache.member(1, 4) is not None
+
+    updated = cache.member(1, 3)
+    assert updated is not None and (updated.nick, list(updated.roles)) == ('hi', [5])
+    assert type(updated.flags) is int
+    assert cache.user(3) is not None and cache.user(2) is None
+
+    cached_guild = cache.guild(1)
+    assert cached_guild is not None and cached_guild.member_count == 2
+    assert {r.id for r in cache.roles(1)} == {1, 5}
+    assert cache.channel(10) is None and cache.channels(1) == []
+
+
+def test_disabled_entities_are_not_stored() -> None:
+    cache = Cache(entities=Entities.GUILDS | Entities.CHANNELS)
+    cache.apply(guild_create())
+
+    assert cache.guild(1) is not None and cache.channel(10) is not None
+    assert cache.role(1) is None and not cache.members(1)
+    assert gateway_models.GuildMembersChunkEvent not in cache.event_types()
+
+
+async def test_run_follows_substrate() -> None:
+    substrate = subs.Substrate()
+    cache = Cache(entities=Entities.CHANNELS)
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(cache.run, substrate)
+
+        assert not substrate.wants(gateway_models.GuildRoleCreateEvent)
+        await substrate.broadcast(guild_create())
+        await substrate.broadcast(event(gateway_models.ChannelCreateEvent, id='11', type=0))
+        await trio.testing.wait_all_tasks_blocked()
+
+        assert [c.id for c in cache.channels(1)] == [10]
+        assert cache.channel(11) is not None
+        nursery.cancel_scope.cancel()
+
+    assert not substrate.wants(gateway_models.ChannelCreateEvent)
+
+
+def test_recent_members_are_kept() -> None:
+    now = [0.0]
+    cache = Cache(member_policy=members.RecentMembers(max_members=2, ttl=60, clock=lambda: now[0]))
+    cache.apply(guild_create())
+
+    now[0] = 10
+    assert cache.member(1, 2) is not None
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(4)))
+
+    # 3 was the least recently used.
+    assert cache.member(1, 3) is None and cache.user(3) is None
+    assert cache.member_stats == members.MemberCacheStats(hits=1, misses=1, evictions=1)
+
+    now[0] = 65
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(5)))
+    assert [m.user_id for m in cache.members(1)] == [4, 5]
+
+
+def test_members_with_roles() -> None:
+    cache = Cache(member_policy=members.MembersWithRoles())
+    cache.apply(guild_create(members=[member(2, [5]), member(3)]))
+    assert [m.user_id for m in cache.members(1)] == [2]
+
+    cache.apply(event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(2)))
+    assert not cache.members(1) and cache.user(2) is None
+    assert cache.member_stats.evictions == 1
+
+
+def test_voice_members() -> None:
+    cache = Cache(member_policy=members.VoiceMembers())
+    cache.apply(
+        guild_create(voice_states=[{'user_id': '2', 'channel_id': '10', 'session_id': 'a'}])
+    )
+    assert [m.user_id for m in cache.members(1)] == [2]
+
+    state = dict(
+        guild_id='1',
+        session_id='a',
+        request_to_speak_timestamp=None,
+        **dict.fromkeys(
+            ['deaf', 'mute', 'self_deaf', 'self_mute', 'self_video', 'suppress'], False
+        ),
+    )
+    cache.apply(
+        event(
+            gateway_models.VoiceStateUpdateEvent,
+            user_id='3',
+            channel_id='10',
+            member=member(3),
+            **state,
+        )
+    )
+    cache.apply(event(gateway_models.VoiceStateUpdateEvent, user_id='2', channel_id=None, **state))
+    assert [m.user_id for m in cache.members(1)] == [3]
+
+
+def test_member_budget() -> None:
+    budget = members.MemberBudget(max_bytes=1 << 20)
+    cache = Cache(member_policy=budget)
+    cache.apply(guild_create())
+
+    # both members are the same size
+    size = budget.used // 2
+    budget.max_bytes = 2 * size
+
+    assert cache.member(1, 2) is not None
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(4)))
+
+    # 3 was the least recently used.
+    assert [m.user_id for m in cache.members(1)] == [2, 4]
+    assert budget.used == 2 * size and budget.evictions() == []
+    assert cache.member_stats.evictions == 1
+
+    # 2 grows and is touched, so 4 goes to make room.
+    cache.apply(
+        event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(2, nick='nickname'))
+    )
+    assert [m.user_id for m in cache.members(1)] == [2]
+    assert size < budget.used <= budget.max_bytes
+    assert cache.member_stats.evictions == 2
+
+    cache.apply(event(gateway_models.GuildMemberRemoveEvent, guild_id='1', user=user(2)))
+    assert budget.used == 0 and cache.member_stats.evictions == 2
+
+
+def test_no_members() -> None:
+    cache = Cache(member_policy=members.NoMembers())
+    cache.apply(guild_create())
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(4)))
+
+    assert cache.guild(1) is not None
+    assert not cache.members(1) and cache.member(1, 2) is None
+    assert cache.user(2) is None and cache.user(4) is None
+    assert cache.member_stats.evictions == 0
+
+
+async def test_fetch_member_requests_chunk(autojump_clock: object) -> None:
+    requests: typing.List[gateway_models.GuildRequestMembers] = []
+
+    async def request_members(request: gateway_models.GuildRequestMembers) -> None:
+        requests.append(request)
+
+    policy = members.MembersWithRoles(on_miss=members.OnMiss.REQUEST_CHUNK)
+    cache = Cache(member_policy=policy)
+    cache.apply(guild_create())
+    fetched: typing.List[typing.Optional[records.MemberRecord]] = []
+
+    async def fetch(user_id: int) -> None:
+        fetched.append(await cache.fetch_member(1, user_id, request_members=request_members))
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(fetch, 4)
+        await trio.testing.wait_all_tasks_blocked()
+
+        assert len(requests) == 1 and requests[0].user_ids == 4
+        cache.apply(
+            event(
+                gateway_models.GuildMembersChunkEvent,
+                guild_id='1',
+                members=[member(4, [5])],
+                chunk_index=0,
+                chunk_count=1,
+                nonce=requests[0].nonce,
+            )
+        )
+
+    assert fetched[0] is not None and list(fetched[0].roles) == [5]
+    assert cache.member(1, 4) is not None and not cache._chunk_waiters
+
+    # nobody answers this one
+    start = trio.current_time()
+    assert await cache.fetch_member(1, 5, request_members=request_members, timeout=5) is None
+    assert trio.current_time() - start == 5
+    assert len(requests) == 2 and not cache._chunk_waiters
+
+
+async def test_fetch_member_falls_back_to_rest() -> None:
+    requests: typing.List[str] = []
+
+    class FakeRest:
+        converter = gateway_converter()
+
+        async def request(self, req: typing.Any) -> typing.Any:
+            requests.append(req.url)
+            return converter.structure(member(4, [5]), GuildMember)
+
+    cache = Cache(member_policy=members.MembersWithRoles())
+    cache.apply(guild_create())
+
+    fetched = await cache.fetch_member(1, 4, rest=FakeRest())  # type: ignore[arg-type]
+    assert fetched is not None and list(fetched.roles) == [5]
+    assert cache.member(1, 4) is not None and len(requests) == 1
+
+
+def test_users_are_interned() -> None:
+    interner = UserInterner()
+    interning = gateway_converter()
+    interner.install(interning)
+
+    first = interning.structure(message(1), Message)
+    second = interning.structure(message(2), Message)
+    renamed = interning.structure(message(3, author=user(2, 'renamed')), Message)
+
+    assert first.author is second.author and renamed.author.username == 'renamed'
+    assert (interner.hits, interner.misses) == (1, 2)
+
+    cache = Cache(user_interner=interner)
+    cache.apply(guild_create(members=[member(2, user=user(2, 'renamed'))]))
+    assert cache.user(2) is renamed.author
+
+
+def test_message_cache_limits() -> None:
+    cache = MessageCache(per_channel=2, max_messages=3)
+    for id, channel_id in [(1, 10), (2, 10), (3, 10), (4, 11), (5, 12)]:
+        cache.apply(event(gateway_models.MessageCreateEvent, **message(id, channel_id)))
+
+    # 1 fell out of channel 10's ring, then 2 was the oldest overall.
+    assert [m.id for m in cache.channel(10)] == [3] and len(cache) == 3
+    assert cache.get(2) is None and cache.stats.evictions == 2
+
+    # ids are snowflakes: 4 was sent at the discord epoch, the other a minute later.
+    aging = MessageCache(max_age=60, clock=lambda: 1420070400 + 61)
+    aging.apply(event(gateway_models.MessageCreateEvent, **message(4)))
+    aging.apply(event(gateway_models.MessageCreateEvent, **message(5 + (60_000 << 22))))
+    assert [m.id for m in aging.channel(10)] == [5 + (60_000 << 22)]
+
+
+def test_message_cache_keeps_previous_versions() -> None:
+    cache = MessageCache()
+    for id in [1, 2, 3]:
+        cache.apply(event(gateway_models.MessageCreateEvent, **message(id)))
+
+    update = cache.apply(
+        event(gateway_models.MessageUpdateEvent, id='1', channel_id='10', content='edited')
+    )
+    assert isinstance(update, CachedMessageUpdate) and update.before is not None
+    assert update.before.content == 'message 1'
+    assert cache.channel(10)[0].content == 'edited'
+
+    delete = cache.apply(event(gateway_models.MessageDeleteEvent, id='1', channel_id='10'))
+    assert isinstance(delete, CachedMessageDelete) and delete.before is not None
+    assert delete.before.content == 'edited'
+
+    bulk = cache.apply(
+        event(gateway_models.MessageDeleteBulkEvent, ids=['2', '3', '4'], channel_id='10')
+    )
+    assert isinstance(bulk, CachedMessageDeleteBulk) and [m.id for m in bulk.before] == [2, 3]
+    assert cache.stats == MessageCacheStats(hits=4, misses=1, evictions=0)
+    assert not cache.channel(10)
+
+
+def test_permissions() -> None:
+    view, send, manage = (int(BitwisePermissionFlags.VIEW_CHANNEL), 1 << 11, 1 << 13)
+    overwrites = [
+        {'id': '1', 'type': 0, 'allow': '0', 'deny': str(send)},
+        {'id': '5', 'type': 0, 'allow': str(send), 'deny': '0'},
+        {'id': '3', 'type': 1, 'allow': '0', 'deny': str(view)},
+    ]
+    cache = Cache()
+    engine = PermissionEngine(cache)
+    cache.apply(
+        guild_create(
+            roles=[role(1, view | send), role(5, manage)],
+            channels=[{'id': '10', 'type': 0, 'permission_overwrites': overwrites}],
+            members=[member(2, [5]), member(3), member(4)],
+        )
+    )
+
+    assert engine.permissions(10, 1) == permissions.ALL
+    assert engine.permissions(10, 2) == view | send | manage
+    assert engine.permissions(10, 3) == 0
+    assert engine.permissions(10, 4) == view
+
+    cache.apply(event(gateway_models.GuildRoleUpdateEvent, guild_id='1', role=role(5, 1 << 3)))
+    assert engine.permissions(10, 2) == permissions.ALL
+    assert engine.permissions(10, 4) == view
+
+    cache.apply(event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(4, [5])))
+    cache.apply(
+        event(
+            gateway_models.ChannelUpdateEvent,
+            id='10',
+            type=0,
+            guild_id='1',
+            permission_overwrites=[],
+        )
+    )
+    assert engine.permissions(10, 4) == permissions.ALL
+    assert engine.permissions(10, 3) == view | send
+
+    # the engine's own lookups aren't members being used
+    assert cache.member_stats == members.MemberCacheStats()
+
+
+def test_permission_memo_is_bounded() -> None:
+    cache = Cache()
+    engine = PermissionEngine(cache, max_members=2)
+    cache.apply(guild_create(members=[member(2), member(3), member(4)]))
+
+    for user_id in (2, 3, 4):
+        assert engine.guild_permissions(1, user_id) == 0
+    assert engine._memo == {1: {4: {None: 0}}}
+
+    cache.apply(event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(4)))
+    assert engine._memoized == 0
+
+
+def test_snapshot_round_trip(tmp_path: pathlib.Path) -> None:
+    cache = Cache()
+    cache.apply(
+        guild_create(
+            channels=[
+                {
+                    'id': '10',
+                    'type': 0,
+                    'name': 'general',
+                    'permission_overwrites': [
+                        {'id': '1', 'type': 0, 'allow': '1024', 'deny': '2048'}
+                    ],
+                }
+            ],
+            members=[member(2, [5], nick='two'), member(3)],
+        )
+    )
+    cache.apply(event(gateway_models.GuildCreateEvent, **guild(4, members=[member(2)])))
+    snapshot.write(cache, tmp_path / 'cache')
+
+    with snapshot.Snapshot.open(tmp_path / 'cache') as saved:
+        assert saved.member(1, 2) == cache.member(1, 2) and saved.member(1, 4) is None
+        assert [m.user_id for m in saved.members(1)] == [2, 3]
+        assert saved.channel(10) == cache.channel(10) and saved.user(3) == cache.user(3)
+
+        restored = Cache(member_policy=members.MembersWithRoles())
+        search = MemberSearch(restored)
+        notified: typing.List[object] = []
+        restored.listeners.append(notified.append)
+        saved.restore(restored)
+
+    assert restored.guild(4) == cache.guild(4) and restored.role(1) == cache.role(1)
+    assert restored.emojis(1) == cache.emojis(1)
+    assert [m.user_id for m in restored.members(1)] == [2] and not restored.members(4)
+    assert restored.user(2) == cache.user(2) and restored.user(3) is None
+
+    # indexes over the cache hear about what was restored
+    assert notified == [CacheRestored(frozenset({1, 4}))]
+    assert [m.user_id for m in search.search(1, 'some')] == [2]
+
+
+async def test_member_search() -> None:
+    cache = Cache()
+    search = MemberSearch(cache)
+    cache.apply(
+        guild_create(
+            member_count=3,
+            members=[
+                member(2, user=user(2, 'Alice')),
+                member(3, user=user(3, 'bob'), nick='Alan'),
+                member(4, user=user(4, 'carol')),
+            ],
+        )
+    )
+
+    assert [m.user_id for m in search.search(1, 'al', limit=10)] == [3, 2]
+    assert [m.user_id for m in search.search(1, 'AL')] == [3]
+
+    cache.apply(
+        event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(5, user=user(5, 'al')))
+    )
+    cache.apply(event(gateway_models.GuildMemberRemoveEvent, guild_id='1', user=user(3, 'bob')))
+    assert [m.user_id for m in search.search(1, 'al', limit=10)] == [5, 2]
+
+    # every member is cached, so REST isn't needed.
+    assert search.complete(1)
+    found = await search.search_members(1, 'dave', rest=object())  # type: ignore[arg-type]
+    assert found == []
+
+    class FakeRest:
+        converter = gateway_converter()
+
+        async def request(self, req: typing.Any) -> typing.Any:
+            return (converter.structure(member(6, user=user(6, 'dave')), GuildMember),)
+
+    cached_guild = cache.guild(1)
+    assert cached_guild is not None
+    cached_guild.member_count = 10
+    assert not search.complete(1)
+    found = await search.search_members(1, 'dave', rest=FakeRest())  # type: ignore[arg-type]
+    assert [m.user_id for m in found] == [6] and search.search(1, 'dave')
+
+
+async def test_member_search_of_cached_guild() -> None:
+    cache = Cache()
+    cache.apply(guild_create(member_count=2))
+    search = MemberSearch(cache)
+
+    # the guild isn't indexed until it's searched
+    assert not search.complete(1)
+    cache.apply(event(gateway_models.GuildMemberAddEvent, guild_id='1', **member(4)))
+
+    assert [m.user_id for m in search.search(1, 'some', limit=10)] == [2, 3, 4]
+    assert search.complete(1)
+
+
+async def test_member_search_without_members() -> None:
+    cache = Cache(entities=Entities.GUILDS | Entities.CHANNELS)
+    cache.apply(guild_create(member_count=2))
+    search = MemberSearch(cache)
+
+    class FakeRest:
+        converter = gateway_converter()
+
+        async def request(self, req: typing.Any) -> typing.Any:
+            return (converter.structure(member(5, user=user(5, 'dave')), GuildMember),)
+
+    found = await search.search_members(1, 'dave', rest=FakeRest())  # type: ignore[arg-type]
+
+    # found, but not cached
+    assert [m.user_id for m in found] == [5]
+    assert not cache.members(1) and cache.user(5) is None and not search.search(1, 'dave')
+
+
+def test_secondary_indexes() -> None:
+    cache = Cache()
+    cache.apply(
+        guild_create(
+            channels=[
+                {'id': '10', 'type': 4, 'position': 0},
+                {'id': '11', 'type': 0, 'position': 2, 'parent_id': '10'},
+                {'id': '12', 'type': 2, 'position': 1, 'parent_id': '10'},
+            ],
+            members=[member(2, [5]), member(3, [5, 6])],
+            voice_states=[{'user_id': '2', 'channel_id': '12', 'session_id': 'a', 'mute': True}],
+        )
+    )
+
+    assert set(cache.members_with_role(1, 5)) == {2, 3}
+    assert set(cache.members_with_role(1, 1)) == {2, 3}
+    assert [c.id for c in cache.children(10)] == [12, 11]
+    (state,) = cache.voice_states(12)
+    assert state.user_id == 2 and state.flags == records.VoiceFlags.MUTE
+
+    cache.apply(event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(3, [6])))
+    cache.apply(event(gateway_models.GuildMemberRemoveEvent, guild_id='1', user=user(2)))
+    assert not cache.members_with_role(1, 5) and set(cache.members_with_role(1, 6)) == {3}
+
+    cache.apply(
+        event(gateway_models.ChannelUpdateEvent, id='11', type=0, position=0, parent_id='10')
+    )
+    assert [c.id for c in cache.children(10)] == [11, 12]
+
+    voice = dict(
+        guild_id='1',
+        session_id='b',
+        request_to_speak_timestamp=None,
+        **dict.fromkeys(
+            ['deaf', 'mute', 'self_deaf', 'self_mute', 'self_video', 'suppress'], False
+        ),
+    )
+    cache.apply(event(gateway_models.VoiceStateUpdateEvent, user_id='2', channel_id='11', **voice))
+    assert not cache.voice_states(12) and [s.user_id for s in cache.voice_states(11)] == [2]
+
+    cache.apply(event(gateway_models.GuildDeleteEvent, id='1'))
+    assert not cache.children(10) and not cache.voice_states(11)
+    assert not cache.members_with_role(1, 6)
+
+
+async def test_cached_rest() -> None:
+    requests: typing.List[str] = []
+
+    class FakeRest:
+        async def request(self, req: typing.Any) -> typing.Any:
+            requests.append(f'{req.method} {req.url}')
+            return (converter.structure(role(5), Role),)
+
+    now = [0.0]
+    cache = Cache()
+    cache.apply(guild_create(roles=[role(1)]))
+    rest = CachedRest(FakeRest(), cache, clock=lambda: now[0])  # type: ignore[arg-type]
+    raw = RawRest(converter)
+
+    # users and emojis come from the gateway cache.
+    fetched_user = await rest.request(raw.get_user(Snowflake(2)))
+    assert fetched_user is cache.user(2)
+    assert [e.id for e in await rest.request(raw.list_guild_emojis(Snowflake(1)))] == [20]
+
+    for _ in range(2):
+        await rest.request(raw.get_guild_roles(Snowflake(1)))
+    now[0] = 31
+    await rest.request(raw.get_guild_roles(Snowflake(1)))
+    await rest.request(raw.delete_guild_role(Snowflake(1), Snowflake(5)))
+    await rest.request(raw.get_guild_roles(Snowflake(1)))
+
+    assert requests == [
+        'GET /guilds/1/roles',
+        'GET /guilds/1/roles',
+        'DELETE /guilds/1/roles/5',
+        'GET /guilds/1/roles',
+    ]
+    assert rest.stats['/guilds/{guild_id}/roles'] == RestCacheStats(hits=1, misses=3)
+    assert rest.stats['/users/{user_id}'] == RestCacheStats(gateway_hits=1)
+
+
+def test_presence_counts() -> None:
+    counts = PresenceCounts()
+
+    def dispatch(tag: str, data: typing.Dict[str, typing.Any]) -> None:
+        payload = json.dumps({'op': 0, 't': tag, 's': 1, 'd': data})
+        counts.apply(RawEvent(tag, 1, 0, payload))
+
+    def presence(id: int, status: str, *names: str) -> typing.Dict[str, typing.Any]:
+        activities = [{'name': name, 'type': 0, 'created_at': 0} for name in names]
+        return {
+            'user': {'id': str(id)},
+            'guild_id': '1',
+            'status': status,
+            'activities': activities,
+        }
+
+    dispatch(
+        'GUILD_CREATE',
+        {'id': '1', 'presences': [presence(2, 'online', 'game'), presence(3, 'idle', 'game')]},
+    )
+    assert counts.online(1) == 2 and counts.activities(1) == {'game': 2}
+
+    dispatch('PRESENCE_UPDATE', presence(3, 'dnd', 'other'))
+    dispatch('PRESENCE_UPDATE', presence(4, 'online'))
+    dispatch('PRESENCE_UPDATE', presence(2, 'offline'))
+    assert (counts.count(1, Status.ONLINE), counts.count(1, Status.DND)) == (1, 1)
+    assert counts.status(1, 3) is Status.DND and counts.activities(1) == {'other': 1}
+
+    dispatch('GUILD_MEMBER_REMOVE', {'guild_id': '1', 'user': user(3)})
+    assert counts.online(1) == 1 and not counts.activities(1)
+
+    dispatch('GUILD_DELETE', {'id': '1'})
+    assert counts.online(1) == 0
+
+
+def test_threads() -> None:
+    def thread(
+        id: int, parent_id: int = 10, archived: bool = False
+    ) -> typing.Dict[str, typing.Any]:
+        metadata = {
+            'archived': archived,
+            'auto_archive_duration': 60,
+            'archive_timestamp': '2021-01-01T00:00:00+00:00',
+            'locked': False,
+        }
+        return {
+            'id': str(id),
+            'guild_id': '1',
+            'type': 11,
+            'parent_id': str(parent_id),
+            'thread_metadata': metadata,
+        }
+
+    def thread_member(id: int, user_id: int) -> typing.Dict[str, typing.Any]:
+        return {
+            'id': str(id),
+            'user_id': str(user_id),
+            'join_timestamp': '2021-01-01T00:00:00+00:00',
+            'flags': 0,
+        }
+
+    cache = Cache()
+    cache.apply(guild_create(threads=[thread(30), thread(31), thread(32, parent_id=11)]))
+
+    cache.apply(
+        event(
+            gateway_models.ThreadListSyncEvent,
+            guild_id='1',
+            channel_ids=['10'],
+            threads=[thread(31), thread(33)],
+            members=[thread_member(33, 2)],
+        )
+    )
+    assert [t.id for t in cache.active_threads(10)] == [31, 33]
+    assert [t.id for t in cache.active_threads(11)] == [32]
+    assert set(cache.thread_members(33)) == {2}
+
+    cache.apply(
+        event(
+            gateway_models.ThreadMembersUpdateEvent,
+            id='33',
+            guild_id='1',
+            member_count=2,
+            added_members=[thread_member(33, 3)],
+            removed_member_ids=['2'],
+        )
+    )
+    updated = cache.thread(33)
+    assert updated is not None and updated.member_count == 2
+    assert set(cache.thread_members(33)) == {3}
+
+    cache.apply(event(gateway_models.ThreadUpdateEvent, **thread(33, archived=True)))
+    assert cache.thread(33) is None and not cache.thread_members(33)
+    assert [t.id for t in cache.active_threads(10)] == [31]
+
+
+def test_sqlite_backend(tmp_path: pathlib.Path) -> None:
+    cache = Cache()
+    backend = SQLiteBackend(tmp_path / 'cache.db')
+    writer = BackendWriter(cache, backend)
+
+    cache.apply(
+        guild_create(
+            roles=[role(1), role(5)],
+            channels=[
+                {'id': '10', 'type': 4, 'position': 1},
+                {'id': '11', 'type': 0, 'position': 0, 'parent_id': '10'},
+            ],
+            members=[member(2, [5]), member(3)],
+        )
+    )
+    writer.flush()
+
+    # another process
+    reader = SQLiteBackend(tmp_path / 'cache.db')
+    assert reader.guild(1) == cache.guild(1)
+    assert [c.id for c in reader.children(10)] == [11]
+    assert {r.id for r in reader.roles(1)} == {1, 5}
+    assert reader.member(1, 2) == cache.member(1, 2)
+    assert reader.user(2) == cache.user(2)
+
+    cache.apply(event(gateway_models.GuildMemberRemoveEvent, guild_id='1', user=user(2)))
+    cache.apply(event(gateway_models.GuildRoleDeleteEvent, guild_id='1', role_id='5'))
+    cache.apply(event(gateway_models.ChannelDeleteEvent, id='11', type=0, guild_id='1'))
+    assert writer.pending == 4
+    writer.flush()
+
+    assert reader.member(1, 2) is None and reader.user(2) is None
+    assert [m.user_id for m in reader.members(1)] == [3]
+    assert reader.role(5) is None and reader.channels(1) == [cache.channel(10)]
+    cached_guild = reader.guild(1)
+    assert cached_guild is not None and cached_guild.member_count == 1
+
+    cache.apply(event(gateway_models.GuildDeleteEvent, id='1'))
+    writer.flush()
+    assert reader.guild(1) is None and not reader.members(1) and reader.user(3) is None
+
+    reader.close()
+    backend.close()
+
+
+async def test_backend_writer_runs_in_thread(tmp_path: pathlib.Path) -> None:
+    cache = Cache()
+    backend = SQLiteBackend(tmp_path / 'cache.db')
+    writer = BackendWriter(cache, backend, interval=0.01)
+
+    cache.apply(guild_create(members=[member(2, [5])]))
+    changes = writer.changes()
+    detached = changes.detached()
+
+    # the worker thread doesn't share anything the cache changes
+    assert detached.members == changes.members
+    assert detached.members[0][1] is not changes.members[0][1]
+    assert detached.members[0][1].roles is not changes.members[0][1].roles
+
+    async with trio.open_nursery() as nursery:
+        await nursery.start(writer.run)
+        cache.apply(event(gateway_models.GuildMemberUpdateEvent, guild_id='1', **member(2)))
+
+        with trio.fail_after(5):
+            while backend.member(1, 2) is None:
+                await trio.sleep(0.01)
+
+        nursery.cancel_scope.cancel()
+
+    assert backend.member(1, 2) == cache.member(1, 2)
+    backend.close()
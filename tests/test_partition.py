@@ -0,0 +1,39 @@
+import typing
+
+import attr
+import trio
+import trio.testing
+
+import bloom.ll.partition as partition
+import bloom.ll.substrate as subs
+
+
+@attr.frozen()
+class Event:
+    guild_id: int
+    value: int
+
+
+async def test_partitions_keep_order_per_key() -> None:
+    substrate = subs.Substrate()
+    seen: typing.Dict[int, typing.List[int]] = {}
+
+    async def handler(event: Event) -> None:
+        # make workers interleave
+        await trio.sleep(0.1 * (event.guild_id % 2))
+        seen.setdefault(event.guild_id, []).append(event.value)
+
+    partitioned = partition.Partitioned(substrate, Event, handler, key='guild_id', partitions=2)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(partitioned.run)
+        await trio.testing.wait_all_tasks_blocked()
+
+        for i in range(10):
+            await substrate.broadcast(Event(i % 4, i))
+
+        await substrate.aclose()
+
+    assert seen == {0: [0, 4, 8], 1: [1, 5, 9], 2: [2, 6], 3: [3, 7]}
+    assert [stats.handled for stats in partitioned.stats()] == [5, 5]
+    assert [stats.backlog for stats in partitioned.stats()] == [0, 0]
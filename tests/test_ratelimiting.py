@@ -1,12 +1,16 @@
+import io
 import typing
 
 import attr
 import httpx
+import pytest
 import trio
 
-import bloom.ll._compat
 import bloom.ll.ratelimits
 import bloom.ll.rest.models
+import bloom.ll.shard
+
+converter = bloom.ll.shard.gateway_converter()
 
 
 @attr.frozen()
@@ -16,18 +20,23 @@ class Response:
     status_code: int = 200
 
     def raise_for_status(self) -> None:
-        assert 200 <= self.status_code < 300
+        if self.status_code >= 300:
+            raise httpx.HTTPStatusError(
+                str(self.status_code),
+                request=None,  # type: ignore[arg-type]
+                response=None,  # type: ignore[arg-type]
+            )
 
     def json(self) -> typing.Any:
-        return {}
+        return self.json_body
 
 
 @attr.define()
 class Client:
     responses: typing.List[Response]
-    storage: typing.List[
-        typing.Tuple[float, str, str, object, object, object, object, object]
-    ] = attr.Factory(list)
+    storage: typing.List[typing.Tuple[float, str, str, object, object, object, object, object]] = (
+        attr.Factory(list)
+    )
 
     async def request(
         self,
@@ -52,6 +61,10 @@ class Client:
         data: typing.Optional[typing.Dict[str, str]] = None,
         files: typing.Optional[typing.Dict[str, typing.Any]] = None,
     ) -> Response:
+        if files is not None:
+            # read uploads, like httpx
+            files = {name: file.read() for name, file in files.items()}
+
         self.storage.append((trio.current_time(), method, url, params, json, headers, data, files))
 
         return self.responses.pop()
@@ -59,9 +72,9 @@ class Client:
 
 async def test_makes_a_request() -> None:
     client = Client([Response({'a': 'header'}, {})])
-    state = bloom.ratelimits.RatelimitingState(client)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
 
-    req = bloom.rest.models.Request[None](method='GET', route='/blah', args={})
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
 
     await state.request(req)
 
@@ -91,11 +104,11 @@ async def test_ratelimits_once(autojump_clock: object) -> None:
         ]
         * 2
     )
-    state = bloom.ratelimits.RatelimitingState(client)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
 
     start = trio.current_time()
 
-    req = bloom.rest.models.Request[None](method='GET', route='/blah', args={})
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
 
     await state.request(req)
     await state.request(req)
@@ -121,11 +134,11 @@ async def test_ratelimits_twice(autojump_clock: object) -> None:
         ]
         * 3
     )
-    state = bloom.ratelimits.RatelimitingState(client)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
 
     start = trio.current_time()
 
-    req = bloom.rest.models.Request[None](method='GET', route='/blah', args={})
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
 
     await state.request(req)
     await state.request(req)
@@ -167,11 +180,11 @@ async def test_respects_remaining(autojump_clock: object) -> None:
             ),
         ]
     )
-    state = bloom.ratelimits.RatelimitingState(client)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
 
     start = trio.current_time()
 
-    req = bloom.rest.models.Request[None](method='GET', route='/blah', args={})
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
 
     await state.request(req)
     await state.request(req)
@@ -198,11 +211,11 @@ async def test_respects_endless_remaining(autojump_clock: object) -> None:
         ]
         * 10
     )
-    state = bloom.ratelimits.RatelimitingState(client)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
 
     start = trio.current_time()
 
-    req = bloom.rest.models.Request[None](method='GET', route='/blah', args={})
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
 
     await state.request(req)
     await state.request(req)
@@ -211,3 +224,194 @@ async def test_respects_endless_remaining(autojump_clock: object) -> None:
     end = trio.current_time()
 
     assert end < start + reset_in
+
+
+async def test_retries_after_429(autojump_clock: object) -> None:
+    client = Client(
+        [
+            Response({}, None, 204),
+            Response({'X-RateLimit-Scope': 'user'}, {'retry_after': 1.5, 'global': False}, 429),
+        ]
+    )
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
+
+    start = trio.current_time()
+
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
+
+    await state.request(req)
+
+    assert [t - start for t, *_ in client.storage] == [0, 1.5]
+    assert state.stats.by_scope == {'user': 1} and state.stats.retries == 1
+
+
+async def test_global_429_blocks_every_route(autojump_clock: object) -> None:
+    client = Client(
+        [
+            Response({}, None, 204),
+            Response({}, None, 204),
+            Response({'X-RateLimit-Global': 'true'}, {'retry_after': 5, 'global': True}, 429),
+        ]
+    )
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
+
+    start = trio.current_time()
+
+    async def later() -> None:
+        await trio.sleep(1)
+        req = bloom.ll.rest.models.Request[None](method='GET', route='/other', args={})
+        await state.request(req)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(later)
+        req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
+        await state.request(req)
+
+    assert [t - start >= 5 for t, *_ in client.storage] == [False, True, True]
+    assert state.stats.by_scope == {'global': 1}
+
+
+async def test_gives_up_after_max_retries(autojump_clock: object) -> None:
+    client = Client([Response({}, {'retry_after': 1, 'global': False}, 429)] * 3)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter, max_retries=2)
+
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await state.request(req)
+
+    assert len(client.storage) == 3
+    assert (state.stats.retries, state.stats.failures) == (2, 1)
+
+
+async def test_retried_uploads_are_rewound(autojump_clock: object) -> None:
+    client = Client(
+        [Response({}, None, 204), Response({}, {'retry_after': 1, 'global': False}, 429)]
+    )
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
+
+    file = io.BytesIO(b'data')
+    req = bloom.ll.rest.models.Request[None](
+        method='POST', route='/blah', args={}, files={'file': file}
+    )
+
+    await state.request(req)
+
+    assert [files for *_, files in client.storage] == [{'file': b'data'}] * 2
+
+
+async def test_unrewindable_uploads_are_not_retried(autojump_clock: object) -> None:
+    class Stream:
+        def read(self) -> bytes:
+            return b'data'
+
+    client = Client(
+        [Response({}, None, 204), Response({}, {'retry_after': 1, 'global': False}, 429)]
+    )
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter)
+
+    req = bloom.ll.rest.models.Request[None](
+        method='POST', route='/blah', args={}, files={'file': Stream()}
+    )
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await state.request(req)
+
+    assert len(client.storage) == 1 and state.stats.failures == 1
+
+
+async def test_global_limiter_paces_requests(autojump_clock: object) -> None:
+    client = Client([Response({}, None, 204)] * 8)
+    limiter = bloom.ll.ratelimits.GlobalLimiter(rate=2)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter, global_limiter=limiter)
+
+    start = trio.current_time()
+
+    async with trio.open_nursery() as nursery:
+        for i in range(5):
+            req = bloom.ll.rest.models.Request[None](method='GET', route=f'/{i}', args={})
+            nursery.start_soon(state.request, req)
+
+    # interaction responses don't count.
+    for _ in range(3):
+        callback = bloom.ll.rest.models.Request[None](
+            method='POST',
+            route='/interactions/{webhook_id}/{webhook_token}/callback',
+            args={'webhook_id': 1, 'webhook_token': 'a'},
+        )
+        await state.request(callback)
+
+    assert sorted(t - start for t, *_ in client.storage) == [0, 0, 0.5, 1, 1.5, 1.5, 1.5, 1.5]
+
+
+async def test_global_limiter_learns_from_429(autojump_clock: object) -> None:
+    client = Client(
+        [Response({}, None, 204), Response({}, {'retry_after': 1, 'global': True}, 429)]
+        + [Response({}, None, 204)] * 9
+    )
+    limiter = bloom.ll.ratelimits.GlobalLimiter()
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter, global_limiter=limiter)
+
+    for i in range(10):
+        req = bloom.ll.rest.models.Request[None](method='GET', route=f'/{i}', args={})
+        await state.request(req)
+
+    assert limiter.rate == 9
+
+
+async def test_global_limiter_recovers(autojump_clock: object) -> None:
+    client = Client(
+        [Response({}, None, 204)] * 3 + [Response({}, {'retry_after': 1, 'global': True}, 429)]
+    )
+    limiter = bloom.ll.ratelimits.GlobalLimiter(rate=20)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter, global_limiter=limiter)
+
+    req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
+
+    # a 429 from a quiet second (say, from another process using the token)
+    await state.request(req)
+    assert limiter.rate == 1
+
+    await trio.sleep(10 * 60)
+    await state.request(req)
+    assert limiter.rate == 11
+
+    # but not past the configured rate
+    await trio.sleep(3 * 60 * 60)
+    await state.request(req)
+    assert limiter.rate == 20
+
+
+async def test_exempt_routes_skip_the_global_limit(autojump_clock: object) -> None:
+    client = Client(
+        [
+            Response({}, None, 204),
+            Response({}, None, 204),
+            Response({'X-RateLimit-Global': 'true'}, {'retry_after': 5, 'global': True}, 429),
+        ]
+    )
+    limiter = bloom.ll.ratelimits.GlobalLimiter(rate=50)
+    state = bloom.ll.ratelimits.RatelimitingState(client, converter, global_limiter=limiter)
+
+    start = trio.current_time()
+
+    async def later() -> None:
+        await trio.sleep(1)
+        callback = bloom.ll.rest.models.Request[None](
+            method='POST',
+            route='/interactions/{webhook_id}/{webhook_token}/callback',
+            args={'webhook_id': 1, 'webhook_token': 'a'},
+        )
+        await state.request(callback)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(later)
+        req = bloom.ll.rest.models.Request[None](method='GET', route='/blah', args={})
+        await state.request(req)
+
+    # the interaction response didn't wait for the global 429 to pass.
+    assert [(url, t - start) for t, _, url, *_ in client.storage] == [
+        ('/blah', 0),
+        ('/interactions/1/a/callback', 1),
+        ('/blah', 5),
+    ]
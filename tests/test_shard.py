@@ -0,0 +1,103 @@
+import json
+import typing
+
+import attr
+import cattr
+import trio
+
+import bloom.ll.models.gateway as gateway_models
+import bloom.ll.shard as shard
+import bloom.ll.substrate as subs
+from bloom.ll.models.base import Snowflake
+
+
+@attr.define()
+class Websocket:
+    messages: typing.List[str]
+    sent: typing.List[str] = attr.Factory(list)
+
+    async def get_message(self) -> str:
+        return self.messages.pop(0)
+
+    async def send_message(self, message: str) -> None:
+        self.sent.append(message)
+
+
+@attr.define()
+class Converter:
+    # records which models were structured
+    inner: cattr.Converter = attr.Factory(shard.gateway_converter)
+    structured: typing.List[type] = attr.Factory(list)
+
+    def structure(self, obj: object, cl: typing.Type[typing.Any]) -> typing.Any:
+        self.structured.append(cl)
+        return self.inner.structure(obj, cl)
+
+    def unstructure(self, obj: object) -> typing.Any:
+        return self.inner.unstructure(obj)
+
+
+def dispatch(tag: str, seq: int, data: object) -> str:
+    return json.dumps({'op': 0, 't': tag, 's': seq, 'd': data})
+
+
+async def run(substrate: subs.Substrate, *messages: str) -> Converter:
+    # the shard reconnects after the messages, which ends the connection.
+    websocket = Websocket([*messages, json.dumps({'op': 7, 'd': None})])
+    converter = Converter()
+    data = shard._ShardData(converter, substrate, 0)  # type: ignore[arg-type]
+
+    async def after_start() -> None:
+        pass
+
+    async with trio.open_nursery() as nursery:
+        resume = await shard._shared_logic(
+            websocket, data, nursery, {}, after_start  # type: ignore[arg-type]
+        )
+
+    assert resume and data.seq == int(json.loads(messages[-1])['s'])
+    return converter
+
+
+async def test_dispatches() -> None:
+    substrate = subs.Substrate()
+    raw = substrate.register(shard.RawEvent, None)
+    roles = substrate.register(gateway_models.GuildRoleDeleteEvent, None)
+
+    role_delete = dispatch('GUILD_ROLE_DELETE', 1, {'guild_id': '1', 'role_id': '2'})
+    converter = await run(
+        substrate,
+        role_delete,
+        # bloom has no model for this
+        dispatch('NOT_AN_EVENT', 2, {}),
+        # nothing wants this model
+        dispatch('TYPING_START', 3, {}),
+    )
+
+    assert converter.structured == [gateway_models.GuildRoleDeleteEvent]
+    assert await roles.receive() == gateway_models.GuildRoleDeleteEvent(
+        guild_id=Snowflake(1), role_id=Snowflake(2)
+    )
+
+    raw_events = [await raw.receive() for _ in range(3)]
+    assert [(e.tag, e.seq, e.shard_id) for e in raw_events] == [
+        ('GUILD_ROLE_DELETE', 1, 0),
+        ('NOT_AN_EVENT', 2, 0),
+        ('TYPING_START', 3, 0),
+    ]
+    assert raw_events[0].payload == role_delete
+
+
+async def test_unknown_dispatches_without_raw_listeners() -> None:
+    substrate = subs.Substrate()
+    roles = substrate.register(gateway_models.GuildRoleDeleteEvent, None)
+
+    # without raw listeners, dispatches bloom has no model for are just skipped
+    converter = await run(
+        substrate,
+        dispatch('NOT_AN_EVENT', 1, {}),
+        dispatch('GUILD_ROLE_DELETE', 2, {'guild_id': '1', 'role_id': '2'}),
+    )
+
+    assert converter.structured == [gateway_models.GuildRoleDeleteEvent]
+    assert (await roles.receive()).role_id == 2
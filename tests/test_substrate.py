@@ -0,0 +1,317 @@
+import typing
+
+import attr
+import pytest
+import trio
+import trio.testing
+
+import bloom.ll.substrate as subs
+
+
+@attr.frozen()
+class Event:
+    key: int
+    value: int
+
+
+async def test_block_delivers_everything() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(Event, None)
+
+    for i in range(3):
+        await substrate.broadcast(Event(0, i))
+
+    assert [(await recv.receive()).value for _ in range(3)] == [0, 1, 2]
+    assert substrate.stats(Event, recv).delivered == 3
+
+
+async def test_drop_newest() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(Event, 2, overflow=subs.Overflow.DROP_NEWEST)
+
+    for i in range(5):
+        await substrate.broadcast(Event(0, i))
+
+    assert (await recv.receive()).value == 0
+    assert (await recv.receive()).value == 1
+    assert substrate.stats(Event, recv) == subs.ListenerStats(
+        delivered=2, dropped=3, max_buffered=2
+    )
+
+
+async def test_blocking_is_reported(autojump_clock: object) -> None:
+    slow = []
+    substrate = subs.Substrate(
+        slow_listener_threshold=1, on_slow_listener=lambda *args: slow.append(args)
+    )
+    recv = substrate.register(Event, 1)
+
+    async def receive_later() -> None:
+        await trio.sleep(3)
+        await recv.receive()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(receive_later)
+        await substrate.broadcast(Event(0, 0))
+        await substrate.broadcast(Event(0, 1))
+
+    assert slow == [(Event, recv)]
+
+    stats = substrate.stats(Event, recv)
+    assert (stats.buffered, stats.max_buffered, stats.delivered) == (1, 1, 2)
+    assert stats.blocked_for == 3
+
+
+async def test_drop_oldest() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(Event, 2, overflow=subs.Overflow.DROP_OLDEST)
+
+    for i in range(5):
+        await substrate.broadcast(Event(0, i))
+
+    assert (await recv.receive()).value == 3
+    assert (await recv.receive()).value == 4
+    assert substrate.stats(Event, recv).dropped == 3
+
+
+async def test_coalesce() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(
+        Event, 10, overflow=subs.Overflow.COALESCE, key=lambda event: event.key
+    )
+
+    await substrate.broadcast(Event(1, 0))
+    await substrate.broadcast(Event(2, 0))
+    await substrate.broadcast(Event(1, 1))
+
+    assert await recv.receive() == Event(1, 1)
+    assert await recv.receive() == Event(2, 0)
+    assert substrate.stats(Event, recv).dropped == 1
+
+
+async def test_coalesce_needs_key() -> None:
+    substrate = subs.Substrate()
+
+    with pytest.raises(ValueError):
+        substrate.register(Event, 10, overflow=subs.Overflow.COALESCE)
+
+
+async def test_ring_needs_room() -> None:
+    substrate = subs.Substrate()
+
+    with pytest.raises(ValueError):
+        substrate.register(Event, 0, overflow=subs.Overflow.DROP_OLDEST)
+    with pytest.raises(ValueError):
+        substrate.register(Event, 0, overflow=subs.Overflow.COALESCE, key=lambda event: event.key)
+    with pytest.raises(ValueError):
+        substrate.register_batched(Event, 0, max_batch=1, max_linger=1)
+
+    # nothing was half-registered
+    assert not substrate._listeners
+    await substrate.broadcast(Event(0, 0))
+
+    recv = substrate.register(Event, 0, overflow=subs.Overflow.DROP_NEWEST)
+    await substrate.broadcast(Event(0, 1))
+    assert substrate.stats(Event, recv).dropped == 1
+
+
+async def test_slow_lossy_listener_does_not_block(autojump_clock: object) -> None:
+    substrate = subs.Substrate()
+    substrate.register(Event, 1, overflow=subs.Overflow.DROP_OLDEST)
+
+    with trio.fail_after(1):
+        for i in range(100):
+            await substrate.broadcast(Event(0, i))
+
+
+async def test_ring_channel_ends_on_close() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(Event, 1, overflow=subs.Overflow.DROP_OLDEST)
+
+    await substrate.broadcast(Event(0, 0))
+    await substrate.aclose()
+
+    assert [event async for event in recv] == [Event(0, 0)]
+
+
+async def test_where_filters() -> None:
+    substrate = subs.Substrate()
+    one = substrate.register(Event, None, where={'key': 1})
+    one_and_two = substrate.register(Event, None, where={'key': 1, 'value': 2})
+    everything = substrate.register(Event, None)
+
+    await substrate.broadcast(Event(1, 1))
+    await substrate.broadcast(Event(2, 2))
+    await substrate.broadcast(Event(1, 2))
+
+    assert substrate.stats(Event, one).delivered == 2
+    assert substrate.stats(Event, one_and_two).delivered == 1
+    assert substrate.stats(Event, everything).delivered == 3
+    assert await one_and_two.receive() == Event(1, 2)
+
+
+async def test_where_unregister() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register(Event, None, where={'key': 1})
+    substrate.unregister(Event, recv)
+
+    await substrate.broadcast(Event(1, 1))
+
+    assert not substrate._indexed
+    assert not substrate._indexed_fields[Event]
+
+
+async def test_wait_for() -> None:
+    substrate = subs.Substrate()
+
+    async def waiter() -> None:
+        event = await substrate.wait_for(Event, lambda e: e.value > 1, where={'key': 1})
+        assert event == Event(1, 2)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(waiter)
+        await trio.testing.wait_all_tasks_blocked()
+        await substrate.broadcast(Event(2, 2))
+        await substrate.broadcast(Event(1, 1))
+        await substrate.broadcast(Event(1, 2))
+
+    assert not substrate._listeners
+    assert not substrate._indexed
+
+
+async def test_wait_for_timeout(autojump_clock: object) -> None:
+    substrate = subs.Substrate()
+
+    with pytest.raises(trio.TooSlowError):
+        await substrate.wait_for(Event, timeout=5)
+
+    assert not substrate._listeners
+
+
+async def test_group_round_robin() -> None:
+    substrate = subs.Substrate()
+    group = substrate.group(Event)
+    one = group.join(None)
+    two = group.join(None)
+
+    for i in range(4):
+        await substrate.broadcast(Event(0, i))
+
+    assert {(await one.receive()).value, (await one.receive()).value} in ({0, 2}, {1, 3})
+    assert two.statistics().current_buffer_used == 2  # type: ignore[attr-defined]
+    assert group.stats().delivered == 4
+
+
+async def test_group_least_loaded() -> None:
+    substrate = subs.Substrate()
+    group = substrate.group(Event, balance=subs.Balance.LEAST_LOADED)
+    busy = group.join(None)
+
+    await substrate.broadcast(Event(0, 0))
+    idle = group.join(None)
+
+    for _ in range(3):
+        await substrate.broadcast(Event(0, 1))
+        assert idle.receive_nowait() == Event(0, 1)  # type: ignore[attr-defined]
+
+    assert busy.statistics().current_buffer_used == 1  # type: ignore[attr-defined]
+
+
+async def test_empty_group_is_unregistered() -> None:
+    substrate = subs.Substrate()
+    group = substrate.group(Event)
+    recv = group.join(None)
+    group.leave(recv)
+
+    await substrate.broadcast(Event(0, 0))
+
+    assert not substrate._listeners
+
+
+async def test_batched_fills_up() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register_batched(Event, None, max_batch=3, max_linger=1)
+
+    for i in range(5):
+        await substrate.broadcast(Event(0, i))
+
+    assert [event.value for event in await recv.receive()] == [0, 1, 2]
+
+
+async def test_batched_lingers(autojump_clock: object) -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register_batched(Event, None, max_batch=3, max_linger=1)
+
+    await substrate.broadcast(Event(0, 0))
+    start = trio.current_time()
+
+    assert await recv.receive() == [Event(0, 0)]
+    assert trio.current_time() - start == 1
+
+    substrate.unregister(Event, recv)
+    assert not substrate._listeners
+
+
+@attr.frozen()
+class SubEvent(Event):
+    pass
+
+
+async def test_wants() -> None:
+    substrate = subs.Substrate()
+    assert not substrate.wants(Event)
+
+    recv = substrate.register(Event, None, where={'key': 1})
+    assert substrate.wants(SubEvent)
+
+    substrate.unregister(Event, recv)
+    assert not substrate.wants(SubEvent)
+
+
+async def test_watchers_see_first_and_last_listeners() -> None:
+    substrate = subs.Substrate()
+    watched: typing.List[typing.Tuple[typing.Type[typing.Any], bool]] = []
+    substrate.watchers.append(lambda typ: watched.append((typ, substrate.wants(typ))))
+
+    first = substrate.register(Event, None)
+    second = substrate.register(Event, None)
+    substrate.unregister(Event, first)
+    substrate.unregister(Event, second)
+
+    assert watched == [(Event, True), (Event, False)]
+
+
+async def test_dispatch_follows_register_and_unregister() -> None:
+    substrate = subs.Substrate()
+    sub_recv = substrate.register(SubEvent, None)
+    recv = substrate.register(Event, None)
+
+    await substrate.broadcast(SubEvent(0, 0))
+    substrate.unregister(Event, recv)
+    await substrate.broadcast(SubEvent(0, 1))
+
+    recv = substrate.register(Event, None)
+    await substrate.broadcast(SubEvent(0, 2))
+
+    assert [(await sub_recv.receive()).value for _ in range(3)] == [0, 1, 2]
+    assert (await recv.receive()).value == 2
+    assert substrate.stats(Event, recv).delivered == 1
+
+
+@attr.frozen()
+class OtherEvent:
+    value: int
+
+
+async def test_register_many_keeps_order() -> None:
+    substrate = subs.Substrate()
+    recv = substrate.register_many([Event, OtherEvent], None)
+
+    await substrate.broadcast(Event(0, 0))
+    await substrate.broadcast(OtherEvent(1))
+    await substrate.broadcast(SubEvent(0, 2))
+
+    assert [(await recv.receive()).value for _ in range(3)] == [0, 1, 2]
+
+    substrate.unregister_many([Event, OtherEvent], recv)
+    assert not substrate.wants(OtherEvent)